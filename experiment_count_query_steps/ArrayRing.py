@@ -0,0 +1,682 @@
+import constants as c
+import numpy as np
+import random
+
+from IDSpace import IDSpace
+from KeyDistribution import ownership_counts
+from Log import LOG
+from Membership import MembershipIndex
+from Messages import *
+from Metrics import MetricsRegistry
+from Node import PERIODIC_OPS, DEFAULT_PERIODS, NO_ID
+from Router import Router
+from Stats import StreamingStats
+
+class ArrayRing:
+    '''
+    Struct-of-arrays version of ChordRing, for rings too big to keep one Python object per
+    Node. Every Node gets a slot, and all of its state lives in NumPy arrays indexed by that
+    slot. Periodic operations that come due on the same tick, and every lookup in flight,
+    are processed together as batched array operations.
+    It has the same public surface as ChordRing (add_node, remove_node_failure,
+    remove_node_graceful, add_item, query_item, advance, run_until, run_until_idle,
+    check_correctness, save, load), so drivers can switch engines with a flag.
+
+    The protocol is the same as in Node.py, but the timing is coarser: each hop of a lookup
+    takes one tick, stabilize updates the successor's predecessor right away instead of a tick
+    later, and fix_finger looks the finger up in one go. A converged ring ends up in the same
+    state and its lookups take the same hops, but rings that are still stabilizing can
+    take a different number of ticks to converge.
+    IDs are kept as int64, so ring_size can be at most 62 (one bit is left over so that
+    adding a finger offset never overflows). It contains the following:
+        space:        IDSpace of the ring.
+        finger_offsets: space.finger_offsets as an array.
+        IDs:          IDs[s] is the ID of the Node in slot s. Slots are never reused.
+        pred:         pred[s] is the ID of its predecessor, or NO_ID.
+        fingers:      N x ring_size matrix. fingers[s, i] is finger table entry i, or NO_ID.
+        succ_list:    N x (r-1) matrix of successor lists, NO_ID where unknown.
+        alive:        Whether the Node in the slot is still on the ring.
+        joined:       Whether the Node has found its successor (see ChordNode.joined).
+        offsets:      The random counter offset of each Node.
+        next_finger:  Next finger table entry each Node fixes.
+        num_slots:    Number of slots used so far. The arrays grow by doubling.
+        slot_of:      Maps the IDs of the Nodes on the ring to their slots.
+        membership:   MembershipIndex of the IDs on the ring.
+        sorted_IDs, sorted_slots: The IDs on the ring in sorted order, and their slots. Used to
+            map arrays of IDs to slots. Rebuilt on demand after the membership changes.
+        due:          due[op] maps t % period to the slots whose op comes due on those ticks.
+        item_index:   Maps item keys to their position in item_key, item_value and item_owner.
+        item_key:     Key of each item.
+        item_owner:   ID of the Node storing each item, or NO_ID if it was lost in a failure.
+        item_keys:    Set of every key ever added, like ChordRing.item_keys.
+        lookups:      Lookups in flight, as parallel arrays: key, at (ID of the Node that has
+            it), steps, and dest (the slot of the joining Node it is for, or NO_ID for a client).
+        item_key, item_owner and the lookups are views of the first num_items and
+        num_lookups entries of buffers (item_buf and lookup_buf) that grow by doubling, so
+        adding items or starting lookups one at a time does not copy everything each time.
+        joining:      Slots of Nodes that have not found their successor yet.
+        step_tracker: StreamingStats of the hop counts of successful client lookups.
+        metrics:      MetricsRegistry with the RPCs ChordRing would have sent for the same
+            work, counted a batch at a time. There are no mailboxes, so no high-water marks.
+        time:         Number of ticks the ring has been advanced by.
+    '''
+    def __init__(self, capacity=16, ring_size=None):
+        self.space = IDSpace(ring_size)
+        if self.space.m > 62:
+            raise ValueError('ArrayRing keeps IDs as int64, so ring_size {} is too wide'.format(self.space.m))
+        self.finger_offsets = np.array(self.space.finger_offsets, dtype=np.int64)
+        m = self.space.m
+        r = c.successor_list_size - 1
+        self.IDs         = np.full(capacity, NO_ID, dtype=np.int64)
+        self.pred        = np.full(capacity, NO_ID, dtype=np.int64)
+        self.fingers     = np.full((capacity, m), NO_ID, dtype=np.int64)
+        self.succ_list   = np.full((capacity, r), NO_ID, dtype=np.int64)
+        self.alive       = np.zeros(capacity, dtype=bool)
+        self.joined      = np.zeros(capacity, dtype=bool)
+        self.offsets     = np.zeros(capacity, dtype=np.int64)
+        self.next_finger = np.zeros(capacity, dtype=np.int64)
+        self.num_slots   = 0
+        self.slot_of     = {}
+        self.membership  = MembershipIndex()
+        self.sorted_IDs   = None
+        self.sorted_slots = None
+        self.periods     = DEFAULT_PERIODS
+        self.due         = [{} for op in PERIODIC_OPS]
+        self.item_index  = {}
+        self.item_buf    = {'key': np.zeros(capacity, dtype=np.int64), 'owner': np.zeros(capacity, dtype=np.int64)}
+        self.num_items   = 0
+        self.item_value  = []
+        self.item_keys   = set()
+        self.lookup_buf  = {name: np.zeros(capacity, dtype=np.int64) for name in ('key', 'at', 'steps', 'dest')}
+        self.num_lookups = 0
+        self.joining      = set()
+        self.step_tracker = StreamingStats()
+        self.metrics      = MetricsRegistry(self.space, {})
+        self.time         = 0
+
+    @property
+    def num_node(self):
+        return len(self.membership)
+
+    @property
+    def item_key(self):
+        return self.item_buf['key'][:self.num_items]
+
+    @property
+    def item_owner(self):
+        return self.item_buf['owner'][:self.num_items]
+
+    @property
+    def lookups(self):
+        return {name: buf[:self.num_lookups] for name, buf in self.lookup_buf.items()}
+
+    '''
+    Makes sure buffers, a dictionary of equally long arrays, can hold needed entries,
+    doubling their length as often as it takes. Returns the (possibly new) buffers.
+    '''
+    def reserve(self, buffers, used, needed):
+        capacity = len(next(iter(buffers.values())))
+        if needed <= capacity:
+            return buffers
+        while capacity < needed:
+            capacity *= 2
+        grown = {}
+        for name, old in buffers.items():
+            grown[name] = np.zeros(capacity, dtype=old.dtype)
+            grown[name][:used] = old[:used]
+        return grown
+
+    '''
+    Appends new items, whose keys are not stored yet, to the item arrays.
+    '''
+    def append_items(self, keys, owners, values):
+        start = self.num_items
+        end   = start + len(keys)
+        self.item_buf = self.reserve(self.item_buf, start, end)
+        self.item_buf['key'][start:end]   = keys
+        self.item_buf['owner'][start:end] = owners
+        self.item_index.update(zip(np.asarray(keys).tolist(), range(start, end)))
+        self.item_value.extend(values)
+        self.num_items = end
+
+    @property
+    def nodeList(self):
+        return list(self.membership)
+
+    def unused_ID(self):
+        return self.space.unused_ID(self.membership)
+
+    '''
+    Makes room for at least one more slot.
+    '''
+    def grow(self):
+        capacity = len(self.IDs)
+        if self.num_slots < capacity:
+            return
+        fill = {'IDs': NO_ID, 'pred': NO_ID, 'fingers': NO_ID, 'succ_list': NO_ID,
+                'alive': False, 'joined': False, 'offsets': 0, 'next_finger': 0}
+        for name, value in fill.items():
+            old = getattr(self, name)
+            new = np.full((2 * capacity,) + old.shape[1:], value, dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+
+    '''
+    Maps an array of IDs to their slots. IDs that are not on the ring map to NO_ID.
+    '''
+    def slots_for(self, IDs):
+        if self.sorted_IDs is None:
+            self.sorted_IDs   = np.array(list(self.membership), dtype=np.int64)
+            self.sorted_slots = np.array([self.slot_of[ID] for ID in self.sorted_IDs.tolist()], dtype=np.int64)
+        if len(self.sorted_IDs) == 0:
+            return np.full(len(IDs), NO_ID, dtype=np.int64)
+        ind   = np.minimum(np.searchsorted(self.sorted_IDs, IDs), len(self.sorted_IDs) - 1)
+        found = self.sorted_IDs[ind] == IDs
+        return np.where(found, self.sorted_slots[ind], NO_ID)
+
+    def is_alive(self, IDs):
+        return self.slots_for(IDs) != NO_ID
+
+    '''
+    Adds a node into the Ring, if there isn't already a node with the same values.
+    The first Node creates the ring, and every other one starts a join lookup from a
+    random Node, as in ChordRing.add_node.
+    '''
+    def add_node(self, ID):
+        LOG.info('Adding node: {}', ID)
+        LOG.event('node_added', ID=ID, time=self.time)
+        if ID in self.slot_of:
+            LOG.warning('Node already exists on the Chord ring. Exiting operation.')
+            return
+        self.grow()
+        slot = self.num_slots
+        self.num_slots += 1
+        self.IDs[slot]     = ID
+        self.alive[slot]   = True
+        self.offsets[slot] = random.randint(0, c.max_offset)
+        if len(self.membership) == 0:
+            self.fingers[slot, 0] = ID
+            self.metrics.count(CREATE, 1)
+        else:
+            self.joining.add(slot)
+            self.metrics.count(JOIN, 1)
+            self.start_lookups([ID], [self.membership.random_member()], [0], [slot])
+        self.slot_of[ID] = slot
+        self.membership.add(ID)
+        self.sorted_IDs = None
+        for op, period in enumerate(self.periods):
+            residue = (self.time - self.offsets[slot]) % period
+            self.due[op].setdefault(int(residue), []).append(slot)
+
+    '''
+    Remove a node from the Ring. Because we are assuming spontaneous failure, the
+    items it stored and the lookups it was working on are lost.
+    '''
+    def remove_node_failure(self, ID):
+        LOG.info('Removing node by failure: {}', ID)
+        LOG.event('node_removed', ID=ID, graceful=False, time=self.time)
+        self.drop_node(ID)
+        self.item_owner[self.item_owner == ID] = NO_ID
+
+    '''
+    Remove a node from the Ring. Same as above, but this time we fail gracefully.
+    This means that the items it stores are first transfered to the successor.
+    '''
+    def remove_node_graceful(self, ID):
+        LOG.info('Removing node gracefully: {}', ID)
+        LOG.event('node_removed', ID=ID, graceful=True, time=self.time)
+        succ_ID = self.first_alive_succ(np.array([self.slot_of[ID]]))[0]
+        self.drop_node(ID)
+        self.metrics.count(STORE_ITEMS, 1, int(np.count_nonzero(self.item_owner == ID)))
+        self.item_owner[self.item_owner == ID] = succ_ID
+
+    def drop_node(self, ID):
+        slot = self.slot_of.pop(ID)
+        self.alive[slot] = False
+        self.joining.discard(slot)
+        self.membership.remove(ID)
+        self.sorted_IDs = None
+        self.keep_lookups(self.lookups['at'] != ID)
+
+    '''
+    Add item to the Chord ring. Just like ChordRing.add_item, it goes straight to the
+    Node responsible for it.
+    '''
+    def add_item(self, item):
+        if len(self.membership) == 0:
+            raise ValueError('Cannot add items to a ring without Nodes')
+        k, v = item
+        self.item_keys.add(k)
+        owner = self.membership.owner_of(k)
+        if k in self.item_index:
+            ind = self.item_index[k]
+            self.item_value[ind] = v
+            self.item_owner[ind] = owner
+            return
+        self.append_items([k], [owner], [v])
+
+    '''
+    Adds many items at once, like ChordRing.add_items: items is an iterable of (key, value)
+    pairs or a two column array. Owners come from one searchsorted over the sorted IDs, and
+    new items are appended to the item arrays in one go. As with ChordRing, adding items to
+    a ring without Nodes raises a ValueError.
+    '''
+    def add_items(self, items):
+        if isinstance(items, np.ndarray):
+            pairs = zip(items[:, 0].tolist(), items[:, 1].tolist())
+        else:
+            pairs = items
+        # a key given twice keeps its last value, as with repeated add_item calls
+        latest = dict(pairs)
+        if not latest:
+            return
+        if len(self.membership) == 0:
+            raise ValueError('Cannot add items to a ring without Nodes')
+        self.item_keys.update(latest)
+        keys       = np.fromiter(latest, dtype=np.int64, count=len(latest))
+        values     = list(latest.values())
+        sorted_IDs = np.array(list(self.membership), dtype=np.int64)
+        owners     = sorted_IDs[np.searchsorted(sorted_IDs, keys) % len(sorted_IDs)]
+
+        index = self.item_index
+        known = np.fromiter((k in index for k in latest), dtype=bool, count=len(latest))
+        for i in np.flatnonzero(known).tolist():
+            ind = index[int(keys[i])]
+            self.item_value[ind] = values[i]
+            self.item_owner[ind] = owners[i]
+        fresh = np.flatnonzero(~known)
+        if len(fresh) == 0:
+            return
+        self.append_items(keys[fresh], owners[fresh], [values[i] for i in fresh.tolist()])
+
+    '''
+    Starts a client lookup for item_key at a random Node.
+    '''
+    def query_item(self, item_key):
+        LOG.debug('Querying for {}', item_key)
+        query_ID = self.membership.random_member()
+        if LOG.sink is not None:
+            LOG.event('query', key=item_key, node=query_ID, time=self.time)
+        self.start_lookups([item_key], [query_ID], [0], [NO_ID])
+
+    '''
+    Routes a lookup for each of keys over the current tables without advancing the ring,
+    as in ChordRing.route_lookups.
+    '''
+    def route_lookups(self, keys, sources=None, max_hops=None):
+        slots = np.flatnonzero(self.alive[:self.num_slots])
+        return Router(self.space, self.IDs[slots], self.fingers[slots], self.succ_list[slots]).route(keys, sources, max_hops)
+
+    def start_lookups(self, keys, at, steps, dest):
+        self.metrics.count(FIND_SUCCESSOR, len(keys))
+        new   = {'key': keys, 'at': at, 'steps': steps, 'dest': dest}
+        start = self.num_lookups
+        end   = start + len(keys)
+        self.lookup_buf = self.reserve(self.lookup_buf, start, end)
+        for name, buf in self.lookup_buf.items():
+            buf[start:end] = new[name]
+        self.num_lookups = end
+
+    def keep_lookups(self, mask):
+        kept = 0
+        for name, buf in self.lookup_buf.items():
+            keep = buf[:self.num_lookups][mask]
+            kept = len(keep)
+            buf[:kept] = keep
+        self.num_lookups = kept
+
+    '''
+    For each slot, the first of its successor and successor list that is still on the
+    ring. Like ChordNode.find_first_alive_succ, it is an error for none of them to be.
+    '''
+    def first_alive_succ(self, slots):
+        cands = np.concatenate([self.fingers[slots, :1], self.succ_list[slots]], axis=1)
+        alive = self.is_alive(cands.ravel()).reshape(cands.shape)
+        if not alive.any(axis=1).all():
+            raise IndexError('Node {} has no successor left alive'.format(
+                self.IDs[slots[~alive.any(axis=1)][0]]))
+        return cands[np.arange(len(slots)), alive.argmax(axis=1)]
+
+    '''
+    One find_successor hop for each of the given lookups, as in ChordNode.find_successor.
+    Returns (done, succ, next_IDs): done marks the lookups that found the successor, which
+    is then in succ, and next_IDs is the Node the others go to next, or NO_ID if there is
+    no live finger to send them to (in which case they are dropped).
+    '''
+    def hop(self, at, keys):
+        slots = self.slots_for(at)
+        succ  = self.first_alive_succ(slots)
+        done  = between(at, succ, keys)
+        # Closest preceding finger: the last entry that is alive and strictly between.
+        fingers = self.fingers[slots]
+        valid   = (fingers != NO_ID) & self.is_alive(fingers.ravel()).reshape(fingers.shape) \
+                  & between_exclusive(at[:, None], keys[:, None], fingers)
+        last     = fingers.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+        next_IDs = np.where(valid.any(axis=1), fingers[np.arange(len(slots)), last], NO_ID)
+        return done, succ, next_IDs
+
+    '''
+    Advances every lookup in flight by one hop, and hands out the answers of those that
+    are done, either to the client or to the joining Node.
+    '''
+    def hop_lookups(self):
+        lookups = self.lookups
+        if len(lookups['key']) == 0:
+            return
+        lookups['steps'] += 1
+        done, succ, next_IDs = self.hop(lookups['at'], lookups['key'])
+        for key, succ_ID, steps, dest in zip(lookups['key'][done].tolist(), succ[done].tolist(),
+                                             lookups['steps'][done].tolist(), lookups['dest'][done].tolist()):
+            if dest == NO_ID:
+                ind = self.item_index.get(key)
+                success = ind is not None and self.item_owner[ind] == succ_ID
+                if LOG.sink is not None:
+                    LOG.event('lookup', key=key, node=succ_ID, steps=steps, success=bool(success))
+                if success:
+                    LOG.debug('Successfully found key {} at Node {} in {} steps!', key, succ_ID, steps)
+                    self.step_tracker.add(steps)
+                else:
+                    LOG.warning('Incorrect Node {} located for key {} in {} steps.', succ_ID, key, steps)
+            elif self.alive[dest] and self.fingers[dest, 0] == NO_ID:
+                self.finish_join(dest, succ_ID)
+        lookups['at'][:] = next_IDs
+        forward = ~done & (next_IDs != NO_ID)
+        clients = np.count_nonzero(done & (lookups['dest'] == NO_ID))
+        self.metrics.count(FOUND_KEY, clients)
+        self.metrics.count(SET_FINGER, np.count_nonzero(done) - clients)
+        self.metrics.count(FIND_SUCCESSOR, np.count_nonzero(forward))
+        self.keep_lookups(forward)
+
+    '''
+    The joining Node in slot learned its successor. Like ChordNode.request_items, it then
+    takes over the successor's items that are no longer between the two of them.
+    '''
+    def finish_join(self, slot, succ_ID):
+        ID = self.IDs[slot]
+        self.fingers[slot, 0] = succ_ID
+        self.joined[slot]     = True
+        self.joining.discard(slot)
+        if succ_ID == ID:
+            return
+        moved = (self.item_owner == succ_ID) & ~between(ID, succ_ID, self.item_key)
+        self.item_owner[moved] = ID
+        self.metrics.count(SEND_ITEMS, 1)
+        self.metrics.count(STORE_ITEMS, 1, int(np.count_nonzero(moved)))
+
+    '''
+    Runs stabilize for every slot at once, as in ChordNode.stabilize, then notifies
+    the successors.
+    '''
+    def stabilize(self, slots):
+        IDs  = self.IDs[slots]
+        succ = self.first_alive_succ(slots)
+        succ_pred = self.pred[self.slots_for(succ)]
+        closer    = (succ_pred != NO_ID) & self.is_alive(succ_pred) & between(IDs, succ, succ_pred)
+        succ      = np.where(closer, succ_pred, succ)
+        self.fingers[slots, 0] = succ
+        succ_slots = self.slots_for(succ)
+        self.succ_list[slots] = np.concatenate(
+            [self.fingers[succ_slots, :1], self.succ_list[succ_slots, :-1]], axis=1)
+        self.metrics.count(NOTIFY, len(slots))
+        self.notify(succ_slots, IDs)
+
+    '''
+    Delivers notify(pot_pred_ID) to every target slot at once, as in ChordNode.notify.
+    When several Nodes notify the same target, the one closest before it wins, which is
+    what applying them one by one ends up with. The first Node on the ring, which has
+    itself as its successor, takes the first accepted notify in targets' order as its
+    successor, again as if they had been applied one by one.
+    '''
+    def notify(self, targets, pot_pred_IDs):
+        pred    = self.pred[targets]
+        IDs     = self.IDs[targets]
+        accept  = (pred == NO_ID) | between(pred, IDs, pot_pred_IDs)
+        # Only the first Node on the ring has itself as its successor.
+        first_node = accept & (self.fingers[targets, 0] == IDs)
+        if first_node.any():
+            first_targets, first = np.unique(targets[first_node], return_index=True)
+            self.fingers[first_targets, 0] = pot_pred_IDs[first_node][first]
+            self.joined[first_targets]     = True
+        targets, pot_pred_IDs, IDs = targets[accept], pot_pred_IDs[accept], IDs[accept]
+        # Distance back from the target, with the target itself counting as furthest away.
+        dist   = (IDs - pot_pred_IDs - 1) & self.space.mask
+        order  = np.lexsort((dist, targets))
+        targets, first = np.unique(targets[order], return_index=True)
+        self.pred[targets] = pot_pred_IDs[order][first]
+
+    '''
+    Runs fix_finger for every slot at once, routing all of the lookups together.
+    '''
+    def fix_finger(self, slots):
+        i    = self.next_finger[slots]
+        at   = self.IDs[slots]
+        keys = (at + self.finger_offsets[i]) & self.space.mask
+        self.next_finger[slots] = (i + 1) % self.space.m
+        found = self.route(at, keys)
+        ok    = found != NO_ID
+        self.fingers[slots[ok], i[ok]] = found[ok]
+
+    '''
+    Follows the lookups all the way to the successor of each key. Returns the successors,
+    or NO_ID for the lookups that got dropped on the way.
+    '''
+    def route(self, at, keys):
+        found  = np.full(len(keys), NO_ID, dtype=np.int64)
+        active = np.arange(len(keys))
+        for i in range(len(self.membership) + 1):
+            if len(active) == 0:
+                break
+            done, succ, next_IDs = self.hop(at, keys)
+            found[active[done]] = succ[done]
+            keep   = ~done & (next_IDs != NO_ID)
+            self.metrics.count(SET_FINGER, np.count_nonzero(done))
+            self.metrics.count(FIND_SUCCESSOR, np.count_nonzero(keep))
+            active = active[keep]
+            at, keys = next_IDs[keep], keys[keep]
+        return found
+
+    def check_pred(self, slots):
+        pred = self.pred[slots]
+        dead = (pred != NO_ID) & ~self.is_alive(pred)
+        self.pred[slots[dead]] = NO_ID
+
+    '''
+    Runs the periodic operations that come due on the current tick, for every Node that
+    has joined, in the order of PERIODIC_OPS.
+    '''
+    def fire_periodic_ops(self):
+        for op, period in enumerate(self.periods):
+            slots = self.due[op].get(self.time % period)
+            if slots is None:
+                continue
+            slots = np.array(slots, dtype=np.int64)
+            slots = slots[self.alive[slots] & self.joined[slots]]
+            if len(slots) > 0:
+                self.metrics.count(PERIODIC_RPCS[op].op, len(slots))
+                getattr(self, PERIODIC_OPS[op])(slots)
+
+    '''
+    Has every node in the Chord Ring take one step.
+    '''
+    def advance_all_one_step(self, verbose=False):
+        self.advance(1, verbose)
+
+    '''
+    Advances the Chord Ring by num_steps ticks.
+    '''
+    def advance(self, num_steps, verbose=False):
+        for i in range(num_steps):
+            self.time += 1
+            self.fire_periodic_ops()
+            self.hop_lookups()
+
+    '''
+    True if no lookups are in flight and every Node has found its successor.
+    '''
+    def is_idle(self):
+        return len(self.lookups['key']) == 0 and len(self.joining) == 0
+
+    '''
+    Same as ChordRing.run_until.
+    '''
+    def run_until(self, predicate, max_steps=None, check_every=1, verbose=False):
+        steps = 0
+        while not predicate(self):
+            if max_steps is not None and steps >= max_steps:
+                LOG.warning('Gave up waiting after {} steps.', steps)
+                break
+            num_steps = check_every
+            if max_steps is not None:
+                num_steps = min(num_steps, max_steps - steps)
+            self.advance(num_steps, verbose)
+            steps += num_steps
+        return steps
+
+    def run_until_idle(self, max_steps=None, verbose=False):
+        return self.run_until(ArrayRing.is_idle, max_steps, verbose=verbose)
+
+    def is_converged(self):
+        return self.check_correctness(verbose=False)
+
+    '''
+    Checks to see if the current state of the Chord Ring is "correct", the same way
+    ChordRing.check_correctness does, but with every comparison done on whole arrays.
+    Prints any problems if verbose, and returns True if there were none. incremental is
+    accepted so drivers can pass it to either engine, but a check here is cheap enough that
+    every Node is always looked at.
+    '''
+    def check_correctness(self, verbose=True, incremental=False):
+        self.slots_for(np.zeros(0, dtype=np.int64))
+        sorted_IDs, slots = self.sorted_IDs, self.sorted_slots
+        num_IDs = len(sorted_IDs)
+        if num_IDs == 0:
+            return True
+        ind = np.arange(num_IDs)
+        e_pred      = sorted_IDs[(ind - 1) % num_IDs]
+        e_fingers   = sorted_IDs[np.searchsorted(sorted_IDs, (sorted_IDs[:, None] + self.finger_offsets) & self.space.mask) % num_IDs]
+        e_succ_list = sorted_IDs[(ind[:, None] + 2 + np.arange(self.succ_list.shape[1])) % num_IDs]
+        bad_pred    = self.pred[slots] != e_pred
+        bad_fingers = self.fingers[slots] != e_fingers
+        bad_succ    = self.succ_list[slots] != e_succ_list
+        held        = self.item_owner != NO_ID
+        e_owner     = sorted_IDs[np.searchsorted(sorted_IDs, self.item_key[held]) % num_IDs]
+        bad_items   = self.item_owner[held] != e_owner
+        failing = bad_pred | bad_fingers.any(axis=1) | bad_succ.any(axis=1)
+        failing[np.searchsorted(sorted_IDs, self.item_owner[held][bad_items])] = True
+        if verbose:
+            bad_item_keys = self.item_key[held][bad_items]
+            bad_item_owners = self.item_owner[held][bad_items]
+            for j in np.flatnonzero(failing).tolist():
+                curr_ID  = sorted_IDs[j]
+                slot     = slots[j]
+                to_print = '\n' + 'Problems with Node {}\n'.format(curr_ID) + '-'*30
+                if bad_pred[j]:
+                    to_print += '\nNode {} has wrong predecessor. Expected: {}\tActual: {}'.format(curr_ID, e_pred[j], self.pred[slot])
+                for item_key in bad_item_keys[bad_item_owners == curr_ID].tolist():
+                    to_print += '\nNode {} incorrectly possesses item with key {}. Expected Node: {}'.format(
+                        curr_ID, item_key, self.membership.owner_of(item_key))
+                for i in np.flatnonzero(bad_fingers[j]).tolist():
+                    to_print += '\nNode {} Has wrong finger table {} value. Expected: {}\tActual: {}'.format(curr_ID, i, e_fingers[j, i], self.fingers[slot, i])
+                for i in np.flatnonzero(bad_succ[j]).tolist():
+                    to_print += '\nNode {} has wrong successor list value at index {}. Expected: {}\tActual: {}'.format(curr_ID, i, e_succ_list[j, i], self.succ_list[slot, i])
+                print(to_print)
+        if not failing.any() and verbose:
+            print('No errors in Chord Ring')
+        return not failing.any()
+
+    '''
+    Returns the number of keys each Node stores, in the order of nodeList.
+    '''
+    def return_key_distribution(self):
+        self.slots_for(np.zeros(0, dtype=np.int64))
+        held = self.item_owner[self.item_owner != NO_ID]
+        return np.bincount(np.searchsorted(self.sorted_IDs, held), minlength=len(self.sorted_IDs)).tolist()
+
+    '''
+    What return_key_distribution should be once the ring has converged, as in
+    ChordRing.expected_key_distribution.
+    '''
+    def expected_key_distribution(self):
+        return ownership_counts(np.array(list(self.membership), dtype=np.int64), self.item_key).tolist()
+
+    '''
+    Saves the ring in the same snapshot format as ChordRing.save, so snapshots can be
+    shared between the two engines.
+    '''
+    def save(self, path):
+        slots  = np.flatnonzero(self.alive[:self.num_slots])
+        owners = self.item_owner != NO_ID
+        slot_index = np.full(self.num_slots, NO_ID, dtype=np.int64)
+        slot_index[slots] = np.arange(len(slots))
+        np.savez_compressed(path,
+            ring_size   = np.array(self.space.m),
+            IDs         = self.IDs[slots],
+            pred_IDs    = self.pred[slots],
+            fingers     = self.fingers[slots],
+            succ_lists  = self.succ_list[slots],
+            next        = self.next_finger[slots],
+            joined      = self.joined[slots],
+            offsets     = self.offsets[slots],
+            periods     = np.tile(np.array(self.periods, dtype=np.int64), (len(slots), 1)),
+            item_owner  = slot_index[self.slots_for(self.item_owner[owners])],
+            item_key    = self.item_key[owners],
+            item_value  = np.array(self.item_value, dtype=np.int64)[owners])
+
+    '''
+    Builds an ArrayRing from a snapshot written by ChordRing.save or ArrayRing.save.
+    Every Node has to run with the default periods. ring_size comes from the snapshot.
+    '''
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as snapshot:
+            data = {name: snapshot[name] for name in snapshot.files}
+        if (data['periods'] != np.array(DEFAULT_PERIODS)).any():
+            raise ValueError('ArrayRing only supports the default periods')
+        num_IDs = len(data['IDs'])
+        ring = cls(max(num_IDs, 16), int(data['ring_size']))
+        ring.num_slots = num_IDs
+        ring.IDs[:num_IDs]         = data['IDs']
+        ring.pred[:num_IDs]        = data['pred_IDs']
+        ring.fingers[:num_IDs]     = data['fingers']
+        ring.succ_list[:num_IDs]   = data['succ_lists']
+        ring.next_finger[:num_IDs] = data['next']
+        ring.joined[:num_IDs]      = data['joined']
+        ring.offsets[:num_IDs]     = data['offsets']
+        ring.alive[:num_IDs]       = True
+        for slot, ID in enumerate(data['IDs'].tolist()):
+            ring.slot_of[ID] = slot
+            ring.membership.add(ID)
+            if not ring.joined[slot]:
+                ring.joining.add(slot)
+            for op, period in enumerate(ring.periods):
+                ring.due[op].setdefault(int(-ring.offsets[slot] % period), []).append(slot)
+        keys = data['item_key']
+        ring.append_items(keys, data['IDs'][data['item_owner']], data['item_value'].tolist())
+        ring.item_keys  = set(keys.tolist())
+        return ring
+
+    '''
+    To String function
+    '''
+    def __str__(self):
+        to_print = ""
+        for ID in self.membership:
+            slot = self.slot_of[ID]
+            to_print += 'Node {}\n'.format(ID) + '-'*40 + '\n'
+            to_print += 'Successor List: {}\n'.format([int(self.fingers[slot, 0])] + self.succ_list[slot].tolist())
+            to_print += 'Predecessor: {}\n'.format(self.pred[slot])
+            for i, ft_i in enumerate(self.fingers[slot].tolist()):
+                to_print += 'Finger Table Entry {}: {}\n'.format(i, ft_i)
+            to_print += 'Stored keys: {}\n\n'.format(self.item_key[self.item_owner == ID].tolist())
+        return to_print
+
+'''
+Array versions of between and between_exclusive in Node.py. The arguments broadcast.
+'''
+def between(ID1, ID2, key):
+    return np.where(ID1 < ID2, (key > ID1) & (key <= ID2),
+                    np.where(ID1 > ID2, (key > ID1) | (key <= ID2), True))
+
+def between_exclusive(ID1, ID2, key):
+    return np.where(ID1 < ID2, (key > ID1) & (key < ID2),
+                    np.where(ID1 > ID2, (key > ID1) | (key < ID2), True))
@@ -0,0 +1,238 @@
+import constants as c
+import numpy as np
+
+from IDSpace import NO_ID
+
+# The kinds of state a check compares, in the order they are reported.
+KINDS = ('pred', 'finger', 'succ_list', 'item')
+
+class CheckResult:
+    '''
+    What a ring check found. It contains the following:
+        num_nodes:   Number of Nodes on the ring.
+        num_checked: Number of Nodes whose state was looked at. Smaller than num_nodes for
+            incremental checks, which reuse what earlier checks found for the rest.
+        mismatches:  Maps each of KINDS to how many entries of that kind are wrong: wrong
+            predecessors, finger table entries, successor list entries and misplaced items.
+        samples:     Maps each of KINDS to up to max_samples of those wrong entries, as
+            (ID, where, expected, actual) tuples. where is the finger table or successor
+            list index, the item key for items (whose expected and actual are the Node
+            that should hold it and the one that does), and None for predecessors.
+        failing:     Number of Nodes with at least one wrong entry.
+    '''
+    __slots__ = ('num_nodes', 'num_checked', 'mismatches', 'samples', 'failing')
+
+    def __init__(self, num_nodes, num_checked, mismatches, samples, failing):
+        self.num_nodes   = num_nodes
+        self.num_checked = num_checked
+        self.mismatches  = mismatches
+        self.samples     = samples
+        self.failing     = failing
+
+    @property
+    def ok(self):
+        return self.failing == 0
+
+    def __str__(self):
+        if self.ok:
+            return 'No errors in Chord Ring'
+        to_print = '{} of {} Nodes have problems: {}'.format(self.failing, self.num_nodes,
+            ', '.join('{} wrong {}'.format(self.mismatches[kind], kind) for kind in KINDS if self.mismatches[kind]))
+        for kind in KINDS:
+            for ID, where, expected, actual in self.samples[kind]:
+                to_print += '\nNode {} has wrong {}{}. Expected: {}\tActual: {}'.format(
+                    ID, kind, '' if where is None else ' {}'.format(where), expected, actual)
+        return to_print
+
+class RingChecker:
+    '''
+    Checks a ChordRing against the state it should converge to, with NumPy: the expected
+    predecessors, finger tables, successor lists and item owners of all Nodes are worked
+    out at once with searchsorted over the sorted IDs, and compared with the actual state
+    as whole arrays.
+    The ring tells the checker which Nodes might have changed since the last check (see
+    ChordRing.touched), so an incremental check only looks at those, plus the Nodes whose
+    expected state moved because a Node joined or left nearby. What it found for every
+    other Node is remembered from before. Only changes made through RPCs and the ring's own
+    methods are seen, so after editing Node state by hand, run a full check.
+    It contains the following:
+        ring:        The ChordRing being checked.
+        max_samples: How many wrong entries of each kind to keep as examples.
+        found:       Maps the IDs of Nodes that failed a check to what was wrong with them,
+            as {kind: (count, samples)}. Routing state (pred, finger, succ_list) and items
+            are kept apart, since an incremental check may only redo one of them.
+        checked:     Whether there has been a full check to build on.
+    '''
+    def __init__(self, ring, max_samples=10):
+        self.ring        = ring
+        self.max_samples = max_samples
+        self.found       = {}
+        self.checked     = False
+
+    '''
+    Checks the ring and returns a CheckResult. incremental only re-checks the Nodes that
+    may have changed since the previous check; the first check is always a full one.
+    '''
+    def check(self, incremental=False):
+        ring  = self.ring
+        space = ring.space
+        dtype = np.int64 if space.m < 64 else object
+        sorted_IDs = np.array(list(ring.membership), dtype=dtype)
+        num_IDs    = len(sorted_IDs)
+        touched, touched_storage, moved = ring.touched, ring.touched_storage, ring.membership_changes
+        ring.touched, ring.touched_storage, ring.membership_changes = set(), set(), set()
+
+        # Rings about as small as a successor list are simply checked in full.
+        if not incremental or not self.checked or num_IDs <= 2 * c.successor_list_size:
+            routing     = np.arange(num_IDs)
+            items       = routing
+            num_checked = num_IDs
+            self.found  = {}
+        else:
+            for ID in moved:
+                if ID not in ring.membership:
+                    self.found.pop(ID, None)
+            routing, items = self.affected(sorted_IDs, touched, touched_storage, moved)
+            num_checked    = len(set(routing.tolist()) | set(items.tolist()))
+        self.checked = True
+
+        if num_IDs > 0:
+            self.check_routing(sorted_IDs, routing)
+            self.check_items(sorted_IDs, items)
+
+        mismatches = dict.fromkeys(KINDS, 0)
+        samples    = {kind: [] for kind in KINDS}
+        for ID in sorted(self.found):
+            for kind, (count, kind_samples) in self.found[ID].items():
+                mismatches[kind] += count
+                samples[kind].extend(kind_samples[:self.max_samples - len(samples[kind])])
+        return CheckResult(num_IDs, num_checked, mismatches, samples, len(self.found))
+
+    '''
+    Positions (in sorted_IDs) of the Nodes an incremental check has to look at: for
+    routing state, the Nodes that processed anything, and the ones whose predecessor,
+    successor list or fingers should now point somewhere else because a Node joined or
+    left; for items, the Nodes whose storage changed or whose key range moved, and after
+    a join or departure the ones holding misplaced items.
+    '''
+    def affected(self, sorted_IDs, touched, touched_storage, moved):
+        space   = self.ring.space
+        num_IDs = len(sorted_IDs)
+        def positions(IDs):
+            IDs = np.array([ID for ID in IDs if ID in self.ring.membership], dtype=sorted_IDs.dtype)
+            return np.searchsorted(sorted_IDs, IDs)
+        routing = [positions(touched | moved)]
+        items   = [positions(touched_storage | moved)]
+        if moved:
+            moved = np.array(sorted(moved), dtype=sorted_IDs.dtype)
+            # first Node after each moved ID, and the last one before it
+            after  = np.searchsorted(sorted_IDs, moved, side='right') % num_IDs
+            before = (np.searchsorted(sorted_IDs, moved, side='left') - 1) % num_IDs
+            # The successor's predecessor and key range changed, and so did the successor
+            # lists of the Nodes that are up to succ_list_size - 1 before the moved ID.
+            routing.append(after)
+            items.append(after)
+            routing.append((before[:, None] - np.arange(c.successor_list_size)) % num_IDs)
+            # Finger i of Node n changed if n + 2**i lands in (before, moved], the range
+            # the moved ID took over or gave up.
+            lo = sorted_IDs[before]
+            for offset in space.finger_offsets:
+                start = (lo - offset) & space.mask
+                end   = (moved - offset) & space.mask
+                routing.append(self.in_ranges(sorted_IDs, start, end))
+            # Misplaced items may now belong to a different Node than the one their
+            # samples name, so the Nodes holding any are looked at again.
+            items.append(positions([ID for ID, found in self.found.items() if 'item' in found]))
+        routing = np.unique(np.concatenate([np.ravel(p) for p in routing]).astype(np.int64))
+        items   = np.unique(np.concatenate([np.ravel(p) for p in items]).astype(np.int64))
+        return routing, items
+
+    '''
+    Positions of the IDs that lie in any of the ring ranges (start[i], end[i]].
+    '''
+    def in_ranges(self, sorted_IDs, start, end):
+        num_IDs = len(sorted_IDs)
+        first = np.searchsorted(sorted_IDs, start, side='right')
+        last  = np.searchsorted(sorted_IDs, end, side='right')
+        # ranges that wrap around end at num_IDs and start again at 0
+        last  = np.where(start < end, last, last + num_IDs)
+        found = [np.arange(f, l) % num_IDs for f, l in zip(first.tolist(), last.tolist()) if l > f]
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(found)
+
+    def check_routing(self, sorted_IDs, positions):
+        ring, space = self.ring, self.ring.space
+        num_IDs = len(sorted_IDs)
+        if len(positions) == 0:
+            return
+        IDs   = sorted_IDs[positions]
+        nodes = [ring.nodeDict[ID] for ID in IDs.tolist()]
+        dtype = sorted_IDs.dtype
+        def ID_array(values):
+            return np.array([NO_ID if v is None else v for v in values], dtype=dtype)
+        pred = ID_array(node.pred_ID for node in nodes)
+        if space.m < 64:
+            fingers = np.frombuffer(b''.join(node.finger_table.tobytes() for node in nodes),
+                                    dtype=np.int64).reshape(len(nodes), space.m)
+        else:
+            fingers = np.array([list(node.finger_table) for node in nodes], dtype=object).reshape(len(nodes), space.m)
+        succ_list = ID_array(succ for node in nodes for succ in node.succ_list).reshape(len(nodes), -1)
+
+        offsets     = np.array(space.finger_offsets, dtype=dtype)
+        e_pred      = sorted_IDs[(positions - 1) % num_IDs]
+        e_fingers   = sorted_IDs[np.searchsorted(sorted_IDs, (IDs[:, None] + offsets) & space.mask) % num_IDs]
+        # succ_list starts two to the right of the Node, since finger_table[0] is the first.
+        e_succ_list = sorted_IDs[(positions[:, None] + 2 + np.arange(succ_list.shape[1])) % num_IDs]
+
+        bad = {'pred':      (pred != e_pred)[:, None],
+               'finger':    fingers != e_fingers,
+               'succ_list': succ_list != e_succ_list}
+        expected = {'pred': e_pred[:, None], 'finger': e_fingers, 'succ_list': e_succ_list}
+        actual   = {'pred': pred[:, None], 'finger': fingers, 'succ_list': succ_list}
+        failing  = bad['pred'][:, 0] | bad['finger'].any(axis=1) | bad['succ_list'].any(axis=1)
+        for j, ID in enumerate(IDs.tolist()):
+            found = self.found.get(ID)
+            if found is not None:
+                for kind in ('pred', 'finger', 'succ_list'):
+                    found.pop(kind, None)
+                if not found:
+                    del self.found[ID]
+            if not failing[j]:
+                continue
+            found = self.found.setdefault(ID, {})
+            for kind in ('pred', 'finger', 'succ_list'):
+                wrong = np.flatnonzero(bad[kind][j]).tolist()
+                if not wrong:
+                    continue
+                e_row, a_row = expected[kind][j].tolist(), actual[kind][j].tolist()
+                found[kind] = (len(wrong), [(ID, None if kind == 'pred' else i, e_row[i], a_row[i])
+                                            for i in wrong[:self.max_samples]])
+
+    def check_items(self, sorted_IDs, positions):
+        ring    = self.ring
+        num_IDs = len(sorted_IDs)
+        if len(positions) == 0:
+            return
+        dtype = sorted_IDs.dtype
+        IDs   = sorted_IDs[positions].tolist()
+        storages = [ring.nodeDict[ID].stored_items() for ID in IDs]
+        counts   = np.array([len(storage) for storage in storages], dtype=np.int64)
+        keys     = np.fromiter((k for storage in storages for k in storage.keys()), dtype=dtype, count=int(counts.sum()))
+        holder   = np.repeat(positions, counts)
+        e_holder = np.searchsorted(sorted_IDs, keys) % num_IDs
+        wrong    = np.flatnonzero(e_holder != holder)
+        wrong_by_node = {}
+        for i in wrong.tolist():
+            wrong_by_node.setdefault(int(holder[i]), []).append(i)
+        for j, ID in zip(positions.tolist(), IDs):
+            found = self.found.get(ID)
+            if found is not None:
+                found.pop('item', None)
+                if not found:
+                    del self.found[ID]
+            if j not in wrong_by_node:
+                continue
+            wrong = wrong_by_node[j]
+            self.found.setdefault(ID, {})['item'] = (len(wrong), [(ID, int(keys[i]), int(sorted_IDs[e_holder[i]]), ID)
+                                                                  for i in wrong[:self.max_samples]])
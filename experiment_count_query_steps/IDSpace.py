@@ -0,0 +1,58 @@
+import constants as c
+import random
+
+from array import array
+
+# Value of a finger table entry that has not been filled in yet. IDs are never negative.
+NO_ID = -1
+
+class IDSpace:
+    '''
+    The identifier space of a Chord Ring: Node IDs and item keys are m-bit integers, from 0
+    up to (but not including) 2**m. Every Node on a ring shares the same IDSpace, so the
+    powers of two the finger math needs are only worked out once. It contains the following:
+        m:              Number of bits in an ID. Any width works, including SHA-1's 160.
+        size:           2**m, the number of possible IDs.
+        mask:           size - 1. ID arithmetic is done modulo size by and-ing with it.
+        finger_offsets: finger_offsets[i] is 2**i, so finger i of a Node starts at
+            (ID + finger_offsets[i]) & mask.
+    '''
+    def __init__(self, m=None):
+        self.m              = c.ring_size if m is None else m
+        self.size           = 1 << self.m
+        self.mask           = self.size - 1
+        self.finger_offsets = tuple(1 << i for i in range(self.m))
+
+    '''
+    Uniformly random ID (or key) from the space.
+    '''
+    def random_ID(self):
+        return random.getrandbits(self.m)
+
+    '''
+    Uniformly random ID that is not in used, which only has to support len and in (a set,
+    a dict or a MembershipIndex all do). While at most half of the space is used, this
+    samples until it hits a free ID, which takes fewer than two tries on average no matter
+    how large m is. Only a space that is more than half full, and therefore small, gets
+    scanned for its free IDs.
+    '''
+    def unused_ID(self, used):
+        if len(used) >= self.size:
+            raise ValueError('All {} IDs are in use'.format(self.size))
+        if 2 * len(used) > self.size:
+            return random.choice([ID for ID in range(self.size) if ID not in used])
+        while True:
+            ID = random.getrandbits(self.m)
+            if ID not in used:
+                return ID
+
+    '''
+    A finger table with every entry unset. Integer arrays hold 64-bit IDs at most, so
+    wider spaces use a list.
+    '''
+    def empty_finger_table(self):
+        if self.m < 64:
+            return array('q', [NO_ID]) * self.m
+        return [NO_ID] * self.m
+
+DEFAULT_SPACE = IDSpace()
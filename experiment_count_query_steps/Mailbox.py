@@ -0,0 +1,45 @@
+import constants as c
+from collections import deque
+
+class Mailbox:
+    '''
+    FIFO queue of the RPCs a Node still has to process. Enqueueing and dequeueing are both
+    O(1), no matter how long the backlog gets. It contains the following:
+        queue:        deque holding the RPC messages (see Messages.py), oldest first. Each
+            carries its opcode in op, which the Node dispatches on.
+        service_rate: How many RPCs the Node processes per tick. 0 means the Node processes
+            every RPC that is waiting when it gets its turn.
+        high_water:   The most RPCs that have ever been waiting at once.
+        served:       Number of RPCs taken out to be processed so far.
+    '''
+    __slots__ = ('queue', 'service_rate', 'high_water', 'served')
+
+    def __init__(self, service_rate=None):
+        self.queue        = deque()
+        self.service_rate = c.service_rate if service_rate is None else service_rate
+        self.high_water   = 0
+        self.served       = 0
+
+    def append(self, RPC_message):
+        queue = self.queue
+        queue.append(RPC_message)
+        if len(queue) > self.high_water:
+            self.high_water = len(queue)
+
+    def popleft(self):
+        self.served += 1
+        return self.queue.popleft()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __iter__(self):
+        return iter(self.queue)
+
+    '''
+    Number of RPCs the Node gets to process this tick, given what is waiting right now.
+    '''
+    def batch_size(self):
+        if self.service_rate == 0:
+            return len(self.queue)
+        return min(self.service_rate, len(self.queue))
@@ -0,0 +1,128 @@
+import bisect
+import random
+
+class MembershipIndex:
+    '''
+    Keeps track of which IDs are on the Chord Ring, both in sorted order (to answer "who owns
+    this key" questions) and in an unordered array (to pick a random member in O(1)).
+    It contains the following:
+        blocks:   The IDs in sorted order, split into consecutive sorted blocks of at most
+            2*load IDs each. Finding an ID is a binary search over maxes followed by one
+            inside the block, and inserting or deleting only shifts a single block.
+        maxes:    maxes[b] is the largest ID in blocks[b].
+        load:     Target block size. Blocks are split in two once they reach twice this.
+        members:  Every ID, in no particular order. Used for random sampling.
+        position: Maps IDs to their index in members, so they can be removed in O(1) by
+            swapping the last member into their place.
+    '''
+    def __init__(self, IDs=(), load=512):
+        self.blocks   = []
+        self.maxes    = []
+        self.load     = load
+        self.members  = []
+        self.position = {}
+        for ID in IDs:
+            self.add(ID)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, ID):
+        return ID in self.position
+
+    '''
+    Iterates over the IDs in sorted order.
+    '''
+    def __iter__(self):
+        for block in self.blocks:
+            for ID in block:
+                yield ID
+
+    def add(self, ID):
+        if ID in self.position:
+            return
+        self.position[ID] = len(self.members)
+        self.members.append(ID)
+        if not self.blocks:
+            self.blocks.append([ID])
+            self.maxes.append(ID)
+            return
+        b = bisect.bisect_left(self.maxes, ID)
+        if b == len(self.maxes):
+            b -= 1
+            self.blocks[b].append(ID)
+            self.maxes[b] = ID
+        else:
+            bisect.insort(self.blocks[b], ID)
+        block = self.blocks[b]
+        if len(block) >= 2 * self.load:
+            half = block[self.load:]
+            del block[self.load:]
+            self.blocks.insert(b + 1, half)
+            self.maxes[b] = block[-1]
+            self.maxes.insert(b + 1, half[-1])
+
+    def remove(self, ID):
+        ind  = self.position.pop(ID)
+        last = self.members.pop()
+        if last != ID:
+            self.members[ind]    = last
+            self.position[last] = ind
+        b     = bisect.bisect_left(self.maxes, ID)
+        block = self.blocks[b]
+        del block[bisect.bisect_left(block, ID)]
+        if block:
+            self.maxes[b] = block[-1]
+        else:
+            del self.blocks[b]
+            del self.maxes[b]
+
+    '''
+    Returns a uniformly random ID on the ring.
+    '''
+    def random_member(self):
+        return random.choice(self.members)
+
+    '''
+    Returns the ID of the Node responsible for the key, i.e. the first ID at or after it,
+    wrapping around to the smallest ID.
+    '''
+    def owner_of(self, key):
+        b = bisect.bisect_left(self.maxes, key)
+        if b == len(self.maxes):
+            return self.blocks[0][0]
+        block = self.blocks[b]
+        return block[bisect.bisect_left(block, key)]
+
+    '''
+    Returns the last ID strictly before the key, wrapping around to the largest ID. For a
+    Node's own ID, this is its predecessor.
+    '''
+    def predecessor_of(self, key):
+        b = bisect.bisect_left(self.maxes, key)
+        if b == len(self.maxes):
+            return self.blocks[-1][-1]
+        block = self.blocks[b]
+        ind   = bisect.bisect_left(block, key)
+        if ind > 0:
+            return block[ind - 1]
+        return self.blocks[b - 1][-1]
+
+    '''
+    Returns the count IDs that come after ID on the ring, in order, wrapping around as many
+    times as needed (so on a small ring the list can repeat, and include ID itself).
+    '''
+    def successors(self, ID, count):
+        succs = []
+        b   = bisect.bisect_right(self.maxes, ID)
+        ind = 0
+        if b < len(self.blocks):
+            ind = bisect.bisect_right(self.blocks[b], ID)
+        while len(succs) < count:
+            if b == len(self.blocks):
+                b = 0
+            block = self.blocks[b]
+            succs.extend(block[ind:ind + count - len(succs)])
+            b  += 1
+            ind = 0
+        return succs
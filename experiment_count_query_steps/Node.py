@@ -2,129 +2,205 @@ import constants as c
 import math
 import random
 
+from types import MappingProxyType
+
+from IDSpace import DEFAULT_SPACE, NO_ID
+from Log import LOG
+from Mailbox import Mailbox
+from Messages import *
+from Storage import storage_factory
+
+# Operations every Node runs periodically, and how often by default (in ticks).
+PERIODIC_OPS    = ('stabilize', 'fix_finger', 'check_pred')
+DEFAULT_PERIODS = (c.stabilize_period, c.fix_finger_period, c.check_pred_period)
+
+# What the storage of a Node that has never stored anything looks like from outside.
+EMPTY_STORAGE  = MappingProxyType({})
+# Makes the storage of Nodes that are not on a ring (see ChordRing.track_node).
+DEFAULT_STORAGE = storage_factory()
+
 class ChordNode:
     ''' A single Node on the Chord Ring. Each Node contains the following:
         ID:             Hashed ID of the Node.
         pred_ID:        ID of the Node that preceeds itself.
-        finger_table_i: ith entry of the finger table. 
+        space:          The IDSpace of the ring the Node is on.
+        finger_table:   Fixed-width integer array (a list for IDs wider than 63 bits). Entry i
+            is the successor of (ID + space.finger_offsets[i]) & space.mask, or NO_ID if it is
+            not known yet.
+            finger_table[0] is the Node's successor.
         next:           Index that keeps track of next finger table entry to update
-        storage:        Dictionary that holds the keys and values of the items it stores.
+        storage:        Storage (see Storage.py) that holds the keys and values of the items
+            it stores, or None until the Node stores its first item. Read it through
+            stored_items.
         succ_list:      Successor list, of size r-1. Contains the subsequent successors AFTER
-            the first one, which is already stored in finger_table_0
+            the first one, which is already stored in finger_table[0]
 
     Furthermore, each Node contains the following:
-        func:          A dictionary that makes function names to actual Node functions themselves.
         joined:        A boolean to keep track of whether the Node has joined the ring yet. 
             Only set to True once it's successor has been determined.
-        incoming_RPCs: A queue of RPCs that the node needs to process. For more information
-            on RPCs, view the README document.
+        incoming_RPCs: A Mailbox of RPCs that the node needs to process. For more information
+            on RPCs, view the README document. The Mailbox's service_rate sets how many of
+            them the Node processes per tick.
         counter:       countains (operation_count, offset). Used as a proxy for time to determine
             when to fix finger and stabilize. The offset is randomly generated to make sure
             that not all Nodes are trying to fix finger and stabilize at the same itme.
+        periods:       How often (in ticks) the Node runs each of PERIODIC_OPS. Shared with
+            every other Node until changed through ChordRing.set_period.
+        observer:      Optional object (normally the ChordRing) that is told whenever an RPC
+            lands in incoming_RPCs and whenever one is taken out to be processed. This is how
+            the scheduler knows the Node has work to do, and how outstanding work is tracked.
+
+    Finally, the ring the Node is on, bound once when it is added (see ChordRing.track_node)
+    instead of being shipped along in every RPC:
+        nodeDict:      A dictionary that maps IDs to Nodes.
+        step_tracker:  StreamingStats that successful client lookups add their hop counts to.
+        new_storage:   Makes the Node's storage, given its ID. Decides the storage backend.
+
+    The class attribute handlers maps RPC opcodes (see Messages.py) to the Node functions that
+    handle them. It is shared by every Node, rather than each Node building its own dictionary
+    of bound methods. Nodes are slotted, so they carry no per-instance __dict__.
+    '''
+    __slots__ = ('ID', 'space', 'pred_ID', 'finger_table', 'next', 'storage', 'succ_list', 'joined',
+                 'incoming_RPCs', 'counter', 'periods', 'observer',
+                 'nodeDict', 'step_tracker', 'new_storage')
 
-    '''        
-    def __init__(self, ID):
-        self.var               = {} # var contains ALL variables that define the node.
-        self.var['ID']         = ID
-        self.var['pred_ID']    = None
-        for i in range(c.ring_size):
-            var_name = 'finger_table_{}'.format(i)
-            self.var[var_name] = None
-        self.var['next']       = 0
-        self.var['storage']    = {}
-        self.var['succ_list']  = [None]*(c.successor_list_size - 1)
-
-        self.func = {}
-        self.func['find_successor'] = self.find_successor
-        self.func['create']         = self.create
-        self.func['join']           = self.join
-        self.func['request_items']  = self.request_items
-        self.func['send_items']     = self.send_items
-        self.func['stabilize']      = self.stabilize
-        self.func['notify']         = self.notify
-        self.func['fix_finger']     = self.fix_finger
-        self.func['check_pred'] = self.check_pred
+    def __init__(self, ID, service_rate=None, space=DEFAULT_SPACE):
+        self.ID           = ID
+        self.space        = space
+        self.pred_ID      = None
+        self.finger_table = space.empty_finger_table()
+        self.next         = 0
+        self.storage      = None
+        self.succ_list    = [None]*(c.successor_list_size - 1)
 
         self.joined        = False
-        self.incoming_RPCs = []
+        self.incoming_RPCs = Mailbox(service_rate)
         self.counter       = [0, random.randint(0, c.max_offset)]
+        self.periods       = DEFAULT_PERIODS
+
+        self.observer        = None
+        self.nodeDict        = None
+        self.step_tracker    = None
+        self.new_storage     = DEFAULT_STORAGE
 
     '''
-    At each timestep, the Node will process one incoming RPC. The RPC can either
-    be a value RPC, which means the Node needs to process the returned value, or 
-    it can be a function RPC, which means the Node needs to launch a function.
-    If there are no RPCs to process, then the Node does nothing.
+    The items the Node stores, as a read-only mapping if it has none.
+    '''
+    def stored_items(self):
+        if self.storage is None:
+            return EMPTY_STORAGE
+        return self.storage
+
+    '''
+    Stores a single item, creating the storage the first time.
+    '''
+    def store_item(self, k, v):
+        if self.storage is None:
+            self.storage = self.new_storage(self.ID)
+        self.storage.store(k, v)
+
+    '''
+    Stores the items keys[i] -> values[i] as one block. The keys have to be sorted and
+    distinct.
+    '''
+    def store_many(self, keys, values):
+        if len(keys) == 0:
+            return
+        if self.storage is None:
+            self.storage = self.new_storage(self.ID)
+        self.storage.store_sorted(keys, values)
+
+    '''
+    Every RPC sent to a Node goes through here, rather than appending to incoming_RPCs
+    directly, so that the observer can schedule the Node to process it.
     Inputs:
-        nodeDict: A dictionary that maps IDs to Nodes.
+        RPC_message: One of the message objects in Messages.py.
+    '''
+    def receive_RPC(self, RPC_message):
+        self.incoming_RPCs.append(RPC_message)
+        if self.observer is not None:
+            self.observer.delivered(self, RPC_message)
+
     '''
-    def process_incoming_RPC(self, nodeDict, verbose=False):
+    At each timestep, the Node processes as many incoming RPCs as its service rate allows.
+    Only the RPCs that were already waiting count; anything that arrives while serving
+    waits for the next tick.
+    '''
+    def serve(self, verbose=False):
+        for i in range(self.incoming_RPCs.batch_size()):
+            self.process_incoming_RPC(verbose)
+
+    '''
+    Processes a single incoming RPC, by handing it to the handler for its opcode.
+    Function RPCs (find_successor, join, stabilize, ...) make the Node run the function,
+    while the answers (found_key, set_finger, store_items) hand it a value to process.
+    If there are no RPCs to process, then the Node does nothing.
+    '''
+    def process_incoming_RPC(self, verbose=False):
         if len(self.incoming_RPCs) == 0:
             return
         # Get the RPC in a queue order.
-        RPC_type, RPC = self.incoming_RPCs.pop(0)
-
-        # If the RPC is a value RPC, then we process it. If the variable name is client,
-        # then the client is the one who ran the query, so we print it. Otherwise, it is
-        # a value to variable specified by var_name that needs to be processed.
-        # If the var name is storage, then we add incoming values to our storage. Otherwise,
-        # we set the variable to the value.
-        if RPC_type == 'value':
-            var_name, val = RPC
-            if var_name == 'client':
-                # RMB: added step_tracker to below
-                item_key, successor, steps, step_tracker, success = val
-                if success:
-                    print('Successfully found key {} at Node {} in {} steps!'.format(item_key, successor, steps))
-                    # RMB: added below; hopefully only real step that is needed!
-                    print('Appending steps to step_tracker')
-                    step_tracker.append(steps)
-                else:
-                    print('Incorrect Node {} located for key {} in {} steps.'.format(successor, item_key, steps))
-                    print('!Tracker needs to be added for this case to deal with churrn condition!')
-            elif var_name == 'storage':
-                if verbose:
-                    print('Node {} storing items {}'.format(self.var['ID'], val))
-                for item in val:
-                    self.var['storage'][item[0]] = item[1]
-            # If this is the first update to successor, then we need to annouce that 
-            # The node has successfully joined, as well as get items from successor.
-            elif var_name is 'finger_table_0' and self.var['finger_table_0'] is None:
-                #print('Node {} Successfully joined on counter {}'.format(self.var['ID'], self.counter[0]))
-                self.joined = True
-                self.var[var_name] = val
-                self.request_items(nodeDict)
-            # Otherwise, we can just assign the variable to the value.
-            else:
-                self.var[var_name] = val
-                if verbose:
-                    print('Node {} putting value {} in variable {}'.format(self.var['ID'], val, var_name))
-        # If the RPC is a function RPC, then we have the Node call the function with the 
-        # passed in arguments.
-        elif RPC_type == 'function':
-            func_name, kwargs = RPC
-            if verbose:
-                print('Node {} running function {}'.format(self.var['ID'], func_name))
-            self.func[func_name](**kwargs)
+        RPC_message = self.incoming_RPCs.popleft()
+        if self.observer is not None:
+            self.observer.consumed(self, RPC_message)
+        if verbose:
+            LOG.info('Node {} processing {}', self.ID, RPC_message)
+        self.handlers[RPC_message.op](self, RPC_message)
+
+    '''
+    The client that ran the query gets told where the key was found, so we log it.
+    '''
+    def found_key(self, RPC_message):
+        # RMB: added step_tracker to below
+        item_key, successor, steps = RPC_message.key, RPC_message.succ, RPC_message.steps
+        if LOG.sink is not None:
+            LOG.event('lookup', key=item_key, node=successor, steps=steps, success=RPC_message.success)
+        if RPC_message.success:
+            LOG.debug('Successfully found key {} at Node {} in {} steps!', item_key, successor, steps)
+            # RMB: added below; hopefully only real step that is needed!
+            self.step_tracker.add(steps)
+        else:
+            LOG.warning('Incorrect Node {} located for key {} in {} steps.', successor, item_key, steps)
+
+    '''
+    A finger lookup came back, so we set that entry of the finger table.
+    If this is the first update to successor, then we need to annouce that 
+    The node has successfully joined, as well as get items from successor.
+    '''
+    def set_finger(self, RPC_message):
+        if RPC_message.index == 0 and self.finger_table[0] == NO_ID:
+            #print('Node {} Successfully joined on counter {}'.format(self.ID, self.counter[0]))
+            self.joined = True
+            self.finger_table[0] = RPC_message.val
+            self.request_items()
+        # Otherwise, we can just assign the finger table entry to the value.
+        else:
+            self.finger_table[RPC_message.index] = RPC_message.val
+
+    '''
+    Adds incoming items to our storage.
+    '''
+    def store_items(self, RPC_message):
+        self.store_many(RPC_message.keys, RPC_message.values)
        
 
     '''
     Helper function where, using the first indeix of the finger and the successor list, finds the 
     first successor that is alive. Note that if none are alive, the program will throw an 
     IndexOOB exeception and crash. That, in a way, is desired behavior.
-    Inputs:
-        nodeDict: A dictionary that maps IDs to Nodes.
     '''
-    def find_first_alive_succ(self, nodeDict):
-        if self.var['finger_table_0'] in nodeDict.keys():
-            succ = self.var['finger_table_0']
+    def find_first_alive_succ(self):
+        nodeDict = self.nodeDict
+        if self.finger_table[0] in nodeDict:
+            succ = self.finger_table[0]
         else:
             found_alive_succ = False
             succ_ind = 0
             while not found_alive_succ:
                 if succ_ind == c.successor_list_size-1: #####
-                    print('Node {} is throwing OOB Exception with Succesor List: {}'.format(self.var['ID'], self.var['succ_list'])) #####
-                succ = self.var['succ_list'][succ_ind]
-                if succ in nodeDict.keys():
+                    LOG.error('Node {} is throwing OOB Exception with Succesor List: {}', self.ID, self.succ_list) #####
+                succ = self.succ_list[succ_ind]
+                if succ in nodeDict:
                     found_alive_succ = True
                 succ_ind += 1
         return succ
@@ -134,52 +210,46 @@ class ChordNode:
     Note that because we keep track of the ID that made the original find_successor 
     request, we always return the found successor directly to that Node. 
     Inputs: 
-        dest_ID:  The ID of the original Node that queried for the key. This is so
-            if the successor is found, we can return the value immediately to 
-            that Node.
-        var_name: The name of the variable that is associated with the key we are 
-            trying to find the successor for. For example, it could be 'client', which
-            means the client is the one that requested the successor. It could be 
-            'finger_table_i', which means the successor's ID would be put into 
-            that entry of the finger table.
-        key:      The key that we are trying to find the successor for.
-        nodeDict: A dictionary that maps IDs to Nodes.
+        RPC_message: FindSuccessor message, with
+            dest_ID:  The ID of the original Node that queried for the key. This is so
+                if the successor is found, we can return the value immediately to 
+                that Node.
+            var_name: What the successor is being looked for. CLIENT means the client
+                is the one that requested the successor. Otherwise it is the index i of a
+                finger table entry, which means the successor's ID would be put into that
+                entry of the finger table.
+            key:      The key that we are trying to find the successor for.
+            steps:    Number of hops so far, or None if nobody is counting.
     Actions:
-        Sends a value_RPC back to node of dest_ID if successor is found.
-        Sends a function_RPC to the closest preceding node to call find_successor otherwise. 
+        Sends a found_key or set_finger RPC back to node of dest_ID if successor is found.
+        Passes the same message on to the closest preceding node otherwise. 
     '''
-    # RMB: added optinal argument for step_tracker here
-    def find_successor(self, dest_ID, var_name, key, nodeDict, steps=None, step_tracker=None):
-        if steps is not None:
-            steps += 1
+    def find_successor(self, RPC_message):
+        nodeDict = self.nodeDict
+        key      = RPC_message.key
+        if RPC_message.steps is not None:
+            RPC_message.steps += 1
         # Find the first non-dead successor
-        ft_0 = self.find_first_alive_succ(nodeDict)
-        # If we find the successor, we send a value RPC to the Node that made the initial
+        ft_0 = self.find_first_alive_succ()
+        # If we find the successor, we send the answer to the Node that made the initial
         # query. 
-        if between(self.var['ID'], ft_0, key):
-            if var_name == 'client': # RMB: if query, should have steps and step_tracker arguments
-                if key in nodeDict[ft_0].var['storage'].keys():
-                    success = True
-                else:
-                    success = False
-                # RMB: added step_tracker as input here
-                value_RPC = (var_name, (key, ft_0, steps, step_tracker, success))
-            else: 
-                value_RPC = (var_name, ft_0)
+        if between(self.ID, ft_0, key):
+            dest_ID = RPC_message.dest_ID
             # We also make sure the initial query node exists.
-            if dest_ID in nodeDict.keys():
-                nodeDict[dest_ID].incoming_RPCs.append(('value', value_RPC))
+            if dest_ID not in nodeDict:
+                return
+            if RPC_message.var_name == CLIENT:
+                success = key in nodeDict[ft_0].stored_items()
+                answer  = FoundKey(key, ft_0, RPC_message.steps, success)
+            else: 
+                answer  = SetFinger(RPC_message.var_name, ft_0)
+            nodeDict[dest_ID].receive_RPC(answer)
             return
         # Otherwise, we find the closest preceding node through the finger table 
-        for i in range(c.ring_size - 1, -1, -1):
-            ft_i = self.var['finger_table_{}'.format(i)]
+        for ft_i in reversed(self.finger_table):
             # The second conditional is case of node departure or failure.
-            if ft_i is not None and ft_i in nodeDict.keys() and between_exclusive(self.var['ID'], key, ft_i):
-                # RMB: added step_tracker to below
-                kwargs = {'dest_ID': dest_ID, 'var_name': var_name, 'key': key, 'nodeDict': nodeDict, 
-                'steps':steps, 'step_tracker': step_tracker}
-                function_RPC = ('find_successor', kwargs)
-                nodeDict[ft_i].incoming_RPCs.append(('function', function_RPC))
+            if ft_i != NO_ID and ft_i in nodeDict and between_exclusive(self.ID, key, ft_i):
+                nodeDict[ft_i].receive_RPC(RPC_message)
                 return
 
 
@@ -187,170 +257,157 @@ class ChordNode:
     Only gets run by the first node in the Chord Ring, as defined in paper. 
     Because pred_ID = None during initialization, we only need to Node successor ID to its own.
     '''
-    def create(self):
-        self.var['finger_table_0'] = self.var['ID']
+    def create(self, RPC_message):
+        self.finger_table[0] = self.ID
 
 
     '''
     This gets run by newborn Nodes, as defined in the paper. It makes a random Node call
     find_successor. 
     Inputs:
-        join_ID:  random ID of a node that will start the find_successor request.
-        nodeDict: A dictionary that maps IDs to Nodes
+        RPC_message: Join message. join_ID is the random ID of a node that will start the
+            find_successor request.
     Actions:
-        Sends a function RPC to the random Node to call find_successor for it.
+        Sends a find_successor RPC to the random Node to look for the successor.
     '''
-    def join(self, join_ID, nodeDict):
-        start_node = nodeDict[join_ID]
+    def join(self, RPC_message):
         # The node who needs the successor information is the current node.
-        # The variable that the successor corresponds to is finger_table_0. 
+        # The variable that the successor corresponds to is finger table entry 0.
         # The key we are querying successor for is the Node's own key.
-        kwargs       = {'dest_ID': self.var['ID'], 
-                        'var_name': 'finger_table_0', 
-                        'key':self.var['ID'], 
-                        'nodeDict':nodeDict}
-        function_RPC = ('find_successor', kwargs)
-        nodeDict[join_ID].incoming_RPCs.append(('function', function_RPC))
+        self.nodeDict[RPC_message.join_ID].receive_RPC(FindSuccessor(self.ID, 0, self.ID))
 
 
     '''
     We want to make sure we have the correct items in our storage. This gets run when 
     the successor gets updated.
-    Inputs:
-        nodeDict: A dictionary that maps IDs to Nodes
     Actions: 
-        Send function RPC to successor, asking them to send items.
+        Send send_items RPC to successor, asking them to send items.
     '''
-    def request_items(self, nodeDict):
-        succ_node = nodeDict[self.var['finger_table_0']]
+    def request_items(self):
+        succ_node = self.nodeDict[self.finger_table[0]]
         # If the node is it's own successor (possible if it is the only node in the Chord ring),
         # there's no point in requesting items.
-        if succ_node.var['ID'] == self.var['ID']:
+        if succ_node.ID == self.ID:
             return
         # Otherwise, the Node ask the successor to send items to it.
-        kwargs       = {'dest_ID':self.var['ID'], 'nodeDict': nodeDict}
-        function_RPC = ('send_items', kwargs)
-        succ_node.incoming_RPCs.append(('function', function_RPC))
+        succ_node.receive_RPC(SendItems(self.ID))
     
 
     '''
     Sends relevant items to the node that claims is your predecessor. 
     Inputs:
-        dest_ID:  ID of the Node to send the items to.
-        nodeDict: A dictionary that maps IDs to Nodes
+        RPC_message: SendItems message. dest_ID is the ID of the Node to send the items to.
     Actions:
-        Send value RPC to the Node that made the query, with all items
+        Send store_items RPC to the Node that made the query, with all items
     '''
-    def send_items(self, dest_ID, nodeDict):
-        send_list = []
+    def send_items(self, RPC_message):
+        dest_ID  = RPC_message.dest_ID
+        nodeDict = self.nodeDict
         # The items to send are the ones that aren't between the predecessor and the Node itself.
-        for k, v in self.var['storage'].items():
-            if not between(dest_ID, self.var['ID'], k):
-                send_list.append((k, v))
-        for item in send_list:
-            self.var['storage'].pop(item[0])
-        # Send the value RPC
-        value_RPC = ('storage', send_list)
+        keys, values = [], []
+        if self.storage is not None:
+            keys, values = self.storage.take_outside(dest_ID, self.ID)
         # There is a miniscule chance that the Node we're sending to has died. This avoids that.
-        if dest_ID not in nodeDict.keys():
+        if dest_ID not in nodeDict:
             return
-        nodeDict[dest_ID].incoming_RPCs.append(('value', value_RPC))
+
+        nodeDict[dest_ID].receive_RPC(StoreItems(keys, values))
 
 
     ''' 
     If the node is gracefully failing, it can send all of the storage contents to 
     it's successor.
-    Inputs:
-        nodeDict: A dictionary that maps IDs to Nodes
     Actions:
-        Sends value RPC to successor, with all items
+        Sends store_items RPC to successor, with all items
     '''
-    def send_successor_items(self, nodeDict):
-        succ_ID = self.find_first_alive_succ(nodeDict)
-        succ_node = nodeDict[succ_ID]
-        send_list = []
-        for k, v in self.var['storage'].items():
-            send_list.append((k, v))
-        value_RPC = ('storage', send_list)
-        succ_node.incoming_RPCs.append(('value', value_RPC))
+    def send_successor_items(self):
+        succ_ID = self.find_first_alive_succ()
+        succ_node = self.nodeDict[succ_ID]
+        keys, values = [], []
+        if self.storage is not None:
+            keys, values = self.storage.take_all()
+        succ_node.receive_RPC(StoreItems(keys, values))
 
     '''
     Verify who the successor is, and notify the successor. The basic logic is defined in the paper.
-    Inputs:
-        nodeDict: A dictionary that maps IDs to Nodes
     Actions:
-        Send function RPC to notify successor.
+        Send notify RPC to successor.
     '''
-    def stabilize(self, nodeDict):
+    def stabilize(self, RPC_message):
+        nodeDict = self.nodeDict
         # Finds the first successor that is still alive
-        succ_ID = self.find_first_alive_succ(nodeDict) 
+        succ_ID = self.find_first_alive_succ() 
         # Let's set this node to our successor tentatively, since as far as we know, it is the successor.
-        self.var['finger_table_0'] = succ_ID
+        self.finger_table[0] = succ_ID
         succ_node = nodeDict[succ_ID]
         # This next line is cheating a bit. Instead of sending an RPC to query for the predecessor,
         # we're grabbing it directly. This is because it's a massive pain to get the above to 
         # work with our framework, and this operation is constant and inexpensive anyways.
-        succ_pred_ID = succ_node.var['pred_ID']
+        succ_pred_ID = succ_node.pred_ID
         # If there is another node between this Node and the successor, we need to update the
         # successor. There is also a chance that this 'in between node is dead. We need to 
         # account for all of this
-        if succ_pred_ID is not None and succ_pred_ID in nodeDict.keys() and between(self.var['ID'], succ_ID, succ_pred_ID):
-            self.var['finger_table_0'] = succ_pred_ID
+        if succ_pred_ID is not None and succ_pred_ID in nodeDict and between(self.ID, succ_ID, succ_pred_ID):
+            self.finger_table[0] = succ_pred_ID
         # Then, we update our successor list. At this point, we are sure that our successor is alive.
         # The successor list contains our successor's successor, as well as it's successor list (except for
         # the last value).
-        succ_node = nodeDict[self.var['finger_table_0']]
-        self.var['succ_list'] = [succ_node.var['finger_table_0']] + succ_node.var['succ_list'][:-1]
-        # Regardless of whether the successor updates, the Node send a function RPC to the successor
+        succ_node = nodeDict[self.finger_table[0]]
+        self.succ_list = [succ_node.finger_table[0]] + succ_node.succ_list[:-1]
+        # Regardless of whether the successor updates, the Node send a notify RPC to the successor
         # to say that current node is predecessor.
-        kwargs       = {'pot_pred_ID': self.var['ID']}
-        function_RPC = ('notify', kwargs)
-        succ_node.incoming_RPCs.append(('function', function_RPC))
-
+        succ_node.receive_RPC(Notify(self.ID))
 
     '''
     Updates predecessor. The logic is described in the paper.
     Inputs:
-        pot_pred_ID: potential predecessor ID.
+        RPC_message: Notify message. pot_pred_ID is the potential predecessor ID.
     Actions:
         Updates pred_ID if applicable.
     '''
-    def notify(self, pot_pred_ID):
-        if self.var['pred_ID'] is None or between(self.var['pred_ID'], self.var['ID'], pot_pred_ID):
-            self.var['pred_ID'] = pot_pred_ID
+    def notify(self, RPC_message):
+        pot_pred_ID = RPC_message.pot_pred_ID
+        if self.pred_ID is None or between(self.pred_ID, self.ID, pot_pred_ID):
+            self.pred_ID = pot_pred_ID
             # This can only happen if the node is the first node in the Chord ring.
             # Which means the notify is coming from the 2nd node in the ring, which means the
             # predecessor for this Node is also the successor.
-            if self.var['finger_table_0'] == self.var['ID']:
-                self.var['finger_table_0'] = self.var['pred_ID']
+            if self.finger_table[0] == self.ID:
+                self.finger_table[0] = self.pred_ID
                 self.joined = True
 
 
     '''
     Fixes one finger on the finger table. The logic is described in the paper.
-    Inputs:
-        nodeDict: A dictionary that maps IDs to Nodes
     Actions:
         Has itself start a find_predecessor lookup for the relevant finger.
     '''
-    def fix_finger(self, nodeDict):
-        i                = self.var['next']
-        key              = (self.var['ID'] + 2**i) % 2**c.ring_size
-        self.var['next'] = (self.var['next'] + 1) % c.ring_size
-        self.find_successor(self.var['ID'], 'finger_table_{}'.format(i), key, nodeDict)
+    def fix_finger(self, RPC_message):
+        space     = self.space
+        i         = self.next
+        key       = (self.ID + space.finger_offsets[i]) & space.mask
+        self.next = i + 1 if i + 1 < space.m else 0
+        self.find_successor(FindSuccessor(self.ID, i, key))
 
 
     '''
     Checks if the predecessor node still exists. If not, set the ID to None.
-    Inputs:
-        nodeDict: A dictionary that maps IDs to Nodes
     '''
-    def check_pred(self, nodeDict):
-        try:
-            nodeDict[self.var['pred_ID']]
-        except:
-            self.var['pred_ID'] = None
+    def check_pred(self, RPC_message):
+        if self.pred_ID not in self.nodeDict:
+            self.pred_ID = None
+
+
+
+    '''
+    Simply counts number of keys
+    '''
+    def count_keys(self):
+        return len(self.stored_items())
 
+    # Indexed by opcode, in the order the opcodes are defined in Messages.py.
+    handlers = (find_successor, create, join, send_items, stabilize, notify,
+                fix_finger, check_pred, found_key, set_finger, store_items)
 
 def between(ID1, ID2, key):
     if ID1 == ID2:
@@ -0,0 +1,244 @@
+import cProfile
+import csv
+import os
+import sys
+import threading
+import time
+
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from Messages import OP_NAMES
+from Node import ChordNode
+
+# Kinds of dump Profiler can write for every phase.
+DUMPS = ('cprofile', 'sample')
+
+class PhaseTiming:
+    '''
+    Time spent in one named phase of a run, summed over every time it ran. It contains:
+        name:       Name of the phase, e.g. 'join' or 'query'.
+        wall:       Wall-clock seconds.
+        cpu:        CPU seconds of this process.
+        calls:      How many times the phase ran.
+        ticks:      Ticks the ring was advanced by during the phase.
+        node_ticks: Ticks times the number of Nodes on the ring (averaged over the start and
+            end of each run of the phase), i.e. how many Node steps were simulated.
+    '''
+    __slots__ = ('name', 'wall', 'cpu', 'calls', 'ticks', 'node_ticks')
+
+    def __init__(self, name):
+        self.name       = name
+        self.wall       = 0.0
+        self.cpu        = 0.0
+        self.calls      = 0
+        self.ticks      = 0
+        self.node_ticks = 0.0
+
+    '''
+    Node steps simulated per wall-clock second, for comparing engines. 0 if the ring was
+    not advanced.
+    '''
+    @property
+    def node_ticks_per_sec(self):
+        return self.node_ticks / self.wall if self.wall > 0 else 0.0
+
+    def __str__(self):
+        return '{}: {:.3f}s wall, {:.3f}s CPU over {} runs, {} ticks, {:.0f} node-ticks/s'.format(
+            self.name, self.wall, self.cpu, self.calls, self.ticks, self.node_ticks_per_sec)
+
+class StackSampler:
+    '''
+    Sampling profiler: a background thread looks at the stack of the thread that started
+    it every interval seconds, and counts how often each stack comes up. Much cheaper than
+    cProfile on code that makes many small calls, like the tick loop, at the price of only
+    seeing where the time goes statistically. It contains the following:
+        interval: Seconds between samples.
+        stacks:   Counter of stacks, each a tuple of 'file:function' frames, outermost first.
+        thread_ID, thread, running: The thread being sampled and the sampling thread.
+    '''
+    __slots__ = ('interval', 'stacks', 'thread_ID', 'thread', 'running')
+
+    def __init__(self, interval=0.001):
+        self.interval  = interval
+        self.stacks    = Counter()
+        self.thread_ID = None
+        self.thread    = None
+        self.running   = False
+
+    def start(self):
+        self.thread_ID = threading.get_ident()
+        self.running   = True
+        self.thread    = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_ID)
+            stack = []
+            while frame is not None:
+                stack.append('{}:{}'.format(os.path.basename(frame.f_code.co_filename), frame.f_code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    '''
+    Writes the samples in the collapsed format flame graph tools read: one line per stack,
+    its frames joined by semicolons, then the number of samples.
+    '''
+    def dump(self, path):
+        with open(path, 'w') as stack_file:
+            for stack, num in self.stacks.most_common():
+                stack_file.write('{} {}\n'.format(';'.join(stack), num))
+
+class Profiler:
+    '''
+    Opt-in profiling of a simulation run. Wrap each part of the run in phase(name, ring)
+    to get its wall-clock and CPU time and how fast it simulated Nodes (see PhaseTiming).
+    With a dump, every phase is also profiled with cProfile or the StackSampler, and
+    written to profile_dir as <phase>.prof (for pstats or snakeviz) or <phase>.stacks.
+    Phases can be nested, e.g. 'join' inside 'build'; only the outermost one is dumped,
+    since only one profiler can run at a time. time_handlers also counts the calls and the
+    time spent in every RPC handler of every ChordNode in the process, inclusive of
+    whatever the handler calls. It contains the following:
+        phases:          OrderedDict of the PhaseTiming of every phase, in order of first use.
+        dump:            None, or one of DUMPS.
+        profile_dir:     Where the dumps go. Created on the first dump.
+        sample_interval: Seconds between samples of the StackSampler.
+        profiles:        The cProfile.Profile or StackSampler of every phase, by name, so
+            a phase that runs more than once adds up in one dump.
+        handler_time, handler_calls: Seconds spent in, and calls of, the handler of every
+            opcode, indexed by opcode.
+        handlers:        ChordNode.handlers from before time_handlers, or None.
+        depth:           Number of phases running right now.
+    '''
+    __slots__ = ('phases', 'dump', 'profile_dir', 'sample_interval', 'profiles',
+                 'handler_time', 'handler_calls', 'handlers', 'depth')
+
+    def __init__(self, dump=None, profile_dir='profiles', sample_interval=0.001):
+        if dump is not None and dump not in DUMPS:
+            raise ValueError('Unknown dump {!r}, expected one of {}'.format(dump, DUMPS))
+        self.phases          = OrderedDict()
+        self.dump            = dump
+        self.profile_dir     = profile_dir
+        self.sample_interval = sample_interval
+        self.profiles        = {}
+        self.handler_time    = [0.0] * len(OP_NAMES)
+        self.handler_calls   = [0] * len(OP_NAMES)
+        self.handlers        = None
+        self.depth           = 0
+
+    '''
+    Times the body of a with statement as the phase name. ring, if given, is the ChordRing
+    or ArrayRing the phase advances, for counting node-ticks.
+    '''
+    @contextmanager
+    def phase(self, name, ring=None):
+        timing = self.phases.get(name)
+        if timing is None:
+            timing = self.phases[name] = PhaseTiming(name)
+        profile = self.start_dump(name) if self.depth == 0 else None
+        self.depth += 1
+        start_ticks = ring.time if ring is not None else 0
+        start_nodes = ring.num_node if ring is not None else 0
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield timing
+        finally:
+            self.depth -= 1
+            timing.wall  += time.perf_counter() - start_wall
+            timing.cpu   += time.process_time() - start_cpu
+            timing.calls += 1
+            if ring is not None:
+                ticks = ring.time - start_ticks
+                timing.ticks      += ticks
+                timing.node_ticks += ticks * (start_nodes + ring.num_node) / 2
+            self.stop_dump(name, profile)
+
+    def start_dump(self, name):
+        if self.dump is None:
+            return None
+        if self.dump == 'cprofile':
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+            profile.enable()
+        else:
+            profile = self.profiles.setdefault(name, StackSampler(self.sample_interval))
+            profile.start()
+        return profile
+
+    def stop_dump(self, name, profile):
+        if profile is None:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        if self.dump == 'cprofile':
+            profile.disable()
+            profile.dump_stats(os.path.join(self.profile_dir, '{}.prof'.format(name)))
+        else:
+            profile.stop()
+            profile.dump(os.path.join(self.profile_dir, '{}.stacks'.format(name)))
+
+    '''
+    Starts timing the RPC handlers, by swapping ChordNode.handlers for timed wrappers.
+    restore_handlers swaps the originals back.
+    '''
+    def time_handlers(self):
+        if self.handlers is not None:
+            return
+        self.handlers = ChordNode.handlers
+        ChordNode.handlers = tuple(self.timed(op, handler) for op, handler in enumerate(self.handlers))
+
+    def restore_handlers(self):
+        if self.handlers is not None:
+            ChordNode.handlers = self.handlers
+            self.handlers = None
+
+    def timed(self, op, handler):
+        handler_time, handler_calls = self.handler_time, self.handler_calls
+        def timed_handler(node, RPC_message):
+            start = time.perf_counter()
+            try:
+                return handler(node, RPC_message)
+            finally:
+                handler_time[op]  += time.perf_counter() - start
+                handler_calls[op] += 1
+        return timed_handler
+
+    '''
+    node_ticks_per_sec of phase name, 0 if it never ran.
+    '''
+    def node_ticks_per_sec(self, name):
+        timing = self.phases.get(name)
+        return timing.node_ticks_per_sec if timing is not None else 0.0
+
+    '''
+    Every timing as (kind, name, calls, wall, cpu, ticks, node_ticks_per_sec) rows: one
+    per phase, then one per RPC handler that was called (with no CPU time or ticks).
+    '''
+    def rows(self):
+        for timing in self.phases.values():
+            yield ('phase', timing.name, timing.calls, timing.wall, timing.cpu, timing.ticks, timing.node_ticks_per_sec)
+        for op, name in enumerate(OP_NAMES):
+            if self.handler_calls[op]:
+                yield ('handler', name, self.handler_calls[op], self.handler_time[op], '', '', '')
+
+    '''
+    Writes rows() to a csv file at path, with a header.
+    '''
+    def write_csv(self, path):
+        with open(path, 'w') as profile_file:
+            wr = csv.writer(profile_file)
+            wr.writerow(['kind', 'name', 'calls', 'wall', 'cpu', 'ticks', 'node_ticks_per_sec'])
+            wr.writerows(self.rows())
+
+    def __str__(self):
+        to_print = '\n'.join(str(timing) for timing in self.phases.values())
+        for op, name in enumerate(OP_NAMES):
+            if self.handler_calls[op]:
+                to_print += '\n{}: {} calls, {:.3f}s, {:.2f}us per call'.format(name, self.handler_calls[op],
+                    self.handler_time[op], 1e6 * self.handler_time[op] / self.handler_calls[op])
+        return to_print
@@ -0,0 +1,432 @@
+import bisect
+import numpy as np
+import os
+import shutil
+import tempfile
+import weakref
+
+class Storage:
+    '''
+    The items a Node stores. Reads look like a read-only dict: len, in, [], get, iteration
+    over the keys, keys and items. Items move between Nodes through take_outside and
+    take_all, which hand back (keys, values) with the keys sorted, and through
+    store_sorted on the receiving end, so every backend can move them as whole blocks.
+    Subclasses implement:
+        __len__, __contains__, __getitem__, keys, items
+        store(k, v):               Stores a single item.
+        store_sorted(keys, values): Stores a block of items with sorted, distinct keys.
+        take_outside(lo, hi):       Removes and returns the items whose key is not
+            between(lo, hi, key), i.e. outside of (lo, hi] on the ring.
+        take_all():                 Removes and returns every item.
+    '''
+    __slots__ = ()
+
+    def get(self, k, default=None):
+        try:
+            return self[k]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    '''
+    Gives back whatever the storage holds outside of the Python heap. Called when its Node
+    leaves the ring.
+    '''
+    def release(self):
+        pass
+
+class DictStorage(Storage):
+    '''
+    Plain dictionary from keys to values. Handing items over has to look at every key,
+    so it is only meant for comparisons. It contains the following:
+        items_dict: The dictionary.
+    '''
+    __slots__ = ('items_dict',)
+
+    def __init__(self):
+        self.items_dict = {}
+
+    def __len__(self):
+        return len(self.items_dict)
+
+    def __contains__(self, k):
+        return k in self.items_dict
+
+    def __getitem__(self, k):
+        return self.items_dict[k]
+
+    def keys(self):
+        return self.items_dict.keys()
+
+    def items(self):
+        return self.items_dict.items()
+
+    def store(self, k, v):
+        self.items_dict[k] = v
+
+    def store_sorted(self, keys, values):
+        self.items_dict.update(zip(keys, values))
+
+    def take_outside(self, lo, hi):
+        # between(lo, hi, k), inlined since Node.py imports this module
+        if lo == hi:
+            inside = lambda k: True
+        elif lo < hi:
+            inside = lambda k: lo < k <= hi
+        else:
+            inside = lambda k: k > lo or k <= hi
+        keys = sorted(k for k in self.items_dict if not inside(k))
+        return keys, [self.items_dict.pop(k) for k in keys]
+
+    def take_all(self):
+        keys = sorted(self.items_dict)
+        values = [self.items_dict[k] for k in keys]
+        self.items_dict = {}
+        return keys, values
+
+class SortedStorage(Storage):
+    '''
+    Items kept sorted by key in two Python lists, so that the keys a Node hands over when
+    a predecessor joins (or that it hands to its successor when it leaves) are found with
+    two binary searches and cut out as one slice. Works for any key width and any values.
+    It contains the following:
+        sorted_keys:   The keys, in sorted order.
+        sorted_values: sorted_values[i] is the value of sorted_keys[i].
+        pending:       Items stored one at a time since the last sorted operation. Inserting
+            them into the sorted lists right away would shift the whole lists every time, so
+            they are sorted in as one block when the order is needed. Their keys are never
+            also in sorted_keys.
+    '''
+    __slots__ = ('sorted_keys', 'sorted_values', 'pending')
+
+    def __init__(self):
+        self.sorted_keys   = []
+        self.sorted_values = []
+        self.pending       = {}
+
+    def __len__(self):
+        return len(self.sorted_keys) + len(self.pending)
+
+    def __contains__(self, k):
+        if k in self.pending:
+            return True
+        ind = bisect.bisect_left(self.sorted_keys, k)
+        return ind < len(self.sorted_keys) and self.sorted_keys[ind] == k
+
+    def __getitem__(self, k):
+        if k in self.pending:
+            return self.pending[k]
+        ind = bisect.bisect_left(self.sorted_keys, k)
+        if ind < len(self.sorted_keys) and self.sorted_keys[ind] == k:
+            return self.sorted_values[ind]
+        raise KeyError(k)
+
+    '''
+    The keys in sorted order. The list belongs to the storage, so do not change it.
+    '''
+    def keys(self):
+        self.flush()
+        return self.sorted_keys
+
+    def items(self):
+        self.flush()
+        return zip(self.sorted_keys, self.sorted_values)
+
+    '''
+    Stores a single item. A new key only goes into pending, see flush.
+    '''
+    def store(self, k, v):
+        ind = bisect.bisect_left(self.sorted_keys, k)
+        if ind < len(self.sorted_keys) and self.sorted_keys[ind] == k:
+            self.sorted_values[ind] = v
+        else:
+            self.pending[k] = v
+
+    '''
+    A block that falls between two neighbouring keys is inserted as one slice; a block
+    that interleaves with the stored keys is merged with just the part it overlaps.
+    '''
+    def store_sorted(self, keys, values):
+        if len(keys) == 0:
+            return
+        self.flush()
+        self.insert_block(list(keys), list(values))
+
+    '''
+    Sorts the pending items into sorted_keys and sorted_values.
+    '''
+    def flush(self):
+        if not self.pending:
+            return
+        block        = sorted(self.pending.items())
+        self.pending = {}
+        self.insert_block([k for k, v in block], [v for k, v in block])
+
+    def insert_block(self, keys, values):
+        sorted_keys = self.sorted_keys
+        start = bisect.bisect_left(sorted_keys, keys[0])
+        end   = bisect.bisect_right(sorted_keys, keys[-1], start)
+        if start == end:
+            sorted_keys[start:start]        = keys
+            self.sorted_values[start:start] = values
+            return
+        merged = dict(zip(sorted_keys[start:end], self.sorted_values[start:end]))
+        merged.update(zip(keys, values))
+        merged_keys = sorted(merged)
+        sorted_keys[start:end]        = merged_keys
+        self.sorted_values[start:end] = [merged[k] for k in merged_keys]
+
+    '''
+    The keys outside of (lo, hi] are either one slice of the sorted keys, or (when
+    (lo, hi] does not wrap around) a slice at each end; either way they come back sorted.
+    '''
+    def take_outside(self, lo, hi):
+        if lo == hi:
+            return [], []
+        self.flush()
+        sorted_keys, sorted_values = self.sorted_keys, self.sorted_values
+        lo_ind = bisect.bisect_right(sorted_keys, lo)
+        hi_ind = bisect.bisect_right(sorted_keys, hi)
+        if lo > hi:
+            keys   = sorted_keys[hi_ind:lo_ind]
+            values = sorted_values[hi_ind:lo_ind]
+            del sorted_keys[hi_ind:lo_ind], sorted_values[hi_ind:lo_ind]
+            return keys, values
+        keys   = sorted_keys[:lo_ind] + sorted_keys[hi_ind:]
+        values = sorted_values[:lo_ind] + sorted_values[hi_ind:]
+        self.sorted_keys   = sorted_keys[lo_ind:hi_ind]
+        self.sorted_values = sorted_values[lo_ind:hi_ind]
+        return keys, values
+
+    def take_all(self):
+        self.flush()
+        keys, values = self.sorted_keys, self.sorted_values
+        self.sorted_keys, self.sorted_values = [], []
+        return keys, values
+
+class ArrayStorage(Storage):
+    '''
+    Items kept sorted by key in two int64 NumPy arrays, at 16 bytes an item. Keys and
+    values both have to be integers that fit in int64, which the drivers' (key, key) items
+    do on rings up to 63 bits wide. Blocks are moved with the same two binary searches as
+    SortedStorage. It contains the following:
+        key_buf, value_buf: Arrays with room for capacity items. The first count entries
+            hold the items, sorted by key; the rest is spare room, so that inserting does
+            not reallocate every time.
+        count:   Number of items in the sorted part.
+        pending: Items stored one at a time, like in SortedStorage.
+    '''
+    __slots__ = ('key_buf', 'value_buf', 'count', 'pending')
+
+    def __init__(self):
+        self.key_buf, self.value_buf = self.allocate(0)
+        self.count   = 0
+        self.pending = {}
+
+    '''
+    Returns new key and value buffers with room for capacity items.
+    '''
+    def allocate(self, capacity):
+        return np.empty(capacity, dtype=np.int64), np.empty(capacity, dtype=np.int64)
+
+    '''
+    Makes room for at least capacity items, at least doubling the buffers so that growing
+    one item at a time stays amortized O(1).
+    '''
+    def reserve(self, capacity):
+        if capacity <= len(self.key_buf):
+            return
+        key_buf, value_buf = self.allocate(max(capacity, 2 * len(self.key_buf), 16))
+        key_buf[:self.count]   = self.key_buf[:self.count]
+        value_buf[:self.count] = self.value_buf[:self.count]
+        self.replace_buffers(key_buf, value_buf)
+
+    def replace_buffers(self, key_buf, value_buf):
+        self.key_buf, self.value_buf = key_buf, value_buf
+
+    def find(self, k):
+        ind = int(np.searchsorted(self.key_buf[:self.count], k))
+        if ind < self.count and self.key_buf[ind] == k:
+            return ind
+        return None
+
+    def __len__(self):
+        return self.count + len(self.pending)
+
+    def __contains__(self, k):
+        return k in self.pending or self.find(k) is not None
+
+    def __getitem__(self, k):
+        if k in self.pending:
+            return self.pending[k]
+        ind = self.find(k)
+        if ind is None:
+            raise KeyError(k)
+        return int(self.value_buf[ind])
+
+    def keys(self):
+        self.flush()
+        return self.key_buf[:self.count].tolist()
+
+    def items(self):
+        self.flush()
+        return zip(self.key_buf[:self.count].tolist(), self.value_buf[:self.count].tolist())
+
+    def store(self, k, v):
+        ind = self.find(k)
+        if ind is None:
+            self.pending[k] = v
+        else:
+            self.value_buf[ind] = v
+
+    def store_sorted(self, keys, values):
+        if len(keys) == 0:
+            return
+        self.flush()
+        self.insert_block(np.asarray(keys, dtype=np.int64), np.asarray(values, dtype=np.int64))
+
+    def flush(self):
+        if not self.pending:
+            return
+        keys   = np.fromiter(self.pending, dtype=np.int64, count=len(self.pending))
+        values = np.fromiter(self.pending.values(), dtype=np.int64, count=len(self.pending))
+        self.pending = {}
+        order = np.argsort(keys)
+        self.insert_block(keys[order], values[order])
+
+    '''
+    Replaces the items in [start, end) with the given ones, shifting everything after
+    them. Overlapping NumPy copies are safe, so the shift happens in place.
+    '''
+    def splice(self, start, end, keys, values):
+        count   = self.count
+        new_end = start + len(keys)
+        self.reserve(count - (end - start) + len(keys))
+        key_buf, value_buf = self.key_buf, self.value_buf
+        key_buf[new_end:new_end + count - end]   = key_buf[end:count]
+        value_buf[new_end:new_end + count - end] = value_buf[end:count]
+        key_buf[start:new_end]   = keys
+        value_buf[start:new_end] = values
+        self.count = new_end + count - end
+
+    def insert_block(self, keys, values):
+        sorted_keys = self.key_buf[:self.count]
+        start = int(np.searchsorted(sorted_keys, keys[0], side='left'))
+        end   = int(np.searchsorted(sorted_keys, keys[-1], side='right'))
+        if start == end:
+            self.splice(start, end, keys, values)
+            return
+        # the block wins over the stored items it collides with
+        merged_keys   = np.concatenate((sorted_keys[start:end], keys))
+        merged_values = np.concatenate((self.value_buf[start:end], values))
+        order = np.argsort(merged_keys, kind='stable')
+        merged_keys, merged_values = merged_keys[order], merged_values[order]
+        last = np.append(merged_keys[1:] != merged_keys[:-1], True)
+        self.splice(start, end, merged_keys[last], merged_values[last])
+
+    def take_outside(self, lo, hi):
+        if lo == hi:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        self.flush()
+        count  = self.count
+        lo_ind = int(np.searchsorted(self.key_buf[:count], lo, side='right'))
+        hi_ind = int(np.searchsorted(self.key_buf[:count], hi, side='right'))
+        if lo > hi:
+            keys   = self.key_buf[hi_ind:lo_ind].copy()
+            values = self.value_buf[hi_ind:lo_ind].copy()
+            self.splice(hi_ind, lo_ind, keys[:0], values[:0])
+            return keys, values
+        keys   = np.concatenate((self.key_buf[:lo_ind], self.key_buf[hi_ind:count]))
+        values = np.concatenate((self.value_buf[:lo_ind], self.value_buf[hi_ind:count]))
+        kept   = hi_ind - lo_ind
+        self.key_buf[:kept]   = self.key_buf[lo_ind:hi_ind]
+        self.value_buf[:kept] = self.value_buf[lo_ind:hi_ind]
+        self.count = kept
+        return keys, values
+
+    def take_all(self):
+        self.flush()
+        keys   = self.key_buf[:self.count].copy()
+        values = self.value_buf[:self.count].copy()
+        self.count = 0
+        return keys, values
+
+class MemmapStorage(ArrayStorage):
+    '''
+    ArrayStorage whose buffers are memory-mapped files, so a ring can hold more items than
+    fit in memory and the OS pages them in and out as Nodes touch them. Each Node gets its
+    own pair of files in directory; growing writes a new, larger pair and deletes the old
+    one. It contains the following, besides what ArrayStorage has:
+        directory:  Where the files go.
+        name:       Prefix of the file names, e.g. node_42.
+        generation: Bumped every time the buffers are reallocated, to name the new files.
+        paths:      Files behind the current buffers (none while they are empty).
+    '''
+    __slots__ = ('directory', 'name', 'generation', 'paths')
+
+    def __init__(self, directory, name):
+        self.directory  = directory
+        self.name       = name
+        self.generation = 0
+        self.paths      = ()
+        ArrayStorage.__init__(self)
+
+    def allocate(self, capacity):
+        if capacity == 0:
+            # np.memmap cannot map an empty file
+            return ArrayStorage.allocate(self, 0)
+        self.generation += 1
+        prefix = os.path.join(self.directory, '{}_{}'.format(self.name, self.generation))
+        return tuple(np.memmap(prefix + suffix, dtype=np.int64, mode='w+', shape=(capacity,))
+                     for suffix in ('_keys.bin', '_values.bin'))
+
+    def replace_buffers(self, key_buf, value_buf):
+        old_paths = self.paths
+        self.key_buf, self.value_buf = key_buf, value_buf
+        self.paths = (key_buf.filename, value_buf.filename) if isinstance(key_buf, np.memmap) else ()
+        for path in old_paths:
+            os.remove(path)
+
+    '''
+    Drops every item and deletes the files.
+    '''
+    def release(self):
+        self.pending = {}
+        self.count   = 0
+        self.replace_buffers(*ArrayStorage.allocate(self, 0))
+
+# Storage backends by name, for ChordRing(storage=...).
+BACKENDS = {'dict': DictStorage, 'sorted': SortedStorage, 'array': ArrayStorage, 'memmap': MemmapStorage}
+
+'''
+Makes a new directory for the memory-mapped storage of owner (a ring), inside parent if
+given and the system's temporary directory otherwise, and returns its path. Every ring
+gets a directory of its own, so rings sharing a parent cannot overwrite each other's
+files, and the directory is deleted along with everything in it once owner is garbage
+collected (or at exit, whichever comes first).
+'''
+def storage_directory(owner, parent=None):
+    if parent is not None:
+        os.makedirs(parent, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix='chord_storage_', dir=parent)
+    weakref.finalize(owner, shutil.rmtree, directory, ignore_errors=True)
+    return directory
+
+'''
+Returns a function that makes the storage for the Node with a given ID, using the named
+backend. Memory-mapped storage puts its files in directory, or in a new temporary
+directory if there is none. Nothing deletes the directory; rings get one that is cleaned
+up for them from storage_directory.
+'''
+def storage_factory(backend='sorted', directory=None):
+    if backend not in BACKENDS:
+        raise ValueError('Unknown storage backend {!r}, expected one of {}'.format(backend, sorted(BACKENDS)))
+    if backend != 'memmap':
+        cls = BACKENDS[backend]
+        return lambda ID: cls()
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='chord_storage_')
+    os.makedirs(directory, exist_ok=True)
+    return lambda ID: MemmapStorage(directory, 'node_{}'.format(ID))
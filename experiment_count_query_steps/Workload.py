@@ -0,0 +1,164 @@
+import numpy as np
+import random
+
+from IDSpace import DEFAULT_SPACE
+
+POPULARITIES = ('uniform', 'zipf', 'hotspot')
+
+class Workload:
+    '''
+    Seeded source of item keys and lookup streams for the experiments. Keys are drawn in
+    NumPy batches instead of one Python call at a time. It contains the following:
+        space: IDSpace the keys come from, normally the ring's (chord.space).
+        rng:   NumPy Generator everything is drawn from. Without an explicit seed it is
+            seeded from the random module, so random.seed(...) still makes a run repeatable.
+    '''
+    def __init__(self, space=DEFAULT_SPACE, seed=None):
+        self.space = space
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.rng = np.random.default_rng(seed)
+
+    '''
+    Returns count keys drawn with replacement, so the same key can come up more than once.
+    '''
+    def keys(self, count):
+        if self.space.m > 62:
+            return np.array([self.space.random_ID() for i in range(count)], dtype=object)
+        return self.rng.integers(0, self.space.size, count, dtype=np.int64)
+
+    '''
+    Returns count distinct keys, in random order, in O(count) expected time. Spaces that
+    would be more than half full are permuted outright; otherwise keys are drawn in batches
+    and duplicates thrown away, which wastes less than half of each batch. Spaces too wide
+    for int64 fall back to IDSpace.unused_ID and an object array.
+    '''
+    def unique_keys(self, count):
+        if count > self.space.size:
+            raise ValueError('Cannot draw {} distinct keys from {} IDs'.format(count, self.space.size))
+        if self.space.m > 62:
+            keys = set()
+            while len(keys) < count:
+                keys.add(self.space.unused_ID(keys))
+            keys = np.array(list(keys), dtype=object)
+            self.rng.shuffle(keys)
+            return keys
+        if 2 * count > self.space.size:
+            return self.rng.permutation(self.space.size)[:count]
+        keys = np.empty(0, dtype=np.int64)
+        while len(keys) < count:
+            draws = self.rng.integers(0, self.space.size, 2 * (count - len(keys)), dtype=np.int64)
+            keys  = np.sort(np.concatenate((keys, draws)))
+            keys  = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        # sorting put the keys in order, so shuffle before cutting the surplus off
+        return self.rng.permutation(keys)[:count]
+
+    '''
+    Returns a rows x count matrix, each row of which holds count distinct keys in sorted
+    order, e.g. the IDs of many independent rings. Every row draws a few more keys than it
+    needs at once and keeps the first count distinct ones, which are a uniform sample
+    without replacement. Rows that come up short, and spaces that would be more than half
+    full, go through unique_keys one row at a time.
+    '''
+    def unique_key_rows(self, rows, count):
+        size = self.space.size
+        if count > size:
+            raise ValueError('Cannot draw {} distinct keys from {} IDs'.format(count, size))
+        if self.space.m > 62:
+            raise ValueError('Rows of keys are int64, so ring_size {} is too wide'.format(self.space.m))
+        keys = np.empty((rows, count), dtype=np.int64)
+        short = np.arange(rows)
+        if 2 * count <= size and count > 0:
+            # n draws give size * (1 - exp(-n / size)) distinct keys on average
+            num_draws = int(-size * np.log1p(-count / size) * 1.05) + 16
+            draws = self.rng.integers(0, size, (rows, num_draws), dtype=np.int64)
+            # Sort by key and then by draw, so the first of equal keys is the earliest draw.
+            if (size - 1) * num_draws < 1 << 63:
+                in_order, order = np.divmod(np.sort(draws * num_draws + np.arange(num_draws), axis=1), num_draws)
+            else:
+                order    = np.argsort(draws, axis=1, kind='stable')
+                in_order = np.take_along_axis(draws, order, axis=1)
+            first = np.empty(draws.shape, dtype=bool)
+            np.put_along_axis(first, order, np.concatenate(
+                (np.ones((rows, 1), dtype=bool), in_order[:, 1:] != in_order[:, :-1]), axis=1), axis=1)
+            taken  = first & (np.cumsum(first, axis=1) <= count)
+            enough = taken.sum(axis=1) == count
+            keys[enough] = draws[enough][taken[enough]].reshape(-1, count)
+            short = np.flatnonzero(~enough)
+        for row in short.tolist():
+            keys[row] = self.unique_keys(count)
+        return np.sort(keys, axis=1)
+
+    '''
+    Yields the keys of unique_keys(count) in batches of at most batch_size, e.g. to feed
+    ChordRing.add_item without holding a Python list of every key.
+    '''
+    def key_batches(self, count, batch_size=65536):
+        keys = self.unique_keys(count)
+        for start in range(0, count, batch_size):
+            yield keys[start:start + batch_size]
+
+    '''
+    Returns count lookup keys drawn from keys (with replacement), by popularity:
+        uniform: Every key is equally likely.
+        zipf:    The key of popularity rank r is looked up with probability proportional to
+            1 / r**s. Ranks are dealt out at random, so popular keys are spread over the ring.
+        hotspot: A hot_fraction of the keys gets hot_share of the lookups, and the rest is
+            spread evenly over the other keys.
+    '''
+    def queries(self, keys, count, popularity='uniform', s=1.0, hot_fraction=0.1, hot_share=0.9):
+        keys = np.asarray(keys)
+        if len(keys) == 0:
+            raise ValueError('No keys to query')
+        if popularity == 'uniform':
+            return keys[self.rng.integers(0, len(keys), count)]
+        if popularity == 'zipf':
+            weights = 1.0 / np.arange(1, len(keys) + 1) ** s
+        elif popularity == 'hotspot':
+            num_hot = max(1, int(len(keys) * hot_fraction))
+            weights = np.full(len(keys), (1 - hot_share) / max(1, len(keys) - num_hot))
+            weights[:num_hot] = hot_share / num_hot
+        else:
+            raise ValueError('Unknown popularity {!r}, expected one of {}'.format(popularity, POPULARITIES))
+        cdf   = np.cumsum(weights)
+        ranks = np.searchsorted(cdf, self.rng.random(count) * cdf[-1], side='right')
+        ranks = np.minimum(ranks, len(keys) - 1)
+        return keys[self.rng.permutation(len(keys))[ranks]]
+
+    '''
+    Like queries, but never ends: yields one key at a time, drawing batch_size of them
+    whenever it runs out.
+    '''
+    def query_stream(self, keys, popularity='uniform', batch_size=4096, **params):
+        while True:
+            for key in self.queries(keys, batch_size, popularity, **params).tolist():
+                yield key
+
+'''
+Lazily replays the keys in a trace file, one line at a time, so traces of any length can
+be used. A line's key is its last whitespace separated field, in decimal or in hex with
+a 0x prefix; empty lines and lines starting with # are skipped. Keys are taken modulo
+the size of space.
+'''
+def replay_trace(path, space=DEFAULT_SPACE):
+    with open(path) as trace:
+        for line in trace:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            key = fields[-1]
+            yield (int(key, 16) if key.lower().startswith('0x') else int(key)) & space.mask
+
+'''
+Groups the keys of any iterable (say, replay_trace) into NumPy arrays of at most
+batch_size keys.
+'''
+def batches(keys, batch_size=65536):
+    batch = []
+    for key in keys:
+        batch.append(key)
+        if len(batch) == batch_size:
+            yield np.array(batch)
+            batch = []
+    if batch:
+        yield np.array(batch)
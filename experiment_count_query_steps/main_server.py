@@ -1,95 +1,155 @@
+from ArrayRing import ArrayRing
 from ChordRing import ChordRing
+from Log import LOG
+from Profiler import Profiler
+from SnapshotCache import SnapshotCache
+from Stats import StreamingStats, QUANTILES
+from Workload import Workload, replay_trace
+from itertools import islice
 import constants as c
 import random
-from statistics import mean 
 import argparse
 import os
 import csv
+import numpy as np
 verbose = False
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-k", type = int)
 parser.add_argument("-n", type = int)
 parser.add_argument("-i", type = int)
+parser.add_argument("--engine", default = "event", choices = ["event", "worklist", "round_robin", "array"],
+                    help = "which engine simulates the ring; array keeps all ring state in NumPy arrays")
+parser.add_argument("--snapshot_dir", default = "ring_snapshots",
+                    help = "where stabilized rings are cached between runs")
+parser.add_argument("--popularity", default = "uniform", choices = ["uniform", "zipf", "hotspot"],
+                    help = "how lookups are spread over the stored keys")
+parser.add_argument("--trace", default = None,
+                    help = "file of keys to look up instead of drawing them (one per line, last field)")
+parser.add_argument("--num_queries", type = int, default = 1000)
+parser.add_argument("--oracle", action = "store_true",
+                    help = "route the lookups over the stabilized finger tables in one batch instead of ticking the ring")
+parser.add_argument("--watch_load", action = "store_true",
+                    help = "sample mailbox depths while querying and report the busiest nodes")
+parser.add_argument("--profile", action = "store_true",
+                    help = "also time every RPC handler and print the timings of every phase")
+parser.add_argument("--profile_dump", default = None, choices = ["cprofile", "sample"],
+                    help = "write a cProfile or sampling profile of every phase to --profile_dir")
+parser.add_argument("--profile_dir", default = "profiles")
+parser.add_argument("--log_level", default = "info", choices = ["debug", "info", "warning", "error", "off"],
+                    help = "debug also prints every lookup and the whole ring; warning keeps large sweeps quiet")
+parser.add_argument("--events", default = None,
+                    help = "write structured events (joins, departures, lookups) here as JSON lines, gzipped if it ends in .gz")
+parser.add_argument("--event_sample", type = float, default = 1.0, help = "fraction of the events to keep")
 args = parser.parse_args()
+if args.watch_load and (args.oracle or args.engine == 'array'):
+    parser.error('--watch_load needs the lookups to go through the mailboxes of a ChordRing')
 print(args)
+LOG.configure(args.log_level, args.events, args.event_sample)
 num_keys = args.k
 num_nodes = args.n
 iteration = args.i
 output_path = "result_dump"
-
-def rand_key():
-    return random.randint(0, 2 ** c.ring_size)
-
-# RMB: necessary, really
-def rand_key_without_replacement(currentKeyList):
-    allChoices = set([x for x in range(2 ** c.ring_size)])
-    return random.choice(list(allChoices - set(currentKeyList)))
-
-# RMB: added below to avoid many collisions when number of nodes approaches ring size
-def rand_address(nodeList):
-    allChoices = set([x for x in range(2 ** c.ring_size)])
-    return random.choice(list(allChoices - set(nodeList)))
-
+snapshots = SnapshotCache(args.snapshot_dir)
+profiler = Profiler(args.profile_dump, args.profile_dir)
+if args.profile:
+    profiler.time_handlers()
+
+def new_ring():
+    if args.engine == 'array':
+        return ArrayRing()
+    return ChordRing(engine=args.engine)
+
+# Lookups either follow --popularity over the stored keys or replay --trace.
+def query_keys(workload, keys, num_queries):
+    if args.trace is not None:
+        return islice(replay_trace(args.trace, workload.space), num_queries)
+    return workload.queries(keys, num_queries, args.popularity).tolist()
 
 # RMB: added this function to test average number of steps following query.
 #variables input through argparser in main_server.py, but not here
 
-def return_query_steps(num_keys, num_nodes):
+# Builds a ring of num_nodes nodes (plus the first one) through the join protocol and lets
+# it stabilize. Only runs once per (num_nodes, seed); after that the snapshot is loaded.
+def build_ring(num_nodes):
     num_steps_between_new_nodes = 20 * c.max_offset
 
-    num_queries = 1000
-    steps_between_query = 1
     # initialize ring
-    chord = ChordRing()
-    chord.add_node(rand_key())
-
-   # RMB: now take key without replacement
-    keyList = []
-    for i in range(num_keys):
-        key = rand_key_without_replacement(keyList)
-        keyList.append(key)
-        chord.add_item((key, key))
-
-    keyList = None
+    chord = new_ring()
+    chord.add_node(chord.unused_ID())
 
     # add nodes
-    for i in range(num_nodes * num_steps_between_new_nodes):
-        if i % (num_steps_between_new_nodes) == 0:
+    with profiler.phase('join', chord):
+        for i in range(num_nodes):
             try:
-                chord.add_node(rand_address(chord.nodeList))
+                chord.add_node(chord.unused_ID())
             except Exception as e:
                 print('no more names to allocate (more nodes than chord size?): {}'.format(e))
-        chord.advance_all_one_step()
-    for i in range(c.max_offset*100):
-        chord.advance_all_one_step()
+            chord.advance(num_steps_between_new_nodes)
+        steps = chord.run_until(type(chord).is_converged, c.max_offset*100, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
     chord.stop_periodic=True
     print('No longer adding')
 
     # stabliize and check correctness
-    for i in range(c.max_offset*200):
-        chord.advance_all_one_step()
-    print(chord)
-    chord.check_correctness()
-
-    # query
-    for i in range(num_queries * steps_between_query):
-        if i % (steps_between_query) == 0:
-            item_key = random.sample(chord.item_keys, 1)[0]
-            chord.query_item(item_key)
-        chord.advance_all_one_step(verbose=verbose)
-
-    # to make sure all have cleared (max transit should be one time round)
-    for i in range(num_queries * c.ring_size):
-        chord.advance_all_one_step(verbose=verbose)
-    average_steps = mean(chord.step_tracker)
-    print('\n Average number of steps was {} for {} nodes with {} keys total!'.format(average_steps,
+    with profiler.phase('stabilize', chord):
+        steps = chord.run_until(type(chord).is_converged, c.max_offset*200, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
+    return chord
+
+def return_query_steps(num_keys, num_nodes, iteration):
+    num_queries = args.num_queries
+    steps_between_query = 1
+    # the topology only depends on the node count and iteration, so it is shared by every key count
+    with profiler.phase('build'):
+        chord = snapshots.load_or_build(num_nodes, iteration, build_ring, args.engine)
+    workload = Workload(chord.space)
+
+   # RMB: now take key without replacement
+    with profiler.phase('add_items', chord):
+        keys = workload.unique_keys(num_keys)
+        chord.add_items(zip(keys.tolist(), keys.tolist()))
+
+    LOG.debug('{}', chord)
+    with profiler.phase('check', chord):
+        chord.check_correctness()
+    # only count the traffic of the lookups
+    chord.metrics.reset()
+
+    if args.oracle:
+        # Hop counts only depend on the routing tables, so the lookups can all be routed at once.
+        with profiler.phase('query', chord):
+            result = chord.route_lookups(np.array(list(query_keys(workload, keys, num_queries))))
+        print(result)
+        hop_stats = StreamingStats()
+        hop_stats.add_many(result.hops[result.correct])
+    else:
+        if args.watch_load:
+            chord.watch_load()
+        # query
+        with profiler.phase('query', chord):
+            for item_key in query_keys(workload, keys, num_queries):
+                chord.query_item(item_key)
+                chord.advance(steps_between_query, verbose=verbose)
+
+            # to make sure all have cleared (max transit should be one time round)
+            steps = chord.run_until_idle(num_queries * c.ring_size, verbose=verbose)
+        print('All queries resolved after {} steps'.format(steps))
+        hop_stats = chord.step_tracker
+        if args.watch_load:
+            print(chord.load_monitor.end_phase('query'))
+    print('\n Average number of steps was {} for {} nodes with {} keys total!'.format(hop_stats.mean,
         num_nodes, num_keys))
-    return average_steps
+    print(hop_stats)
+    print(chord.metrics)
+    print(profiler)
+    return hop_stats, chord.metrics
 
 # helper function to write to csv file. variables input through parser in header of main_server.py, but not here
 def output_steps(num_keys, num_nodes, iteration, output_path):
-    trial_steps = [num_keys, num_nodes, return_query_steps(num_keys, num_nodes), iteration]
+    hop_stats, metrics = return_query_steps(num_keys, num_nodes, iteration)
+    trial_steps = [num_keys, num_nodes, hop_stats.mean, iteration] + [hop_stats.quantile(q) for q in QUANTILES] + [hop_stats.max,
+        profiler.node_ticks_per_sec('query')]
 
     # we are saving here
     path_string ='{}/count_steps_keys_{}_nodes_{}_iter_{}'.format(output_path, num_keys, num_nodes, iteration)
@@ -101,9 +161,14 @@ def output_steps(num_keys, num_nodes, iteration, output_path):
     # dump to csv
     with open(path_string, 'w') as myfile:
        wr = csv.writer(myfile)
-       wr.writerow(['num_keys', 'num_nodes', 'num_steps', 'iteration'])
+       wr.writerow(['num_keys', 'num_nodes', 'num_steps', 'iteration', 'p50_steps', 'p90_steps', 'p99_steps', 'max_steps', 'node_ticks_per_sec'])
        wr.writerow(trial_steps)
 
+    # message counts, bytes and mailbox depths of the lookups, next to the steps
+    metrics.write_csv('{}/metrics_keys_{}_nodes_{}_iter_{}'.format(output_path, num_keys, num_nodes, iteration))
+    profiler.write_csv('{}/profile_keys_{}_nodes_{}_iter_{}'.format(output_path, num_keys, num_nodes, iteration))
+
 if __name__ == "__main__":
     # input variables fed in through parser	
     output_steps(num_keys, num_nodes, iteration, "result_dump")
+    LOG.close()
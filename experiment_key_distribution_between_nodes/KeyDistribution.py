@@ -0,0 +1,66 @@
+import numpy as np
+
+from IDSpace import DEFAULT_SPACE
+from Workload import Workload
+
+# Roughly how many IDs and keys random_ring_distributions handles at once.
+CHUNK_SIZE = 1 << 22
+
+'''
+Number of keys each Node is responsible for on a converged ring, worked out from the IDs
+alone: a key belongs to the first ID at or after it, wrapping around to the first ID.
+Returns counts in the order of the sorted IDs, so it lines up with
+ChordRing.return_key_distribution on a ring that holds exactly those keys.
+'''
+def ownership_counts(IDs, keys):
+    sorted_IDs = np.sort(np.asarray(IDs))
+    if len(sorted_IDs) == 0:
+        raise ValueError('Cannot distribute keys over an empty ring')
+    keys = np.asarray(keys)
+    if len(keys) == 0:
+        return np.zeros(len(sorted_IDs), dtype=np.int64)
+    owners = np.searchsorted(sorted_IDs, keys) % len(sorted_IDs)
+    return np.bincount(owners, minlength=len(sorted_IDs))
+
+'''
+Ownership counts of num_rings independent random rings, each with num_nodes distinct
+Node IDs and num_keys distinct keys drawn from space, as a num_rings x num_nodes matrix
+whose rows are in order of the sorted IDs of each ring. Ring r is shifted up by r * size,
+which lays a chunk of rings out one after another on a single number line, so one
+searchsorted finds the owners of all of their keys. workload draws the IDs and keys; a
+new one, seeded from the random module, if not given.
+'''
+def random_ring_distributions(num_rings, num_nodes, num_keys, space=DEFAULT_SPACE, workload=None):
+    if space.m > 62:
+        raise ValueError('Batches of rings keep IDs as int64, so ring_size {} is too wide'.format(space.m))
+    if num_nodes < 1:
+        raise ValueError('A ring needs at least one Node')
+    workload  = Workload(space) if workload is None else workload
+    counts    = np.zeros((num_rings, num_nodes), dtype=np.int64)
+    per_chunk = max(1, min(CHUNK_SIZE // (num_nodes + num_keys), (1 << 62) // space.size))
+    for start in range(0, num_rings, per_chunk):
+        rows   = min(per_chunk, num_rings - start)
+        shift  = np.arange(rows, dtype=np.int64)[:, None] * space.size
+        IDs    = (workload.unique_key_rows(rows, num_nodes) + shift).ravel()
+        keys   = workload.unique_key_rows(rows, num_keys) + shift
+        # Positions past a ring's last ID belong to its first one.
+        owners = np.searchsorted(IDs, keys) - num_nodes * np.arange(rows)[:, None]
+        owners = (owners % num_nodes) + num_nodes * np.arange(rows)[:, None]
+        counts[start:start + rows] = np.bincount(owners.ravel(), minlength=rows * num_nodes).reshape(rows, num_nodes)
+    return counts
+
+'''
+Summary statistics of the rows of a num_rings x num_nodes matrix of ownership counts,
+as a dictionary of arrays with one entry per ring: the mean, standard deviation, least
+and most keys per Node, max_over_mean (how much more the busiest Node holds than its
+fair share), and empty_fraction (the fraction of Nodes holding nothing).
+'''
+def distribution_stats(counts):
+    counts = np.atleast_2d(counts)
+    mean   = counts.mean(axis=1)
+    return {'mean':           mean,
+            'std':            counts.std(axis=1),
+            'min':            counts.min(axis=1),
+            'max':            counts.max(axis=1),
+            'max_over_mean':  counts.max(axis=1) / np.where(mean == 0, 1, mean),
+            'empty_fraction': (counts == 0).mean(axis=1)}
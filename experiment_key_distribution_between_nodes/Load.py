@@ -0,0 +1,166 @@
+import constants as c
+import numpy as np
+
+from collections import deque
+
+class PhaseLoad:
+    '''
+    How the load was spread over the Nodes during one phase of a run (see
+    LoadMonitor.end_phase). It contains the following:
+        name:          Name the phase was given, e.g. 'join' or 'query'.
+        ticks:         Number of ticks the phase took.
+        served:        Maps the ID of every Node seen during the phase to the number of
+            RPCs it processed.
+        peak_depth:    Maps IDs to the longest mailbox seen at a sample.
+        hot_windows:   Maps the IDs of Nodes that were ever flagged hot to the number of
+            samples at which they were.
+        top_k:         How many of the busiest Nodes top returns.
+    '''
+    __slots__ = ('name', 'ticks', 'served', 'peak_depth', 'hot_windows', 'top_k')
+
+    def __init__(self, name, ticks, served, peak_depth, hot_windows, top_k):
+        self.name        = name
+        self.ticks       = ticks
+        self.served      = served
+        self.peak_depth  = peak_depth
+        self.hot_windows = hot_windows
+        self.top_k       = top_k
+
+    '''
+    Coefficient of variation (std / mean) of the RPCs processed per Node: 0 if every Node
+    did the same amount of work, and growing as the work piles up on a few of them.
+    '''
+    @property
+    def imbalance(self):
+        served = np.array(list(self.served.values()), dtype=np.float64)
+        if len(served) == 0 or served.mean() == 0:
+            return 0.0
+        return float(served.std() / served.mean())
+
+    '''
+    How many times the fair share of RPCs the busiest Node processed.
+    '''
+    @property
+    def max_over_mean(self):
+        if not self.served or sum(self.served.values()) == 0:
+            return 0.0
+        return max(self.served.values()) * len(self.served) / sum(self.served.values())
+
+    '''
+    The top_k busiest Nodes, as (ID, RPCs processed, peak mailbox depth, hot samples)
+    tuples, busiest first.
+    '''
+    def top(self):
+        IDs = sorted(self.served, key=lambda ID: (-self.served[ID], ID))[:self.top_k]
+        return [(ID, self.served[ID], self.peak_depth.get(ID, 0), self.hot_windows.get(ID, 0)) for ID in IDs]
+
+    def __str__(self):
+        to_print = 'Phase {}: {} ticks, {} RPCs over {} Nodes, imbalance {:.3f}, busiest at {:.2f}x the mean, {} hot Nodes'.format(
+            self.name, self.ticks, sum(self.served.values()), len(self.served), self.imbalance,
+            self.max_over_mean, len(self.hot_windows))
+        for ID, served, depth, hot in self.top():
+            to_print += '\nNode {}: {} RPCs, mailbox up to {}, hot at {} samples'.format(ID, served, depth, hot)
+        return to_print
+
+class LoadMonitor:
+    '''
+    Watches how busy each Node of a ChordRing is, to find the Nodes whose backlogs slow
+    lookups down (the bootstrap Node, the owners of popular keys, ...). Every window ticks
+    the ring stops to take a sample (see ChordRing.advance): the depth of every mailbox
+    and the number of RPCs each Node has processed over the last span windows, read off
+    the counters the mailboxes keep (see Mailbox.served). A Node is hot at a sample if its
+    mailbox holds at least depth_threshold RPCs, or it processed at least load_threshold
+    RPCs per tick over the sliding window; at service_rate 1, the default of 0.9 means
+    it was busy nine ticks out of ten. Totals are kept per phase, which end_phase closes.
+    A sample costs O(N), so windows of a few hundred ticks keep the monitor cheap.
+    It contains the following:
+        ring:            The ChordRing being watched.
+        window:          Ticks between samples.
+        span:            Number of windows the load is averaged over.
+        depth_threshold: Mailbox depth at which a Node counts as hot.
+        load_threshold:  RPCs processed per tick at which a Node counts as hot.
+        top_k:           How many of the busiest Nodes phase reports list.
+        next_sample:     Tick of the next sample.
+        history:         Maps IDs to each Node's served counter at the last span + 1
+            samples, oldest first.
+        hot:             IDs of the Nodes that were hot at the last sample.
+        phase_start:     Tick the current phase started on.
+        phase_served:    Maps IDs to the counter each Node's phase started from, and
+            phase_departed to the RPCs processed this phase by Nodes that have left.
+        peak_depth, hot_windows: Like in PhaseLoad, for the current phase.
+        phases:          PhaseLoad of every phase that has ended.
+    '''
+    __slots__ = ('ring', 'window', 'span', 'depth_threshold', 'load_threshold', 'top_k',
+                 'next_sample', 'history', 'hot', 'phase_start', 'phase_served',
+                 'phase_departed', 'peak_depth', 'hot_windows', 'phases')
+
+    def __init__(self, ring, window=c.max_offset, span=5, depth_threshold=10, load_threshold=0.9, top_k=5):
+        if window < 1 or span < 1:
+            raise ValueError('window and span have to be at least 1, not {} and {}'.format(window, span))
+        self.ring            = ring
+        self.window          = window
+        self.span            = span
+        self.depth_threshold = depth_threshold
+        self.load_threshold  = load_threshold
+        self.top_k           = top_k
+        self.next_sample     = ring.time + window
+        self.history         = {}
+        self.hot             = set()
+        self.phases          = []
+        self.start_phase()
+
+    '''
+    Starts counting a new phase from the current tick.
+    '''
+    def start_phase(self):
+        self.phase_start    = self.ring.time
+        self.phase_served   = {ID: node.incoming_RPCs.served for ID, node in self.ring.nodeDict.items()}
+        self.phase_departed = {}
+        self.peak_depth     = {}
+        self.hot_windows    = {}
+
+    '''
+    Takes a sample of every Node and flags the hot ones. ChordRing.advance calls this
+    every window ticks.
+    '''
+    def sample(self):
+        hot = set()
+        for ID, node in self.ring.nodeDict.items():
+            mailbox = node.incoming_RPCs
+            depth   = len(mailbox)
+            counts  = self.history.get(ID)
+            if counts is None:
+                counts = self.history[ID] = deque([self.phase_served.setdefault(ID, 0)], maxlen=self.span + 1)
+            counts.append(mailbox.served)
+            load = (counts[-1] - counts[0]) / (self.window * (len(counts) - 1))
+            if depth > self.peak_depth.get(ID, 0):
+                self.peak_depth[ID] = depth
+            if depth >= self.depth_threshold or load >= self.load_threshold:
+                hot.add(ID)
+                self.hot_windows[ID] = self.hot_windows.get(ID, 0) + 1
+        self.hot = hot
+        self.next_sample = self.ring.time + self.window
+
+    '''
+    Keeps the RPCs a Node processed this phase when it leaves the ring.
+    '''
+    def node_left(self, node):
+        ID = node.ID
+        self.history.pop(ID, None)
+        if ID in self.phase_served:
+            self.phase_departed[ID] = self.phase_departed.get(ID, 0) + \
+                node.incoming_RPCs.served - self.phase_served.pop(ID)
+
+    '''
+    Closes the current phase under name, starts the next one and returns the PhaseLoad of
+    the phase that ended.
+    '''
+    def end_phase(self, name):
+        served = dict(self.phase_departed)
+        for ID, node in self.ring.nodeDict.items():
+            served[ID] = served.get(ID, 0) + node.incoming_RPCs.served - self.phase_served.get(ID, 0)
+        phase = PhaseLoad(name, self.ring.time - self.phase_start, served, self.peak_depth,
+                          self.hot_windows, self.top_k)
+        self.phases.append(phase)
+        self.start_phase()
+        return phase
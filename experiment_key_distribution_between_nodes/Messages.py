@@ -0,0 +1,119 @@
+'''
+The RPCs Nodes send each other. Every RPC is a small slotted object whose class carries an
+integer opcode, and Nodes dispatch on the opcode through ChordNode.handlers. Nothing about
+the ring itself (nodeDict, step_tracker) travels in a message; each Node is bound to its
+ring once, when it is added.
+'''
+
+# Opcodes. They index ChordNode.handlers, so they have to stay 0, 1, 2, ...
+(FIND_SUCCESSOR, CREATE, JOIN, SEND_ITEMS, STABILIZE, NOTIFY, FIX_FINGER, CHECK_PRED,
+ FOUND_KEY, SET_FINGER, STORE_ITEMS) = range(11)
+OP_NAMES = ('find_successor', 'create', 'join', 'send_items', 'stabilize', 'notify',
+            'fix_finger', 'check_pred', 'found_key', 'set_finger', 'store_items')
+
+# var_name of a find_successor lookup that a client started. Any other var_name is the
+# index of the finger table entry the answer goes into.
+CLIENT = -1
+
+class RPC:
+    '''
+    Base class of every message. Subclasses set op and list their fields in __slots__.
+    '''
+    __slots__ = ()
+    op = None
+
+    def __repr__(self):
+        fields = ['{}={}'.format(name, getattr(self, name))
+                  for cls in type(self).__mro__ for name in getattr(cls, '__slots__', ())]
+        return '{}({})'.format(OP_NAMES[self.op], ', '.join(fields))
+
+class FindSuccessor(RPC):
+    '''
+    Look for the successor of key on behalf of dest_ID. The same message is passed along
+    from hop to hop, with steps counting the hops (None when nobody is counting).
+    '''
+    __slots__ = ('dest_ID', 'var_name', 'key', 'steps')
+    op = FIND_SUCCESSOR
+
+    def __init__(self, dest_ID, var_name, key, steps=None):
+        self.dest_ID  = dest_ID
+        self.var_name = var_name
+        self.key      = key
+        self.steps    = steps
+
+class Create(RPC):
+    __slots__ = ()
+    op = CREATE
+
+class Join(RPC):
+    __slots__ = ('join_ID',)
+    op = JOIN
+
+    def __init__(self, join_ID):
+        self.join_ID = join_ID
+
+class SendItems(RPC):
+    __slots__ = ('dest_ID',)
+    op = SEND_ITEMS
+
+    def __init__(self, dest_ID):
+        self.dest_ID = dest_ID
+
+class Stabilize(RPC):
+    __slots__ = ()
+    op = STABILIZE
+
+class Notify(RPC):
+    __slots__ = ('pot_pred_ID',)
+    op = NOTIFY
+
+    def __init__(self, pot_pred_ID):
+        self.pot_pred_ID = pot_pred_ID
+
+class FixFinger(RPC):
+    __slots__ = ()
+    op = FIX_FINGER
+
+class CheckPred(RPC):
+    __slots__ = ()
+    op = CHECK_PRED
+
+class FoundKey(RPC):
+    '''
+    Answer to a client lookup: key was looked up at Node succ in steps hops, and success
+    says whether succ actually had it.
+    '''
+    __slots__ = ('key', 'succ', 'steps', 'success')
+    op = FOUND_KEY
+
+    def __init__(self, key, succ, steps, success):
+        self.key     = key
+        self.succ    = succ
+        self.steps   = steps
+        self.success = success
+
+class SetFinger(RPC):
+    '''
+    Answer to a finger lookup: finger table entry index should be val.
+    '''
+    __slots__ = ('index', 'val')
+    op = SET_FINGER
+
+    def __init__(self, index, val):
+        self.index = index
+        self.val   = val
+
+class StoreItems(RPC):
+    '''
+    Items handed over to another Node: keys[i] -> values[i], with the keys sorted.
+    '''
+    __slots__ = ('keys', 'values')
+    op = STORE_ITEMS
+
+    def __init__(self, keys, values):
+        self.keys   = keys
+        self.values = values
+
+# The periodic RPCs carry no arguments, so every Node shares the same instances. In the
+# order of Node.PERIODIC_OPS.
+PERIODIC_RPCS = (Stabilize(), FixFinger(), CheckPred())
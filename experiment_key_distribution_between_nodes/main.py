@@ -1,22 +1,13 @@
 from ChordRing import ChordRing
+from Log import LOG
+from Stats import QUANTILES
+from Workload import Workload
 import constants as c
 import random
 from statistics import mean 
 import os, csv
 verbose = False
 
-def rand_key():
-    return random.randint(0, 2 ** c.ring_size)
-
-# RMB: necessary, really
-def rand_key_without_replacement(currentKeyList):
-    allChoices = set([x for x in range(2 ** c.ring_size)])
-    return random.choice(list(allChoices - set(currentKeyList)))
-
-# RMB: added below to avoid many collisions when number of nodes approaches ring size
-def rand_address(nodeList):
-    allChoices = set([x for x in range(2 ** c.ring_size)])
-    return random.choice(list(allChoices - set(nodeList)))
 
 def check_lookups():
     num_keys = 2000
@@ -27,34 +18,30 @@ def check_lookups():
     steps_between_query = 1
 
     chord = ChordRing()
+    workload = Workload(chord.space)
 
     # Initialize Chord ring and add items.
-    chord.add_node(rand_key())
-    for i in range(num_keys):
-        key = rand_key()
-        chord.add_item((key, key))
+    chord.add_node(chord.unused_ID())
+    keys = workload.unique_keys(num_keys)
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
 
     # Slowly build up the Chord ring with nodes.
-    for i in range(num_nodes * num_steps_between_new_nodes):
-        if i % (num_steps_between_new_nodes) == 0:
-            chord.add_node(rand_key())
-        chord.advance_all_one_step(verbose=verbose)
+    for i in range(num_nodes):
+        chord.add_node(chord.unused_ID())
+        chord.advance(num_steps_between_new_nodes, verbose=verbose)
 
     # Give the Ring more time to properly get values.
-    for i in range(c.max_offset*50):
-        chord.advance_all_one_step(verbose=verbose)
+    chord.advance(c.max_offset*50, verbose=verbose)
 
-    print(chord)
+    LOG.debug('{}', chord)
     chord.check_correctness()
 
     # Query the Ring for items
-    for i in range(num_queries * steps_between_query):
-        if i % (steps_between_query) == 0:
-            item_key = random.sample(chord.item_keys, 1)[0]
-            chord.query_item(item_key)
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(num_queries * c.ring_size):
-        chord.advance_all_one_step(verbose=verbose)
+    for item_key in workload.queries(keys, num_queries).tolist():
+        chord.query_item(item_key)
+        chord.advance(steps_between_query, verbose=verbose)
+    steps = chord.run_until_idle(num_queries * c.ring_size, verbose=verbose)
+    print('All queries resolved after {} steps'.format(steps))
    
 
 def check_dropouts():
@@ -65,19 +52,17 @@ def check_dropouts():
     add_prob = 0.5
 
     chord = ChordRing()
+    workload = Workload(chord.space)
 
     # Initialize and add some Nodes
-    chord.add_node(rand_key())
-    for i in range(num_keys):
-        key = rand_key()
-        chord.add_item((key, key))
-
-    for i in range(num_initial_nodes * num_steps_between_add_drop):
-        if i % (num_steps_between_add_drop) == 0:
-            chord.add_node(rand_key())
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(c.max_offset * 50):
-        chord.advance_all_one_step(verbose=verbose)
+    chord.add_node(chord.unused_ID())
+    keys = workload.unique_keys(num_keys)
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
+
+    for i in range(num_initial_nodes):
+        chord.add_node(chord.unused_ID())
+        chord.advance(num_steps_between_add_drop, verbose=verbose)
+    chord.advance(c.max_offset * 50, verbose=verbose)
 
     print('\n' + '-'*40) 
     print('Checking correctness after initial adding of nodes.')
@@ -85,17 +70,15 @@ def check_dropouts():
     print('-'*40 + '\n') 
     
     # Randomly add and fail nodes. 
-    for i in range(num_add_drops * num_steps_between_add_drop):
-        if i % (num_steps_between_add_drop) == 0:
-            coinflip = random.random()
-            if coinflip < add_prob:
-                chord.add_node(rand_key())
-            else:
-                remove_ID = random.choice(list(chord.nodeDict.keys()))
-                chord.remove_node_failure(remove_ID)
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(c.max_offset * 50):
-        chord.advance_all_one_step(verbose=verbose)
+    for i in range(num_add_drops):
+        coinflip = random.random()
+        if coinflip < add_prob:
+            chord.add_node(chord.unused_ID())
+        else:
+            remove_ID = random.choice(list(chord.nodeDict.keys()))
+            chord.remove_node_failure(remove_ID)
+        chord.advance(num_steps_between_add_drop, verbose=verbose)
+    chord.advance(c.max_offset * 50, verbose=verbose)
 
     print('\n' + '-'*40) 
     print('Checking correctness after adding and removing of nodes.')
@@ -114,19 +97,17 @@ def check_dropout_graceful():
     steps_between_query = 1
 
     chord = ChordRing()
+    workload = Workload(chord.space)
 
     # Initialize and add some Nodes 
-    chord.add_node(rand_key())
-    for i in range(num_keys):
-        key = rand_key()
-        chord.add_item((key, key))
-
-    for i in range(num_initial_nodes * num_steps_between_add_drop):
-        if i % (num_steps_between_add_drop) == 0:
-            chord.add_node(rand_key())
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(c.max_offset * 50):
-        chord.advance_all_one_step(verbose=verbose)
+    chord.add_node(chord.unused_ID())
+    keys = workload.unique_keys(num_keys)
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
+
+    for i in range(num_initial_nodes):
+        chord.add_node(chord.unused_ID())
+        chord.advance(num_steps_between_add_drop, verbose=verbose)
+    chord.advance(c.max_offset * 50, verbose=verbose)
 
     print('\n' + '-'*40) 
     print('Checking correctness after initial adding of nodes.')
@@ -134,32 +115,28 @@ def check_dropout_graceful():
     print('-'*40 + '\n') 
     
     # Randomly add and GRACEFULLY fail some Nodes.
-    for i in range(num_add_drops * num_steps_between_add_drop):
-        if i % (num_steps_between_add_drop) == 0:
-            coinflip = random.random()
-            if coinflip < add_prob:
-                chord.add_node(rand_key())
-            else:
-                remove_ID = random.choice(list(chord.nodeDict.keys()))
-                chord.remove_node_graceful(remove_ID)
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(c.max_offset * 50):
-        chord.advance_all_one_step(verbose=verbose)
+    for i in range(num_add_drops):
+        coinflip = random.random()
+        if coinflip < add_prob:
+            chord.add_node(chord.unused_ID())
+        else:
+            remove_ID = random.choice(list(chord.nodeDict.keys()))
+            chord.remove_node_graceful(remove_ID)
+        chord.advance(num_steps_between_add_drop, verbose=verbose)
+    chord.advance(c.max_offset * 50, verbose=verbose)
 
     print('\n' + '-'*40) 
     print('Checking correctness after adding and removing of nodes.')
     chord.check_correctness()
     print('-'*40 + '\n') 
-    print(chord)
+    LOG.debug('{}', chord)
     
     # Query the Ring for items
-    for i in range(num_queries * steps_between_query):
-        if i % (steps_between_query) == 0:
-            item_key = random.sample(chord.item_keys, 1)[0]
-            chord.query_item(item_key)
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(num_queries * c.ring_size):
-        chord.advance_all_one_step(verbose=verbose)
+    for item_key in workload.queries(keys, num_queries).tolist():
+        chord.query_item(item_key)
+        chord.advance(steps_between_query, verbose=verbose)
+    steps = chord.run_until_idle(num_queries * c.ring_size, verbose=verbose)
+    print('All queries resolved after {} steps'.format(steps))
     
 
 def small_test():
@@ -168,22 +145,21 @@ def small_test():
     num_steps_between_new_nodes = 20 * c.max_offset
     
     chord = ChordRing()
-    chord.add_node(rand_key())
-    for i in range(num_keys):
-        key = rand_key()
-        chord.add_item((key, key))
-
-    for i in range(num_nodes * num_steps_between_new_nodes):
-        if i % (num_steps_between_new_nodes) == 0:
-            chord.add_node(rand_key())
-        chord.advance_all_one_step()
-    for i in range(c.max_offset*100):
-        chord.advance_all_one_step()
+    workload = Workload(chord.space)
+    chord.add_node(chord.unused_ID())
+    keys = workload.unique_keys(num_keys)
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
+
+    for i in range(num_nodes):
+        chord.add_node(chord.unused_ID())
+        chord.advance(num_steps_between_new_nodes)
+    steps = chord.run_until(ChordRing.is_converged, c.max_offset*100, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
     chord.stop_periodic=True
     print('No longer adding')
-    for i in range(c.max_offset*200):
-        chord.advance_all_one_step()
-    print(chord)
+    steps = chord.run_until(ChordRing.is_converged, c.max_offset*200, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
+    LOG.debug('{}', chord)
     chord.check_correctness()
 
 # RMB: added this function to test average number of steps following query. 
@@ -196,54 +172,48 @@ def return_query_steps(num_keys, num_nodes):
     steps_between_query = 1
     # initialize ring
     chord = ChordRing()
-    chord.add_node(rand_key())
+    workload = Workload(chord.space)
+    chord.add_node(chord.unused_ID())
 
     # RMB: now take key without replacement
-    keyList = []
-    for i in range(num_keys):
-        key = rand_key_without_replacement(keyList)
-        keyList.append(key)
-        chord.add_item((key, key))
-  
-    keyList = None
+    keys = workload.unique_keys(num_keys)
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
 
     # add nodes
-    for i in range(num_nodes * num_steps_between_new_nodes):
-        if i % (num_steps_between_new_nodes) == 0:
-            try:
-                chord.add_node(rand_address(chord.nodeList))
-            except Exception as e: 
-                print('no more names to allocate (more nodes than chord size?): {}'.format(e))
-        chord.advance_all_one_step()
-    for i in range(c.max_offset*100):
-        chord.advance_all_one_step()
+    for i in range(num_nodes):
+        try:
+            chord.add_node(chord.unused_ID())
+        except Exception as e: 
+            print('no more names to allocate (more nodes than chord size?): {}'.format(e))
+        chord.advance(num_steps_between_new_nodes)
+    steps = chord.run_until(ChordRing.is_converged, c.max_offset*100, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
     chord.stop_periodic=True
     print('No longer adding')
 
     # stabliize and check correctness
-    for i in range(c.max_offset*200):
-        chord.advance_all_one_step()
-    print(chord)
+    steps = chord.run_until(ChordRing.is_converged, c.max_offset*200, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
+    LOG.debug('{}', chord)
     chord.check_correctness()
 
     # query
-    for i in range(num_queries * steps_between_query):
-        if i % (steps_between_query) == 0:
-            item_key = random.sample(chord.item_keys, 1)[0]
-            chord.query_item(item_key)
-        chord.advance_all_one_step(verbose=verbose)
+    for item_key in workload.queries(keys, num_queries).tolist():
+        chord.query_item(item_key)
+        chord.advance(steps_between_query, verbose=verbose)
 
     # to make sure all have cleared (max transit should be one time round)
-    for i in range(num_queries * c.ring_size):
-        chord.advance_all_one_step(verbose=verbose)
-    average_steps = mean(chord.step_tracker)
-    print('\n Average number of steps was {} for {} nodes with {} keys total!'.format(average_steps, 
+    steps = chord.run_until_idle(num_queries * c.ring_size, verbose=verbose)
+    print('All queries resolved after {} steps'.format(steps))
+    print('\n Average number of steps was {} for {} nodes with {} keys total!'.format(chord.step_tracker.mean, 
         num_nodes, num_keys))
-    return average_steps
+    print(chord.step_tracker)
+    return chord.step_tracker
 
 # helper function to write to csv file. variables input through parser in header of main_server.py, but not here
 def output_steps(num_keys, num_nodes, iteration, output_path):
-    trial_steps = [num_keys, num_nodes, return_query_steps(num_keys, num_nodes), iteration]
+    hop_stats = return_query_steps(num_keys, num_nodes)
+    trial_steps = [num_keys, num_nodes, hop_stats.mean, iteration] + [hop_stats.quantile(q) for q in QUANTILES] + [hop_stats.max]
 
     # we are saving here
     path_string ='{}/count_steps_keys_{}_nodes_{}_iter_{}'.format(output_path, num_keys, num_nodes, iteration) 
@@ -255,7 +225,7 @@ def output_steps(num_keys, num_nodes, iteration, output_path):
     # dump to csv
     with open(path_string, 'w') as myfile:
        wr = csv.writer(myfile)
-       wr.writerow(['num_keys', 'num_nodes', 'num_steps', 'iteration'])
+       wr.writerow(['num_keys', 'num_nodes', 'num_steps', 'iteration', 'p50_steps', 'p90_steps', 'p99_steps', 'max_steps'])
        wr.writerow(trial_steps)
 
 # RMB: added this function to return number of keys per node 
@@ -266,34 +236,29 @@ def key_distribution(num_keys, num_nodes):
     
     # initialize ring
     chord = ChordRing()
-    chord.add_node(rand_key())
+    workload = Workload(chord.space)
+    chord.add_node(chord.unused_ID())
 
     # RMB: now take key without replacement
-    keyList = []
-    for i in range(num_keys):
-        key = rand_key_without_replacement(keyList)
-        keyList.append(key)
-        chord.add_item((key, key))
-  
-    keyList = None
+    keys = workload.unique_keys(num_keys)
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
 
     # add nodes
-    for i in range(num_nodes * num_steps_between_new_nodes):
-        if i % (num_steps_between_new_nodes) == 0:
-            try:
-                chord.add_node(rand_address(chord.nodeList))
-            except Exception as e: 
-                print('no more names to allocate (more nodes than chord size?): {}'.format(e))
-        chord.advance_all_one_step()
-    for i in range(c.max_offset*100):
-        chord.advance_all_one_step()
+    for i in range(num_nodes):
+        try:
+            chord.add_node(chord.unused_ID())
+        except Exception as e: 
+            print('no more names to allocate (more nodes than chord size?): {}'.format(e))
+        chord.advance(num_steps_between_new_nodes)
+    steps = chord.run_until(ChordRing.is_converged, c.max_offset*100, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
     chord.stop_periodic=True
     print('No longer adding')
 
     # stabliize and check correctness
-    for i in range(c.max_offset*200):
-        chord.advance_all_one_step()
-    print(chord)
+    steps = chord.run_until(ChordRing.is_converged, c.max_offset*200, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
+    LOG.debug('{}', chord)
     chord.check_correctness()
 
     # here is the juice
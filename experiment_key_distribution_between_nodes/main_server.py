@@ -1,4 +1,8 @@
 from ChordRing import ChordRing
+from KeyDistribution import random_ring_distributions, distribution_stats
+from Log import LOG
+from Profiler import Profiler
+from Workload import Workload
 import constants as c
 import random
 from statistics import mean 
@@ -11,25 +15,37 @@ parser = argparse.ArgumentParser()
 parser.add_argument("-k", type = int)
 parser.add_argument("-n", type = int)
 parser.add_argument("-i", type = int)
+parser.add_argument("--storage", default = "sorted", choices = ["sorted", "dict", "array", "memmap"],
+                    help = "how nodes store their items; memmap keeps them in files, for more keys than fit in memory")
+parser.add_argument("--storage_dir", default = None,
+                    help = "where memmap storage puts its files (a temporary directory by default)")
+parser.add_argument("--analytic", action = "store_true",
+                    help = "work the distribution out from random IDs and keys instead of simulating the joins")
+parser.add_argument("--rings", type = int, default = 1,
+                    help = "how many independent rings --analytic draws; one csv row per ring")
+parser.add_argument("--cross_check", action = "store_true",
+                    help = "compare the simulated distribution with the one worked out from the ring's IDs")
+parser.add_argument("--profile", action = "store_true",
+                    help = "also time every RPC handler and print the timings of every phase")
+parser.add_argument("--profile_dump", default = None, choices = ["cprofile", "sample"],
+                    help = "write a cProfile or sampling profile of every phase to --profile_dir")
+parser.add_argument("--profile_dir", default = "profiles")
+parser.add_argument("--log_level", default = "info", choices = ["debug", "info", "warning", "error", "off"],
+                    help = "debug also prints every lookup and the whole ring; warning keeps large sweeps quiet")
+parser.add_argument("--events", default = None,
+                    help = "write structured events (joins, departures, lookups) here as JSON lines, gzipped if it ends in .gz")
+parser.add_argument("--event_sample", type = float, default = 1.0, help = "fraction of the events to keep")
 args = parser.parse_args()
 print(args)
+LOG.configure(args.log_level, args.events, args.event_sample)
 num_keys = args.k
 num_nodes = args.n
 iteration = args.i
 output_path = "result_dump"
+profiler = Profiler(args.profile_dump, args.profile_dir)
+if args.profile:
+    profiler.time_handlers()
 
-def rand_key():
-    return random.randint(0, 2 ** c.ring_size)
-
-# RMB: necessary, really
-def rand_key_without_replacement(currentKeyList):
-    allChoices = set([x for x in range(2 ** c.ring_size)])
-    return random.choice(list(allChoices - set(currentKeyList)))
-
-# RMB: added below to avoid many collisions when number of nodes approaches ring size
-def rand_address(nodeList):
-    allChoices = set([x for x in range(2 ** c.ring_size)])
-    return random.choice(list(allChoices - set(nodeList)))
 
 # RMB: added this function to return number of keys per node 
 #variables input through argparser in main_server.py, but not here
@@ -38,47 +54,62 @@ def key_distribution(num_keys, num_nodes):
     num_steps_between_new_nodes = 20 * c.max_offset
     
     # initialize ring
-    chord = ChordRing()
-    chord.add_node(rand_key())
+    chord = ChordRing(storage=args.storage, storage_dir=args.storage_dir)
+    workload = Workload(chord.space)
+    chord.add_node(chord.unused_ID())
 
     # RMB: now take key without replacement
-    keyList = []
-    for i in range(num_keys):
-        key = rand_key_without_replacement(keyList)
-        keyList.append(key)
-        chord.add_item((key, key))
-  
-    keyList = None
+    keys = workload.unique_keys(num_keys)
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
 
     # add nodes
-    for i in range(num_nodes * num_steps_between_new_nodes):
-        if i % (num_steps_between_new_nodes) == 0:
+    with profiler.phase('join', chord):
+        for i in range(num_nodes):
             try:
-                chord.add_node(rand_address(chord.nodeList))
+                chord.add_node(chord.unused_ID())
             except Exception as e: 
                 print('no more names to allocate (more nodes than chord size?): {}'.format(e))
-        chord.advance_all_one_step()
-    for i in range(c.max_offset*100):
-        chord.advance_all_one_step()
+            chord.advance(num_steps_between_new_nodes)
+        steps = chord.run_until(ChordRing.is_converged, c.max_offset*100, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
     chord.stop_periodic=True
     print('No longer adding')
 
     # stabliize and check correctness
-    for i in range(c.max_offset*200):
-        chord.advance_all_one_step()
-    print(chord)
-    chord.check_correctness()
+    with profiler.phase('stabilize', chord):
+        steps = chord.run_until(ChordRing.is_converged, c.max_offset*200, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
+    LOG.debug('{}', chord)
+    with profiler.phase('check', chord):
+        chord.check_correctness()
 
     # here is the juice
     keyDistributionList = chord.return_key_distribution()
+    if args.cross_check:
+        matches = keyDistributionList == chord.expected_key_distribution()
+        print('Simulated key distribution {} the analytic one'.format('matches' if matches else 'DIFFERS FROM'))
     print('\n Average number of keys per node was {} for {} nodes with {} keys total!'.format(mean(keyDistributionList), 
         num_nodes, num_keys))
     return keyDistributionList
 
+# Same experiment without the simulation: num_nodes + 1 random IDs (the first node plus the
+# ones that join) own the keys that fall between them, for args.rings rings at once.
+def analytic_key_distributions(num_keys, num_nodes, num_rings):
+    counts = random_ring_distributions(num_rings, num_nodes + 1, num_keys)
+    stats  = distribution_stats(counts)
+    print('\n Over {} rings, the busiest node held {:.3f} times its fair share on average, and {:.3f} of nodes held no keys'.format(
+        num_rings, stats['max_over_mean'].mean(), stats['empty_fraction'].mean()))
+    return counts.tolist()
+
 # helper function to write to csv file. variables input through parser in header of main_server.py, but not here
 def output_key_distributions(num_keys, num_nodes, iteration, output_path):
     
-    keyDistributionList = key_distribution(num_keys, num_nodes)
+    if args.analytic:
+        with profiler.phase('analytic'):
+            keyDistributionLists = analytic_key_distributions(num_keys, num_nodes, args.rings)
+    else:
+        keyDistributionLists = [key_distribution(num_keys, num_nodes)]
+    print(profiler)
 
     # we are saving here
     path_string ='{}/key_distribution_keys_{}_nodes_{}_iter_{}'.format(output_path, num_keys, num_nodes, iteration) 
@@ -91,9 +122,12 @@ def output_key_distributions(num_keys, num_nodes, iteration, output_path):
     with open(path_string, 'w') as myfile:
        wr = csv.writer(myfile)
        
-       wr.writerow(keyDistributionList)
+       wr.writerows(keyDistributionLists)
+
+    # timings, and the node-ticks per second of the simulation
+    profiler.write_csv('{}/profile_keys_{}_nodes_{}_iter_{}'.format(output_path, num_keys, num_nodes, iteration))
 
 if __name__ == "__main__":
     # input variables fed in through parser	
     output_key_distributions(num_keys, num_nodes, iteration, output_path)
-
+    LOG.close()
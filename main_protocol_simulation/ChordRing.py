@@ -1,61 +1,306 @@
 import constants as c
+import numpy as np
 import random
-import bisect
 
-from Node import ChordNode, between
+from array import array
+from Checker import RingChecker
+from IDSpace import IDSpace, NO_ID
+from KeyDistribution import ownership_counts
+from Log import LOG
+from Load import LoadMonitor
+from Membership import MembershipIndex
+from Metrics import MetricsRegistry
+from Messages import *
+from Node import ChordNode, between, PERIODIC_OPS
+from Router import Router
+from Scheduler import EventScheduler, WorklistScheduler
+from Stats import StreamingStats
+from Storage import storage_directory, storage_factory
 from collections import OrderedDict
 
+# What RPC_kind returns for every opcode but FIND_SUCCESSOR, whose kind depends on the lookup.
+RPC_KINDS = {CREATE: 'work', JOIN: 'work', SEND_ITEMS: 'work', STORE_ITEMS: 'work',
+             FOUND_KEY: 'lookup', SET_FINGER: None, STABILIZE: None, NOTIFY: None,
+             FIX_FINGER: None, CHECK_PRED: None}
+
 class ChordRing:
     '''
     The overarching system that keeps track of the nodes. It contains the following:
     nodeDict: Dictionary that maps IDs to Nodes
-    nodeList: List of Nodes in numerical order of their IDs.
+    membership: MembershipIndex of the IDs on the ring. Answers owner_of / predecessor_of
+        questions in O(log N) and picks random members in O(1).
+    nodeList: List of Nodes in numerical order of their IDs. Built from membership on every
+        access, so internal code uses membership directly.
     curr_node_ind: Index that keeps track of which node is next to process RPC.
     num_node: Keeps track of how many nodes are in the Chord Ring.
-    step_tracker: list with number of steps per query. passed with initial query RPC (see ring query_item method)
+    step_tracker: StreamingStats of the hop counts of successful client lookups (see query_item). Every Node
+        adds to it, and it keeps a histogram instead of every count, so it stays small.
+    engine: Which engine drives the Nodes. All of them give the same results.
+        'event' (the default) only visits Nodes that have something to do and skips idle ticks.
+        'worklist' steps through every tick, but only visits Nodes that have something to do.
+        'round_robin' visits every Node on every tick.
+    scheduler: Scheduler driving the Nodes, or None for the round-robin engine.
+    service_rate: How many RPCs each new Node processes per tick (see Mailbox). Defaults to
+        c.service_rate. Individual Nodes can be changed with set_service_rate.
+    pending_lookups: Number of client lookups (query_item) that have not been answered yet.
+    pending_RPCs: Number of other non-periodic RPCs still waiting to be processed, i.e. the ones
+        that make up joins and item transfers. Stabilize, fix_finger and check_pred traffic is
+        not counted, since it never stops.
+    joining: IDs of Nodes that may not have found their successor yet.
+    space: IDSpace of the ring. IDs and keys are ring_size-bit integers, where ring_size
+        defaults to c.ring_size but can be anything, e.g. 160 for SHA-1 sized IDs.
+    new_storage: Makes the storage of each Node (see Storage.py), given its ID. Which kind
+        is picked with storage: 'sorted' (the default) keeps sorted Python lists, 'dict' a
+        plain dictionary, 'array' int64 NumPy arrays, and 'memmap' int64 arrays in files
+        under storage_dir, for more items than fit in memory. 'array' and 'memmap' need
+        integer items and ring_size below 64.
+    storage_dir: Directory of this ring's memory-mapped files, or None for other backends.
+        A new directory inside the storage_dir given to the constructor (or inside the
+        system's temporary directory), which the ring deletes when it is garbage collected.
+    time: Number of ticks the Chord Ring has been advanced by.
+    checker: RingChecker behind check and check_correctness.
+    metrics: MetricsRegistry counting every RPC sent on the ring, by opcode, the items moved,
+        and the longest each Node's mailbox has been.
+    load_monitor: LoadMonitor sampling how busy each Node is, to flag the hot ones and
+        report how evenly the load was spread per phase, or None (the default) if the
+        load is not being watched. See watch_load.
+    touched, touched_storage, membership_changes: IDs of the Nodes that processed an RPC,
+        that had their storage changed, and that joined or left, since the last check. The
+        checker empties them, and uses them to decide what an incremental check redoes.
     '''
-    def __init__(self):
+    def __init__(self, engine='event', service_rate=None, ring_size=None, storage='sorted', storage_dir=None):
+        self.space     = IDSpace(ring_size)
+        if storage in ('array', 'memmap') and self.space.m >= 64:
+            raise ValueError('{} storage keeps keys as int64, so ring_size {} is too wide'.format(storage, self.space.m))
+        self.storage_dir = storage_directory(self, storage_dir) if storage == 'memmap' else None
+        self.new_storage = storage_factory(storage, self.storage_dir)
         self.nodeDict  = OrderedDict()
-        self.nodeList  = []
+        self.membership = MembershipIndex()
         self.num_node  = 0
         self.item_keys = set()
         # RMB: initialize step tracker structure
-        self.step_tracker = []
+        self.step_tracker = StreamingStats()
+        self.engine    = engine
+        self.time      = 0
+        self.service_rate = c.service_rate if service_rate is None else service_rate
+        self.pending_lookups = 0
+        self.pending_RPCs    = 0
+        self.joining         = set()
+        self.checker            = RingChecker(self)
+        self.touched            = set()
+        self.touched_storage    = set()
+        self.membership_changes = set()
+        self.metrics            = MetricsRegistry(self.space, self.nodeDict)
+        self.load_monitor       = None
+        if engine == 'event':
+            self.scheduler = EventScheduler(self)
+        elif engine == 'worklist':
+            self.scheduler = WorklistScheduler(self)
+        elif engine == 'round_robin':
+            self.scheduler = None
+        else:
+            raise ValueError('Unknown engine: {}'.format(engine))
+    @property
+    def nodeList(self):
+        return list(self.membership)
+
+    '''
+    Returns a random ID that no Node on the ring has yet, in expected O(1) (see
+    IDSpace.unused_ID). Raises ValueError if the ring is full.
+    '''
+    def unused_ID(self):
+        return self.space.unused_ID(self.membership)
+
+    '''
+    Builds a Chord Ring that has already converged, without simulating any joins.
+    Every Node gets its predecessor, finger table, successor list and items worked out
+    directly with searchsorted over the sorted IDs, so the result passes check_correctness
+    straight away. Meant for experiments that only care about steady-state lookups.
+    Inputs:
+        ids:  IDs of the Nodes. Duplicates are ignored.
+        keys: Keys of the items to store. Each is stored with itself as the value, the same
+            way the drivers do it.
+        engine, service_rate, ring_size, storage, storage_dir: Same as for the constructor.
+    IDs wider than 63 bits do not fit in int64, so those are handled as object arrays.
+    '''
+    @classmethod
+    def from_converged(cls, ids, keys=(), engine='event', service_rate=None, ring_size=None,
+                       storage='sorted', storage_dir=None):
+        ring  = cls(engine, service_rate, ring_size, storage, storage_dir)
+        space = ring.space
+        dtype = np.int64 if space.m < 64 else object
+        ids   = list(dict.fromkeys(int(ID) for ID in ids))
+        if not ids:
+            return ring
+        sorted_ids = np.sort(np.array(ids, dtype=dtype))
+        num_ids    = len(sorted_ids)
+        ind        = np.arange(num_ids)
+
+        pred_IDs = np.roll(sorted_ids, 1).tolist()
+        fingers  = []
+        for offset in space.finger_offsets:
+            finger_keys = (sorted_ids + offset) & space.mask
+            fingers.append(sorted_ids[np.searchsorted(sorted_ids, finger_keys) % num_ids].tolist())
+        # succ_list starts two to the right of the Node, see check_correctness.
+        succ_lists = [sorted_ids[(ind + 2 + k) % num_ids].tolist()
+                      for k in range(c.successor_list_size - 1)]
+
+        storages = [None for ID in ids]
+        keys     = np.unique(np.array([int(k) for k in keys], dtype=dtype))
+        if len(keys) > 0:
+            owners = np.searchsorted(sorted_ids, keys) % num_ids
+            order  = np.argsort(owners, kind='stable')
+            bounds = np.searchsorted(owners[order], ind, side='right')
+            start  = 0
+            for j, end in enumerate(bounds.tolist()):
+                owned = keys[order[start:end]].tolist()
+                storages[j] = ring.new_storage(int(sorted_ids[j]))
+                storages[j].store_sorted(owned, owned)
+                start = end
+            ring.item_keys.update(keys.tolist())
+
+        position = dict(zip(sorted_ids.tolist(), range(num_ids)))
+        for ID in ids:
+            j    = position[ID]
+            node = ChordNode(ID, ring.service_rate, space)
+            node.pred_ID   = pred_IDs[j]
+            for i in range(space.m):
+                node.finger_table[i] = fingers[i][j]
+            node.succ_list = [succ_list[j] for succ_list in succ_lists]
+            node.storage   = storages[j]
+            node.joined = True
+            ring.track_node(node)
+        return ring
+
     '''
     Adds a node into the Ring, if there isn't already a node with the same values. 
     If the Node to be added is the first one, it will send the 'create' RPC to it.
     Otherwise, it will send the 'join' RPC.
     '''
     def add_node(self, ID):
-        print('Adding node: {}'.format(ID))
+        LOG.info('Adding node: {}', ID)
+        LOG.event('node_added', ID=ID, time=self.time)
         if ID in self.nodeDict.keys():
-            print('Node already exists on the Chord ring. Exiting operation.')
+            LOG.warning('Node already exists on the Chord ring. Exiting operation.')
             return
 
         # Initialize node, and add method of joining the chord ring.
-        node = ChordNode(ID)
+        node = ChordNode(ID, self.service_rate, self.space)
         if len(self.nodeDict) == 0:
-            kwargs = {}
-            function_RPC = ('create', kwargs)
-            node.incoming_RPCs.append(('function', function_RPC))
+            RPC_message = Create()
         else:
-            join_ID = random.choice(list(self.nodeDict.keys()))
-            kwargs = {'join_ID': join_ID, 'nodeDict': self.nodeDict}
-            function_RPC = ('join', kwargs)
-            node.incoming_RPCs.append(('function', function_RPC))
+            RPC_message = Join(self.membership.random_member())
         # Update the Chord Ring.
+        self.track_node(node)
+        self.joining.add(ID)
+        node.receive_RPC(RPC_message)
+
+    '''
+    Starts keeping track of a Node that is new to the Ring, without sending it any RPCs,
+    and binds the Node to the Ring.
+    '''
+    def track_node(self, node):
+        ID = node.ID
+        node.nodeDict     = self.nodeDict
+        node.step_tracker = self.step_tracker
+        node.new_storage  = self.new_storage
         self.nodeDict[ID] = node
-        bisect.insort(self.nodeList, ID)
+        self.membership.add(ID)
+        self.membership_changes.add(ID)
         self.num_node += 1
+        if self.scheduler is not None:
+            self.scheduler.add_node(node)
+        node.observer = self
+
+    '''
+    Saves the state of every Node to a compressed .npz snapshot at path, as NumPy arrays:
+    IDs (in the order the Nodes were added), predecessors, finger tables, successor lists,
+    periods, counter offsets, and the stored items. Unset entries are saved as -1.
+    RPCs that are still in flight are not saved, so this is meant for rings that have
+    stabilized. Item keys and values have to be integers, which is what the drivers use,
+    and IDs have to fit in 64 bits, i.e. ring_size has to be at most 63.
+    '''
+    def save(self, path):
+        if self.space.m >= 64:
+            raise ValueError('Snapshots hold IDs as int64, so ring_size {} is too wide'.format(self.space.m))
+        nodes = list(self.nodeDict.values())
+        def ID_array(values):
+            return np.array([-1 if v is None else v for v in values], dtype=np.int64)
+        item_owner, item_key, item_value = [], [], []
+        for j, node in enumerate(nodes):
+            for k, v in node.stored_items().items():
+                item_owner.append(j)
+                item_key.append(k)
+                item_value.append(v)
+        np.savez_compressed(path,
+            ring_size   = np.array(self.space.m),
+            IDs         = ID_array(node.ID for node in nodes),
+            pred_IDs    = ID_array(node.pred_ID for node in nodes),
+            fingers     = np.array([node.finger_table for node in nodes], dtype=np.int64).reshape(len(nodes), self.space.m),
+            succ_lists  = ID_array(succ for node in nodes
+                                   for succ in node.succ_list).reshape(len(nodes), c.successor_list_size - 1),
+            next        = np.array([node.next for node in nodes], dtype=np.int64),
+            joined      = np.array([node.joined for node in nodes], dtype=bool),
+            offsets     = np.array([node.counter[1] for node in nodes], dtype=np.int64),
+            periods     = np.array([node.periods for node in nodes], dtype=np.int64).reshape(len(nodes), len(PERIODIC_OPS)),
+            item_owner  = np.array(item_owner, dtype=np.int64),
+            item_key    = np.array(item_key, dtype=np.int64),
+            item_value  = np.array(item_value, dtype=np.int64))
+
+    '''
+    Builds a Chord Ring from a snapshot written by save. The Nodes start with empty queues
+    and counters, but keep their offsets and periods, so maintenance carries on as before.
+    engine, service_rate, storage and storage_dir are the same as for the constructor, and
+    ring_size comes from the snapshot.
+    '''
+    @classmethod
+    def load(cls, path, engine='event', service_rate=None, storage='sorted', storage_dir=None):
+        with np.load(path, allow_pickle=False) as snapshot:
+            data = {name: snapshot[name] for name in snapshot.files}
+        ring = cls(engine, service_rate, int(data['ring_size']), storage, storage_dir)
+        def ID_list(values):
+            return [None if v == -1 else v for v in values.tolist()]
+        storages = [None for ID in data['IDs']]
+        for j, k, v in zip(data['item_owner'].tolist(), data['item_key'].tolist(), data['item_value'].tolist()):
+            if storages[j] is None:
+                storages[j] = ring.new_storage(int(data['IDs'][j]))
+            storages[j].store(k, v)
+            ring.item_keys.add(k)
+        pred_IDs   = ID_list(data['pred_IDs'])
+        succ_lists = data['succ_lists']
+        for j, ID in enumerate(data['IDs'].tolist()):
+            node = ChordNode(ID, ring.service_rate, ring.space)
+            node.pred_ID      = pred_IDs[j]
+            node.finger_table = array('q', data['fingers'][j].tolist())
+            node.succ_list    = ID_list(succ_lists[j])
+            node.next         = int(data['next'][j])
+            node.storage      = storages[j]
+            node.joined     = bool(data['joined'][j])
+            node.counter[1] = int(data['offsets'][j])
+            node.periods    = tuple(data['periods'][j].tolist())
+            ring.track_node(node)
+            if not node.joined:
+                ring.joining.add(ID)
+        return ring
 
     '''
     Remove a node from the Ring. Because we are assuming spontaneous failure,
     all that happens is that the Node is no longer kept track of by the Chord Ring.
     '''
     def remove_node_failure(self, ID):
-        print('Removing node by failure: {}'.format(ID))
-        self.nodeDict.pop(ID)
-        self.nodeList.remove(ID)
+        LOG.info('Removing node by failure: {}', ID)
+        LOG.event('node_removed', ID=ID, graceful=False, time=self.time)
+        node = self.nodeDict.pop(ID)
+        self.drop_pending(node)
+        self.metrics.node_left(node)
+        if self.load_monitor is not None:
+            self.load_monitor.node_left(node)
+        if node.storage is not None:
+            node.storage.release()
+        self.membership_changes.add(ID)
+        if self.scheduler is not None:
+            self.scheduler.remove_node(ID)
+        self.membership.remove(ID)
         self.num_node -= 1
 
     '''
@@ -64,144 +309,352 @@ class ChordRing:
     transfered to the successor.
     '''
     def remove_node_graceful(self, ID):
-        print('Removing node gracefully: {}'.format(ID))
-        self.nodeDict[ID].send_successor_items(self.nodeDict)
-        self.nodeDict.pop(ID)
-        self.nodeList.remove(ID)
+        LOG.info('Removing node gracefully: {}', ID)
+        LOG.event('node_removed', ID=ID, graceful=True, time=self.time)
+        self.nodeDict[ID].send_successor_items()
+        node = self.nodeDict.pop(ID)
+        self.drop_pending(node)
+        self.metrics.node_left(node)
+        if self.load_monitor is not None:
+            self.load_monitor.node_left(node)
+        if node.storage is not None:
+            node.storage.release()
+        self.membership_changes.add(ID)
+        if self.scheduler is not None:
+            self.scheduler.remove_node(ID)
+        self.membership.remove(ID)
         self.num_node -= 1
 
+    '''
+    Changes how many RPCs the Node processes per tick, to model faster or slower servers.
+    A rate of 0 means the Node drains its whole queue every tick.
+    '''
+    def set_service_rate(self, ID, service_rate):
+        self.nodeDict[ID].incoming_RPCs.service_rate = service_rate
+
+    '''
+    Starts sampling the mailbox depths and the RPCs processed by every Node every window
+    ticks, and returns the LoadMonitor (also kept in load_monitor). The keyword arguments
+    are passed on to LoadMonitor. Call load_monitor.end_phase(name) at the end of each
+    phase of a run for a report of the busiest Nodes and how imbalanced the load was.
+    '''
+    def watch_load(self, **params):
+        self.load_monitor = LoadMonitor(self, **params)
+        return self.load_monitor
+
+    '''
+    Sorts an RPC into the work that run_until_idle waits for. Returns 'lookup' for the RPCs
+    that make up a client lookup, 'work' for the other non-periodic ones (joins and item
+    transfers), and None for periodic maintenance traffic.
+    A join is a find_successor for the joining Node's own ID, while the lookups fix_finger
+    starts are always for some other key, which is how the two are told apart.
+    '''
+    def RPC_kind(self, RPC_message):
+        op = RPC_message.op
+        if op == FIND_SUCCESSOR:
+            if RPC_message.var_name == CLIENT:
+                return 'lookup'
+            if RPC_message.key == RPC_message.dest_ID:
+                return 'work'
+            return None
+        return RPC_KINDS[op]
+
+    '''
+    Called by a Node whenever an RPC lands in its queue.
+    '''
+    def delivered(self, node, RPC_message):
+        self.metrics.record(RPC_message)
+        kind = self.RPC_kind(RPC_message)
+        if kind == 'lookup':
+            self.pending_lookups += 1
+        elif kind == 'work':
+            self.pending_RPCs += 1
+        if self.scheduler is not None:
+            self.scheduler.delivered(node)
+
+    '''
+    Called by a Node whenever it takes an RPC out of its queue to process it.
+    '''
+    def consumed(self, node, RPC_message):
+        self.touched.add(node.ID)
+        kind = self.RPC_kind(RPC_message)
+        if kind == 'lookup':
+            self.pending_lookups -= 1
+        elif kind == 'work':
+            self.pending_RPCs -= 1
+            if RPC_message.op == SEND_ITEMS or RPC_message.op == STORE_ITEMS:
+                self.touched_storage.add(node.ID)
+
+    '''
+    When a Node leaves, whatever is still in its queue is lost, so it no longer counts
+    as outstanding.
+    '''
+    def drop_pending(self, node):
+        for RPC_message in node.incoming_RPCs:
+            self.consumed(node, RPC_message)
+
+    '''
+    True if every client lookup has been answered (or lost), every Node has found its
+    successor, and no join or item transfer RPCs are left in any queue.
+    '''
+    def is_idle(self):
+        if self.pending_lookups > 0 or self.pending_RPCs > 0:
+            return False
+        self.joining = set(ID for ID in self.joining if ID in self.nodeDict
+                           and self.nodeDict[ID].finger_table[0] == NO_ID)
+        return len(self.joining) == 0
+
+    '''
+    Advances the Chord Ring until predicate(self) is True, checking it every check_every
+    ticks, or until max_steps ticks have gone by (no limit if None).
+    Returns the number of ticks that were taken.
+    '''
+    def run_until(self, predicate, max_steps=None, check_every=1, verbose=False):
+        steps = 0
+        while not predicate(self):
+            if max_steps is not None and steps >= max_steps:
+                LOG.warning('Gave up waiting after {} steps.', steps)
+                break
+            num_steps = check_every
+            if max_steps is not None:
+                num_steps = min(num_steps, max_steps - steps)
+            self.advance(num_steps, verbose)
+            steps += num_steps
+        return steps
+
+    '''
+    Advances the Chord Ring until it is idle (see is_idle), or until max_steps ticks
+    have gone by. Returns the number of ticks that were taken.
+    '''
+    def run_until_idle(self, max_steps=None, verbose=False):
+        return self.run_until(ChordRing.is_idle, max_steps, verbose=verbose)
+
+    '''
+    True if the Chord Ring passes check_correctness. Meant as a predicate for run_until,
+    so it only re-checks what changed since the last call.
+    '''
+    def is_converged(self):
+        return self.check(incremental=True).ok
+
     '''
     Has every node in the Chord Ring take one step.
     '''
     def advance_all_one_step(self, verbose=False):
-        for i in range(self.num_node):
-            node_ID = list(self.nodeDict.keys())[i]
-            node    = self.nodeDict[node_ID]
- 
+        self.advance(1, verbose)
+
+    '''
+    Advances the Chord Ring by num_steps ticks. With the event engine, ticks where no
+    Node has anything to do cost nothing, so prefer this over calling
+    advance_all_one_step in a loop. If the load is being watched, the ticks are taken in
+    stretches that end at each of the load monitor's samples.
+    '''
+    def advance(self, num_steps, verbose=False):
+        monitor = self.load_monitor
+        while num_steps > 0:
+            # Stop at every sample the load monitor has to take.
+            ticks = num_steps if monitor is None else min(num_steps, monitor.next_sample - self.time)
+            if self.scheduler is not None:
+                self.scheduler.advance(ticks, verbose)
+            else:
+                for i in range(ticks):
+                    self.round_robin_step(verbose)
+            self.time += ticks
+            num_steps -= ticks
+            if monitor is not None and self.time >= monitor.next_sample:
+                monitor.sample()
+
+    '''
+    The original tick loop: every Node takes one step, in the order they were added.
+    '''
+    def round_robin_step(self, verbose=False):
+        for node in list(self.nodeDict.values()):
             node.counter[0] += 1
             self.check_periodic_ops(node)
-            node.process_incoming_RPC(self.nodeDict, verbose)
+            node.serve(verbose)
 
 
     '''
     There are three operations that each Node should periodically run. 
     This function checks if it's time to run it, and if so, send the RPC to do so.
+    Only used by the round-robin engine; the schedulers keep the same schedule
+    with a timer wheel and call fire_periodic_ops directly.
     '''
     def check_periodic_ops(self, node):
-        if (node.counter[0] + node.counter[1]) % c.stabilize_period == 0 and node.joined:
-            kwargs = {'nodeDict': self.nodeDict}
-            function_RPC = ('stabilize', kwargs)
-            node.incoming_RPCs.append(('function', function_RPC))
-        if (node.counter[0] + node.counter[1]) % c.fix_finger_period == 0 and node.joined:
-            kwargs = {'nodeDict': self.nodeDict}
-            function_RPC = ('fix_finger', kwargs)
-            node.incoming_RPCs.append(('function', function_RPC))
-        if (node.counter[0] + node.counter[1]) % c.check_pred_period == 0 and node.joined:
-            kwargs = {'nodeDict': self.nodeDict}
-            function_RPC = ('check_pred', kwargs)
-            node.incoming_RPCs.append(('function', function_RPC))
+        if not node.joined:
+            return
+        phase = node.counter[0] + node.counter[1]
+        for op, period in enumerate(node.periods):
+            if phase % period == 0:
+                node.receive_RPC(PERIODIC_RPCS[op])
+
+    '''
+    Sends the Node the RPCs for the given periodic ops (indices into PERIODIC_OPS),
+    in order, if it has joined the ring.
+    '''
+    def fire_periodic_ops(self, node, ops):
+        if not node.joined:
+            return
+        for op in ops:
+            node.receive_RPC(PERIODIC_RPCS[op])
+
+    '''
+    Changes how often (in ticks) the Node runs one of its periodic operations, e.g.
+    set_period(ID, 'fix_finger', 50). The operation keeps the Node's offset, so it comes
+    due on the same ticks as if the Node had had this period all along.
+    '''
+    def set_period(self, ID, op_name, period):
+        op   = PERIODIC_OPS.index(op_name)
+        node = self.nodeDict[ID]
+        periods     = list(node.periods)
+        periods[op] = period
+        node.periods = tuple(periods)
+        if self.scheduler is not None:
+            self.scheduler.start_timer(node, op)
+
     '''
     Add item to the Chord ring. Note that I am cheating by just directly adding
     it in, rather than finding the successor and having the successor add the item.
     '''
     def add_item(self, item):
+        if len(self.membership) == 0:
+            raise ValueError('Cannot add items to a ring without Nodes')
         k, v = item
         self.item_keys.add(k)
-        for i, curr_ID in enumerate(self.nodeList):
-            prev_ID = self.nodeList[(i-1)%len(self.nodeList)]
-            if between(prev_ID, curr_ID, k):
-                self.nodeDict[curr_ID].var['storage'][k] = v
+        owner = self.membership.owner_of(k)
+        self.nodeDict[owner].store_item(k, v)
+        self.touched_storage.add(owner)
+
+    '''
+    Adds many items at once, cheating the same way add_item does. items is an iterable of
+    (key, value) pairs, or an array with a key column and a value column. The keys are
+    sorted once and matched to their owners with a single searchsorted over the sorted
+    Node IDs, and then every owner stores its whole run of keys in one update. Like
+    add_item, it raises a ValueError on a ring without Nodes, instead of dropping the items.
+    '''
+    def add_items(self, items):
+        dtype = np.int64 if self.space.m < 64 else object
+        if isinstance(items, np.ndarray):
+            keys, values = items[:, 0].astype(dtype), items[:, 1]
+        else:
+            pairs  = list(items)
+            keys   = np.fromiter((k for k, v in pairs), dtype=dtype, count=len(pairs))
+            values = np.fromiter((v for k, v in pairs), dtype=object, count=len(pairs))
+        if len(keys) == 0:
+            return
+        if len(self.membership) == 0:
+            raise ValueError('Cannot add items to a ring without Nodes')
+        order = np.argsort(keys)
+        if np.any(keys[order[1:]] == keys[order[:-1]]):
+            # a key given twice keeps its last value, as with repeated add_item calls
+            order = np.argsort(keys, kind='stable')
+            last  = np.append(keys[order[1:]] != keys[order[:-1]], True)
+            order = order[last]
+        keys   = keys[order]
+        values = values[order].tolist()
+
+        sorted_IDs = np.array(list(self.membership), dtype=dtype)
+        num_IDs    = len(sorted_IDs)
+        # bounds[j]:bounds[j+1] are the keys owned by sorted_IDs[j]. Keys past the last ID
+        # wrap around to the first one, and are the run from bounds[num_IDs] on.
+        owners = np.searchsorted(sorted_IDs, keys)
+        bounds = np.searchsorted(owners, np.arange(num_IDs + 1)).tolist() + [len(keys)]
+        keys   = keys.tolist()
+        self.item_keys.update(keys)
+        for j, ID in enumerate(sorted_IDs.tolist()):
+            runs = [(bounds[j], bounds[j + 1])]
+            if j == 0:
+                runs.append((bounds[num_IDs], bounds[num_IDs + 1]))
+            for start, end in runs:
+                if start < end:
+                    self.nodeDict[ID].store_many(keys[start:end], values[start:end])
+                    self.touched_storage.add(ID)
  
     # RMB: added step tracker to kwargs below
     def query_item(self, item_key):
-        print('Querying for {}'.format(item_key))
-        query_ID   = random.choice(list(self.nodeDict.keys()))
+        LOG.debug('Querying for {}', item_key)
+        query_ID   = self.membership.random_member()
+        if LOG.sink is not None:
+            LOG.event('query', key=item_key, node=query_ID, time=self.time)
         query_node = self.nodeDict[query_ID]
-        kwargs = {'dest_ID': query_ID, 'var_name': 'client', 'key': item_key, 
-                  'nodeDict': self.nodeDict, 'steps':0, 'step_tracker': self.step_tracker}
-        function_RPC = ('find_successor', kwargs)
-        query_node.incoming_RPCs.append(('function', function_RPC))
-
-    '''
-    Checks to see if the current state of the Chord Ring is "correct".
-    '''
-    def check_correctness(self):
-        key_list = list()
-        overall_fail_test = False
-        for node_ind, curr_ID in enumerate(self.nodeList):
-            to_print = '\n'
-            fail_test = False
-            to_print += 'Problems with Node {}\n'.format(curr_ID) +'-'*30
-            curr_node = self.nodeDict[curr_ID]
-
-            # Check predecessor is correct
-            e_pred_ID = self.nodeList[(node_ind-1)%len(self.nodeList)]
-            a_pred_ID = curr_node.var['pred_ID'] 
-            if not e_pred_ID == a_pred_ID:
-                fail_test = True
-                to_print += '\nNode {} has wrong predecessor. Expected: {}\tActual: {}'.format(curr_ID, e_pred_ID, a_pred_ID)
-
-            # Check if values in storage are correct
-            item_keys = list(curr_node.var['storage'].keys())
-            for item_key in item_keys:
-                j = (bisect.bisect_left(self.nodeList, item_key)) % len(self.nodeList)
-                e_ID = self.nodeList[j]
-                if not e_ID == curr_ID:
-                    fail_test = True
-                    to_print += '\nNode {} incorrectly possesses item with key {}. Expected Node: {}'.format(curr_ID, item_key, e_ID)
-            
-            # Check if finger table values are correct
-            for ind in range(c.ring_size):
-                key  = (curr_ID + 2**ind) % 2**c.ring_size
-                ft_i = curr_node.var['finger_table_{}'.format(ind)]
-                j = (bisect.bisect_left(self.nodeList, key)) % len(self.nodeList)
-                e_ft_i = self.nodeList[j]
-                if not ft_i == e_ft_i:
-                    fail_test = True
-                    to_print += '\nNode {} Has wrong finger table {} value. Expected: {}\tActual: {}'.format(curr_ID, ind, e_ft_i, ft_i)
-
-            # Check if successor list is correct
-            # The + 2 when indexing is because succ_list starts two the right with our implementation.
-            for ind, succ in enumerate(curr_node.var['succ_list']):
-                e_succ = self.nodeList[(node_ind + ind + 2) % len(self.nodeList)] 
-                if not e_succ == succ:
-                    fail_test = True
-                    to_print += '\nNode {} has wrong successor list value at index {}. Expected: {}\tActual: {}'.format(curr_ID, ind, e_succ, succ)
-
-            if fail_test:
-                overall_fail_test = True
-                print(to_print)
-        if not overall_fail_test:
-            print('No errors in Chord Ring')
+        query_node.receive_RPC(FindSuccessor(query_ID, CLIENT, item_key, 0))
+
+    '''
+    Routes a lookup for each of keys over the finger tables and successor lists the Nodes
+    have right now, without advancing the ring, and returns a RouteResult with the hop
+    count, terminal Node and correctness of every lookup (see Router). sources are the
+    IDs the lookups start at, random Nodes if not given.
+    '''
+    def route_lookups(self, keys, sources=None, max_hops=None):
+        IDs   = list(self.membership)
+        nodes = [self.nodeDict[ID] for ID in IDs]
+        succ_lists = [NO_ID if succ is None else succ for node in nodes for succ in node.succ_list]
+        if self.space.m < 64:
+            fingers = np.frombuffer(b''.join(node.finger_table.tobytes() for node in nodes), dtype=np.int64)
+        else:
+            fingers = [ID for node in nodes for ID in node.finger_table]
+        return Router(self.space, IDs, fingers, succ_lists).route(keys, sources, max_hops)
+
+    '''
+    Checks to see if the current state of the Chord Ring is "correct": every Node has the
+    predecessor, finger table and successor list it would have on a converged ring, and
+    only stores the items it is responsible for. Returns a CheckResult with how many
+    entries of each kind are wrong, and some examples. With incremental, only the Nodes
+    that may have changed since the last check are looked at again (see RingChecker).
+    '''
+    def check(self, incremental=False):
+        return self.checker.check(incremental)
+
+    '''
+    Same as check, for callers that only want a yes or no.
+    Prints any problems if verbose, and returns True if there were none.
+    '''
+    def check_correctness(self, verbose=True, incremental=False):
+        result = self.check(incremental)
+        if verbose:
+            print(result)
+        return result.ok
+
+    '''
+    Return key distribution function
+    '''
+    def return_key_distribution(self):
+        ''' scans through nodes and returns list of number of keys 
+        such that list is as long as nodeList'''
+        keyFreqList = []
+
+        for node_name in self.membership:
+            keyFreqList.append(self.nodeDict[node_name].count_keys())
+        assert len(keyFreqList) == len(self.membership), "error, keyFreqList list is len {}, nodeList is len {}".format(len(keyFreqList),
+                                                                                                                      len(self.membership))
+        return keyFreqList
+
+    '''
+    What return_key_distribution should be once the ring has converged, worked out from
+    the IDs and item keys alone instead of asking the Nodes. Items lost when a Node
+    failed are still counted.
+    '''
+    def expected_key_distribution(self):
+        dtype = np.int64 if self.space.m < 64 else object
+        keys  = np.fromiter(self.item_keys, dtype=dtype, count=len(self.item_keys))
+        return ownership_counts(np.array(list(self.membership), dtype=dtype), keys).tolist()
 
     '''
     To String function
     '''
     def __str__(self):
         to_print = ""
-        for ID in self.nodeList:
+        for ID in self.membership:
             node = self.nodeDict[ID]
             to_print += 'Node {}\n'.format(ID) + '-'*40 + '\n'
             #for RPC_message in node.incoming_RPCs:
             #    to_print += self.RPC_to_string(RPC_message)
             #to_print += 'RPC Queue: {}\n'.format(node.incoming_RPCs)
-            to_print += 'Successor List: {}\n'.format([node.var['finger_table_0']] + node.var['succ_list'])
-            to_print += 'Predecessor: {}\n'.format(node.var['pred_ID'])
-            for i in range(c.ring_size):
-                var_name = 'finger_table_{}'.format(i)
-                to_print += 'Finger Table Entry {}: {}\n'.format(i, node.var[var_name])
-            to_print += 'Stored keys: {}\n\n'.format(node.var['storage'].keys())
+            to_print += 'Successor List: {}\n'.format([node.finger_table[0]] + node.succ_list)
+            to_print += 'Predecessor: {}\n'.format(node.pred_ID)
+            for i, ft_i in enumerate(node.finger_table):
+                to_print += 'Finger Table Entry {}: {}\n'.format(i, ft_i)
+            to_print += 'Stored keys: {}\n\n'.format(node.stored_items().keys())
         return to_print
 
     def RPC_to_string(self, RPC_message):
-        RPC_type, RPC = RPC_message
-        if RPC_type == 'value':
-            return ''
-        else:
-            func_name, kwargs = RPC
-            to_print = '{}: '.format(func_name)
-            for k in kwargs.keys():
-                if k == 'nodeDict': continue
-                to_print += '{}-{} '.format(k, kwargs[k])
-            to_print += '\n'
-            return to_print
+        return '{}\n'.format(RPC_message)
@@ -0,0 +1,121 @@
+import gzip
+import json
+import random
+import sys
+
+# Levels, as in the logging module. A Logger at level OFF says nothing.
+DEBUG, INFO, WARNING, ERROR, OFF = 10, 20, 30, 40, 100
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR, 'off': OFF}
+
+class EventSink:
+    '''
+    Writes structured events as JSON lines, one object per event with its name under
+    'event'. A path ending in .gz is gzip compressed, which shrinks the repetitive lines of
+    a large sweep by around ten times. Events can be sampled, so diagnostics can stay on
+    during large runs: sample is the fraction of events kept, either one number for every
+    event or a dictionary by event name (events not in it are all kept). Sampling draws
+    from its own seeded generator, so it never changes the simulation's random stream.
+    It contains the following:
+        path:    Where the events go.
+        file:    The open file.
+        sample:  Fraction of events kept, see above.
+        rng:     random.Random deciding which events are kept.
+        written: Number of events written so far.
+    '''
+    __slots__ = ('path', 'file', 'sample', 'rng', 'written')
+
+    def __init__(self, path, sample=1.0, seed=0):
+        self.path    = path
+        self.file    = gzip.open(path, 'wt') if path.endswith('.gz') else open(path, 'w')
+        self.sample  = sample
+        self.rng     = random.Random(seed)
+        self.written = 0
+
+    def write(self, name, fields):
+        rate = self.sample.get(name, 1.0) if isinstance(self.sample, dict) else self.sample
+        if rate < 1.0 and self.rng.random() >= rate:
+            return
+        fields['event'] = name
+        self.file.write(json.dumps(fields))
+        self.file.write('\n')
+        self.written += 1
+
+    def close(self):
+        self.file.close()
+
+class Logger:
+    '''
+    Leveled messages and structured events of the simulator, replacing the prints of the
+    hot paths (one or two per lookup) that made large runs I/O-bound on stdout.
+    Messages are format strings with their arguments passed separately, as in
+    LOG.info('Adding node: {}', ID), and are only formatted if their level is on; below
+    the level, a message costs one comparison. Events (see EventSink) are only written if a
+    sink is set; hot paths check LOG.sink before calling event, so that without one they
+    do not even build the fields. It contains the following:
+        level:  Messages below this level are dropped. INFO by default, which keeps what
+            the simulator has always printed, except for the per-lookup chatter (DEBUG).
+        stream: Where messages are written, or None for whatever sys.stdout is at the time
+            (so redirecting stdout still works).
+        sink:   EventSink events are written to, or None.
+    '''
+    __slots__ = ('level', 'stream', 'sink')
+
+    def __init__(self, level=INFO, stream=None, sink=None):
+        self.level  = level
+        self.stream = stream
+        self.sink   = sink
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, msg, *args):
+        if level >= self.level:
+            stream = sys.stdout if self.stream is None else self.stream
+            stream.write((msg.format(*args) if args else msg) + '\n')
+
+    def debug(self, msg, *args):
+        if DEBUG >= self.level:
+            self.log(DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        if INFO >= self.level:
+            self.log(INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        if WARNING >= self.level:
+            self.log(WARNING, msg, *args)
+
+    def error(self, msg, *args):
+        if ERROR >= self.level:
+            self.log(ERROR, msg, *args)
+
+    '''
+    Writes an event named name with the given fields to the sink, if there is one.
+    '''
+    def event(self, name, **fields):
+        if self.sink is not None:
+            self.sink.write(name, fields)
+
+    '''
+    Sets the level (a number or one of the names in LEVELS) and, if events is a path,
+    starts writing events there, sampled at sample (see EventSink). Any earlier sink is
+    closed first.
+    '''
+    def configure(self, level=None, events=None, sample=1.0, seed=0):
+        if level is not None:
+            if isinstance(level, str):
+                if level.lower() not in LEVELS:
+                    raise ValueError('Unknown log level {!r}, expected one of {}'.format(level, tuple(LEVELS)))
+                level = LEVELS[level.lower()]
+            self.level = level
+        if events is not None:
+            self.close()
+            self.sink = EventSink(events, sample, seed)
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+# The simulator's logger, shared by every module.
+LOG = Logger()
@@ -0,0 +1,125 @@
+import csv
+
+from Messages import *
+
+# Approximate wire size of an RPC: opcode and destination, then its fields.
+HEADER_BYTES = 16
+# Approximate size of one item value.
+VALUE_BYTES  = 8
+
+class MetricsRegistry:
+    '''
+    Counts the traffic on a ring: every RPC that lands in a Node's mailbox, by opcode, with
+    a rough byte count, the items handed over between Nodes, and how long each mailbox has
+    ever been. Recording an RPC is one list update (two for store_items), and mailboxes keep
+    their own high-water marks (see Mailbox), so the registry is always on. Sizes are
+    estimates, not a wire format: HEADER_BYTES per RPC, space.m bits for every field, and a
+    key plus VALUE_BYTES for every item in a store_items. Periodic operations are counted
+    as the RPCs a Node sends itself to run them. It contains the following:
+        sent:        sent[op] is the number of RPCs of opcode op (see Messages.OP_NAMES) sent.
+        items_moved: Number of items sent in store_items RPCs, on joins and departures.
+        nodeDict:    The ring's Nodes, whose mailboxes have the high-water marks.
+        departed:    High-water marks of the Nodes that have left, by ID.
+        op_bytes:    op_bytes[op] is the size of an RPC of opcode op, items aside.
+        item_bytes:  Size of one item.
+    '''
+    __slots__ = ('sent', 'items_moved', 'nodeDict', 'departed', 'op_bytes', 'item_bytes')
+
+    def __init__(self, space, nodeDict):
+        ID_bytes = (space.m + 7) // 8
+        fields   = {cls.op: len(cls.__slots__) for cls in RPC.__subclasses__()}
+        self.op_bytes   = [HEADER_BYTES + ID_bytes * fields[op] for op in range(len(OP_NAMES))]
+        self.item_bytes = ID_bytes + VALUE_BYTES
+        self.nodeDict   = nodeDict
+        self.reset()
+
+    '''
+    Starts counting from zero, e.g. to leave out the traffic of building a ring.
+    '''
+    def reset(self):
+        self.sent        = [0] * len(OP_NAMES)
+        self.items_moved = 0
+        self.departed    = {}
+        for node in self.nodeDict.values():
+            node.incoming_RPCs.high_water = len(node.incoming_RPCs)
+
+    '''
+    Records RPC_message, which has just been put in a Node's mailbox.
+    '''
+    def record(self, RPC_message):
+        op = RPC_message.op
+        self.sent[op] += 1
+        if op == STORE_ITEMS:
+            self.items_moved += len(RPC_message.keys)
+
+    '''
+    Records num RPCs of opcode op at once, carrying num_items items between them, for
+    engines that process RPCs in batches instead of through mailboxes (see ArrayRing).
+    '''
+    def count(self, op, num, num_items=0):
+        self.sent[op]    += num
+        self.items_moved += num_items
+
+    '''
+    Keeps the high-water mark of a Node that is leaving the ring.
+    '''
+    def node_left(self, node):
+        self.departed[node.ID] = max(self.departed.get(node.ID, 0), node.incoming_RPCs.high_water)
+
+    '''
+    bytes[op] is roughly how many bytes the RPCs of opcode op took.
+    '''
+    @property
+    def bytes(self):
+        sizes = [num * size for num, size in zip(self.sent, self.op_bytes)]
+        sizes[STORE_ITEMS] += self.items_moved * self.item_bytes
+        return sizes
+
+    '''
+    Maps the ID of every Node that has been on the ring since the last reset to the most
+    RPCs that were ever waiting in its mailbox.
+    '''
+    @property
+    def high_water(self):
+        high_water = dict(self.departed)
+        for ID, node in self.nodeDict.items():
+            high_water[ID] = max(high_water.get(ID, 0), node.incoming_RPCs.high_water)
+        return high_water
+
+    '''
+    Every metric as (metric, name, value) rows: messages and bytes per opcode name, the
+    totals, items_moved, and the mailbox high-water mark of every Node, by ID.
+    '''
+    def rows(self):
+        sizes = self.bytes
+        for op, name in enumerate(OP_NAMES):
+            yield ('messages', name, self.sent[op])
+        for op, name in enumerate(OP_NAMES):
+            yield ('bytes', name, sizes[op])
+        yield ('messages', 'total', sum(self.sent))
+        yield ('bytes', 'total', sum(sizes))
+        yield ('items_moved', '', self.items_moved)
+        high_water = self.high_water
+        for ID in sorted(high_water):
+            yield ('mailbox_high_water', ID, high_water[ID])
+
+    '''
+    Writes rows() to a csv file at path, with a metric,name,value header.
+    '''
+    def write_csv(self, path):
+        with open(path, 'w') as metrics_file:
+            wr = csv.writer(metrics_file)
+            wr.writerow(['metric', 'name', 'value'])
+            wr.writerows(self.rows())
+
+    def __str__(self):
+        sizes = self.bytes
+        to_print = '{} messages, about {} bytes, {} items moved'.format(
+            sum(self.sent), sum(sizes), self.items_moved)
+        for op, name in enumerate(OP_NAMES):
+            if self.sent[op]:
+                to_print += '\n{}: {} messages, {} bytes'.format(name, self.sent[op], sizes[op])
+        high_water = self.high_water
+        if high_water:
+            to_print += '\nLongest mailbox: {} RPCs'.format(max(high_water.values()))
+        return to_print
@@ -0,0 +1,146 @@
+import numpy as np
+import random
+
+from IDSpace import NO_ID
+
+class RouteResult:
+    '''
+    Where a batch of lookups routed by Router.route ended up. All fields are arrays with
+    one entry per lookup:
+        sources:  ID of the Node each lookup started at.
+        keys:     The key looked up.
+        hops:     Number of Nodes that handled the lookup, counted like the steps of a
+            FindSuccessor message (so a key found by the first Node took 1 hop).
+        terminal: ID of the Node the lookup resolved to, or NO_ID if it was dropped: no
+            live finger to pass it on to, no live successor, or more than max_hops hops.
+        owner:    ID of the Node that is actually responsible for the key right now.
+    '''
+    __slots__ = ('sources', 'keys', 'hops', 'terminal', 'owner')
+
+    def __init__(self, sources, keys, hops, terminal, owner):
+        self.sources  = sources
+        self.keys     = keys
+        self.hops     = hops
+        self.terminal = terminal
+        self.owner    = owner
+
+    @property
+    def dropped(self):
+        return self.terminal == NO_ID
+
+    @property
+    def correct(self):
+        return self.terminal == self.owner
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __str__(self):
+        num_correct = int(np.count_nonzero(self.correct))
+        to_print = '{} lookups: {} correct, {} wrong, {} dropped'.format(
+            len(self), num_correct, len(self) - num_correct - int(np.count_nonzero(self.dropped)),
+            int(np.count_nonzero(self.dropped)))
+        if num_correct:
+            to_print += '\nMean hops of correct lookups: {:.3f}'.format(self.hops[self.correct].mean())
+        return to_print
+
+class Router:
+    '''
+    Runs Chord's greedy lookup routing for whole arrays of (source, key) pairs at once,
+    over a snapshot of the routing state of a ring, without ticking the ring. Each hop
+    does what Node.find_successor does: the lookup is done if the key is between the Node
+    and its first live successor, and otherwise goes to the last live finger strictly
+    between the Node and the key. The tables are taken as they are, so a ring in the middle
+    of churn routes (and misroutes) the way it would if the lookups were sent right now.
+    Unlike the protocol, a Node with no live successor drops the lookup instead of raising.
+    Both betweens are done on clockwise distances from the Node, which the tables hold
+    ready-made, so a hop is a couple of comparisons per finger. It contains the following:
+        space:      IDSpace of the ring.
+        IDs:        Sorted IDs of the Nodes on the ring. Everything else is indexed by
+            position in IDs.
+        next_pos:   N x m matrix of the position of each finger, or -1 where the finger is
+            unset or no longer on the ring.
+        finger_dist: N x m matrix of the distance from each Node to its fingers. A finger
+            that is the Node itself is at distance size, and a dead or unset one at size + 1,
+            so that only a lookup for the Node's own ID can use the first, and none the second.
+        succ:       ID of each Node's first live successor, or NO_ID if it has none.
+        succ_dist:  Distance from each Node to succ, size if it is its own successor, and
+            -1 if it has none.
+    '''
+    def __init__(self, space, IDs, fingers, succ_lists):
+        self.space = space
+        dtype      = np.int64 if space.m < 64 else object
+        order      = np.argsort(np.asarray(IDs, dtype=dtype), kind='stable')
+        self.IDs   = np.asarray(IDs, dtype=dtype)[order]
+        fingers    = np.asarray(fingers, dtype=dtype).reshape(len(order), space.m)[order]
+        self.next_pos = self.positions(fingers)
+        dist = (fingers - self.IDs[:, None]) & space.mask
+        self.finger_dist = np.where(self.next_pos == -1, space.size + 1, np.where(dist == 0, space.size, dist))
+        # The first live one of finger_table[0] and the successor list.
+        cands = np.concatenate([fingers[:, :1],
+                                np.asarray(succ_lists, dtype=dtype).reshape(len(order), -1)[order]], axis=1)
+        alive = self.positions(cands) != -1
+        has_succ  = alive.any(axis=1)
+        self.succ = np.where(has_succ, cands[np.arange(len(order)), alive.argmax(axis=1)], NO_ID)
+        dist = (self.succ - self.IDs) & space.mask
+        self.succ_dist = np.where(has_succ, np.where(dist == 0, space.size, dist), -1)
+
+    '''
+    Positions in IDs of an array of IDs, with -1 for IDs that are not on the ring.
+    '''
+    def positions(self, IDs):
+        if len(self.IDs) == 0:
+            return np.full(np.shape(IDs), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.IDs, IDs), len(self.IDs) - 1)
+        return np.where(self.IDs[pos] == IDs, pos, -1).astype(np.int64)
+
+    '''
+    ID of the Node responsible for each key.
+    '''
+    def owners(self, keys):
+        return self.IDs[np.searchsorted(self.IDs, keys) % len(self.IDs)]
+
+    '''
+    Routes a lookup for each of keys, starting at the Nodes in sources (random Nodes if
+    not given), and returns a RouteResult. Lookups still going after max_hops hops, which
+    defaults to the number of Nodes, are taken to be stuck in a loop and dropped.
+    '''
+    def route(self, keys, sources=None, max_hops=None):
+        dtype = self.IDs.dtype
+        keys  = np.asarray(keys, dtype=dtype)
+        num_IDs = len(self.IDs)
+        if num_IDs == 0:
+            raise ValueError('Cannot route lookups on an empty ring')
+        if sources is None:
+            rng = np.random.default_rng(random.getrandbits(64))
+            sources = self.IDs[rng.integers(0, num_IDs, len(keys))]
+        sources = np.asarray(sources, dtype=dtype)
+        pos = self.positions(sources)
+        if (pos == -1).any():
+            raise ValueError('Lookups can only start at Nodes on the ring')
+        if max_hops is None:
+            max_hops = num_IDs
+
+        hops     = np.full(len(keys), max_hops, dtype=np.int64)
+        terminal = np.full(len(keys), NO_ID, dtype=dtype)
+        active   = np.arange(len(keys))
+        at       = pos
+        todo     = keys
+        for i in range(max_hops):
+            if len(active) == 0:
+                break
+            key_dist = (todo - self.IDs[at]) & self.space.mask
+            succ_dist = self.succ_dist[at]
+            # between(ID, succ, key), which always holds when the Node is its own successor
+            done = ((key_dist > 0) & (key_dist <= succ_dist)) | (succ_dist == self.space.size)
+            terminal[active[done]] = self.succ[at[done]]
+            # Closest preceding finger: the last one strictly between the Node and the key.
+            # A lookup for the Node's own ID may use any live finger, itself included.
+            key_dist = np.where(key_dist == 0, self.space.size + 1, key_dist)
+            valid    = self.finger_dist[at] < key_dist[:, None]
+            last     = valid.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+            keep     = ~done & (succ_dist != -1) & valid.any(axis=1)
+            hops[active[~keep]] = i + 1
+            at       = self.next_pos[at[keep], last[keep]]
+            active, todo = active[keep], todo[keep]
+        return RouteResult(sources, keys, hops, terminal, self.owners(keys))
@@ -0,0 +1,249 @@
+import heapq
+
+from TimerWheel import TimerWheel
+
+class Scheduler:
+    '''
+    Shared bookkeeping for the engines that drive the Nodes of a ChordRing. Rather than
+    visiting every Node on every tick, the engines only visit a Node when it has an RPC
+    waiting or a periodic operation due. It contains the following:
+        ring:      The ChordRing being driven. Used for nodeDict and fire_periodic_ops.
+        time:      The tick currently being processed, or the last one processed if
+            we are in between ticks.
+        rank:      Maps IDs to the order in which the Nodes were added. Within a tick, Nodes
+            are visited in rank order, which is the order the round-robin loop used.
+        start:     Maps IDs to the tick the Node was added on. Used to rebuild Node counters.
+        curr_rank: Rank of the Node being visited, or None if we are in between ticks.
+        timers:    TimerWheel of (ID, rank, op, generation) timers, one per periodic
+            operation per Node. op indexes PERIODIC_OPS in Node.py.
+        timer_gen: Maps IDs to the current generation of each of their timers. Changing a
+            period bumps the generation, so the old timer is ignored when it comes up.
+        due_ops:   Maps IDs to the periodic ops that have come due for them this tick.
+
+    The Nodes end up in exactly the state the round-robin loop would leave them in, so hop
+    counts and timings are unchanged.
+    Subclasses decide how wake-ups are stored by implementing schedule and advance.
+    '''
+    def __init__(self, ring):
+        self.ring      = ring
+        self.time      = 0
+        self.rank      = {}
+        self.start     = {}
+        self.next_rank = 0
+        self.curr_rank = None
+        self.timers    = TimerWheel()
+        self.timer_gen = {}
+        self.due_ops   = {}
+
+    '''
+    Start keeping track of a Node that was just added to the ring.
+    '''
+    def add_node(self, node):
+        ID = node.ID
+        self.rank[ID]      = self.next_rank
+        self.start[ID]     = self.time
+        self.timer_gen[ID] = [0] * len(node.periods)
+        self.next_rank    += 1
+        for op in range(len(node.periods)):
+            self.start_timer(node, op)
+
+    '''
+    Forget about a Node that left the ring. Any wake-ups or timers still queued for it
+    are skipped when they come up, since its rank no longer matches.
+    '''
+    def remove_node(self, ID):
+        self.rank.pop(ID)
+        self.start.pop(ID)
+        self.timer_gen.pop(ID)
+        self.due_ops.pop(ID, None)
+
+    '''
+    Queue a wake-up for the Node at the given time.
+    '''
+    def schedule(self, ID, time):
+        raise NotImplementedError
+
+    '''
+    Processes every tick up to and including time + num_steps.
+    '''
+    def advance(self, num_steps=1, verbose=False):
+        raise NotImplementedError
+
+    '''
+    Called whenever an RPC lands in a Node's queue. If we are in the middle of a tick and
+    the Node comes later in the visiting order, it still gets to run this tick, just like in
+    the round-robin loop. Otherwise it runs next tick.
+    '''
+    def delivered(self, node):
+        ID = node.ID
+        if ID not in self.rank:
+            return
+        if self.curr_rank is not None and self.rank[ID] > self.curr_rank:
+            self.schedule(ID, self.time)
+        else:
+            self.schedule(ID, self.time + 1)
+
+    '''
+    Sets the timer for one of the Node's periodic operations to the next tick after the
+    current one that passes the same (counter + offset) % period test as
+    ChordRing.check_periodic_ops. Any earlier timer for that operation is dropped.
+    '''
+    def start_timer(self, node, op):
+        ID     = node.ID
+        period = node.periods[op]
+        phase  = self.time + 1 - self.start[ID] + node.counter[1]
+        self.timer_gen[ID][op] += 1
+        self.timers.schedule(self.time + 1 + (-phase) % period,
+                             (ID, self.rank[ID], op, self.timer_gen[ID][op]))
+
+    '''
+    Moves the timer wheel to the current tick. Every periodic operation that comes due is
+    noted in due_ops and its timer is set again one period later. Returns the IDs that
+    had an operation come due, in no particular order.
+    '''
+    def fire_timers(self):
+        woken = []
+        for ID, rank, op, gen in self.timers.advance_to(self.time):
+            # Stale timer for a Node that has left, or for a period that has since changed.
+            if self.rank.get(ID) != rank or self.timer_gen[ID][op] != gen:
+                continue
+            ops = self.due_ops.get(ID)
+            if ops is None:
+                ops = self.due_ops[ID] = []
+                woken.append(ID)
+            ops.append(op)
+            period = self.ring.nodeDict[ID].periods[op]
+            self.timers.schedule(self.time + period, (ID, rank, op, gen))
+        return woken
+
+    '''
+    Runs the Node for one tick: bring its counter up to date, queue any periodic operations
+    that are due, and serve its incoming RPCs.
+    '''
+    def visit(self, node, verbose):
+        ID = node.ID
+        node.counter[0] = self.time - self.start[ID]
+        ops = self.due_ops.pop(ID, None)
+        if ops is not None:
+            ops.sort()
+            self.ring.fire_periodic_ops(node, ops)
+        node.serve(verbose)
+        if len(node.incoming_RPCs) > 0:
+            self.schedule(ID, self.time + 1)
+
+
+class EventScheduler(Scheduler):
+    '''
+    Discrete-event engine. Keeps a priority queue of (time, rank, ID) wake-up events, and
+    virtual time jumps straight to the next event or timer, so ticks where no Node has
+    anything to do cost nothing. In addition to the Scheduler fields, it contains:
+        events:  Heap of (time, rank, ID) wake-up events.
+        pending: Maps IDs to the set of times that Node already has an event queued for.
+    '''
+    def __init__(self, ring):
+        super().__init__(ring)
+        self.events  = []
+        self.pending = {}
+
+    def add_node(self, node):
+        self.pending[node.ID] = set()
+        super().add_node(node)
+
+    def remove_node(self, ID):
+        super().remove_node(ID)
+        self.pending.pop(ID)
+
+    '''
+    Queue a wake-up for the Node at the given time, unless it already has one then.
+    '''
+    def schedule(self, ID, time):
+        pending = self.pending[ID]
+        if time in pending:
+            return
+        pending.add(time)
+        heapq.heappush(self.events, (time, self.rank[ID], ID))
+
+    '''
+    Processes every event up to and including tick time + num_steps. Ticks on which no Node
+    has anything to do are skipped entirely.
+    '''
+    def advance(self, num_steps=1, verbose=False):
+        end_time = self.time + num_steps
+        events   = self.events
+        nodeDict = self.ring.nodeDict
+        while True:
+            time = self.timers.next_expiry()
+            if events and (time is None or events[0][0] < time):
+                time = events[0][0]
+            if time is None or time > end_time:
+                break
+            self.time = time
+            for ID in self.fire_timers():
+                self.schedule(ID, time)
+            while events and events[0][0] == time:
+                time, rank, ID = heapq.heappop(events)
+                # Stale event for a Node that has since left (and maybe rejoined) the ring.
+                if self.rank.get(ID) != rank:
+                    continue
+                self.pending[ID].discard(time)
+                self.curr_rank = rank
+                self.visit(nodeDict[ID], verbose)
+            self.curr_rank = None
+        self.time = end_time
+        self.timers.advance_to(end_time)
+
+
+class WorklistScheduler(Scheduler):
+    '''
+    Tick-by-tick engine that keeps a worklist of the Nodes that have something to do.
+    Every tick is still stepped through, but a tick only costs as much as the work done
+    in it, not the size of the ring. In addition to the Scheduler fields, it contains:
+        work:      Heap of (rank, ID) for the Nodes still to be visited in the current tick.
+        in_work:   IDs that have already been put into work this tick.
+        next_work: Maps IDs to ranks for the Nodes that need to be visited next tick.
+    '''
+    def __init__(self, ring):
+        super().__init__(ring)
+        self.work      = []
+        self.in_work   = set()
+        self.next_work = {}
+
+    '''
+    Puts the Node on this tick's worklist or next tick's worklist, depending on when it
+    needs to be visited. Periodic wake-ups go through the timer wheel instead.
+    '''
+    def schedule(self, ID, time):
+        rank = self.rank[ID]
+        if time == self.time and self.curr_rank is not None:
+            if ID not in self.in_work:
+                self.in_work.add(ID)
+                heapq.heappush(self.work, (rank, ID))
+        else:
+            self.next_work[ID] = rank
+
+    '''
+    Steps through the next num_steps ticks, visiting only the Nodes on each tick's worklist.
+    '''
+    def advance(self, num_steps=1, verbose=False):
+        nodeDict = self.ring.nodeDict
+        for i in range(num_steps):
+            self.time += 1
+            in_work = self.next_work
+            for ID in self.fire_timers():
+                if ID not in in_work:
+                    in_work[ID] = self.rank[ID]
+            self.next_work = {}
+            if not in_work:
+                continue
+            work = [(rank, ID) for ID, rank in in_work.items()]
+            heapq.heapify(work)
+            self.work    = work
+            self.in_work = set(in_work)
+            while work:
+                rank, ID = heapq.heappop(work)
+                # Stale entry for a Node that has since left (and maybe rejoined) the ring.
+                if self.rank.get(ID) != rank:
+                    continue
+                self.curr_rank = rank
+                self.visit(nodeDict[ID], verbose)
+            self.curr_rank = None
@@ -0,0 +1,58 @@
+import constants as c
+import os
+import random
+
+from ArrayRing import ArrayRing
+from ChordRing import ChordRing
+from Log import LOG
+
+class SnapshotCache:
+    '''
+    Directory of stabilized Chord Ring snapshots (see ChordRing.save), so that experiments
+    which need the same topology over and over only have to build it once.
+    Snapshots are keyed by (num_nodes, ring_size, seed, engine), since every engine uses the
+    random generator a little differently while building. It contains the following:
+        directory: Where the snapshots are kept. Created on the first save.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+
+    '''
+    Path of the snapshot for the given key. ring_size always comes from constants.
+    '''
+    def path(self, num_nodes, seed, engine='event'):
+        return os.path.join(self.directory, 'ring_nodes_{}_m_{}_seed_{}_{}.npz'.format(
+            num_nodes, c.ring_size, seed, engine))
+
+    '''
+    Returns a warm Chord Ring for the key. If there is no snapshot for it yet, the global
+    random generator is seeded with seed, build(num_nodes) is called to make the ring,
+    and the result is saved for next time. engine and service_rate are passed on to
+    ChordRing.load; the 'array' engine loads the snapshot as an ArrayRing instead.
+    Either way, the global random generator is then seeded again from seed, so whatever
+    the caller draws next (the keys and lookups of a Workload, say) is the same whether the
+    snapshot was just built or loaded from disk.
+    '''
+    def load_or_build(self, num_nodes, seed, build, engine='event', service_rate=None):
+        path = self.path(num_nodes, seed, engine)
+        if os.path.exists(path):
+            LOG.info('Loading ring snapshot {}', path)
+        else:
+            random.seed(seed)
+            chord = build(num_nodes)
+            os.makedirs(self.directory, exist_ok=True)
+            # Save under a temporary name first, so that jobs running side by side never load
+            # a half-written snapshot.
+            tmp_path = '{}.{}.tmp.npz'.format(path[:-len('.npz')], os.getpid())
+            chord.save(tmp_path)
+            os.replace(tmp_path, path)
+            LOG.info('Saved ring snapshot {}', path)
+        chord = self.load(path, engine, service_rate)
+        # Not seed itself, which would replay the draws that built the ring.
+        random.seed('{} loaded'.format(seed))
+        return chord
+
+    def load(self, path, engine, service_rate):
+        if engine == 'array':
+            return ArrayRing.load(path)
+        return ChordRing.load(path, engine, service_rate)
@@ -0,0 +1,172 @@
+import math
+import numpy as np
+
+# Quantiles main_server.py writes out, next to the mean.
+QUANTILES = (0.5, 0.9, 0.99)
+
+class StreamingStats:
+    '''
+    Running summary of a stream of non-negative integers, like the hop counts of lookups,
+    in memory that does not grow with the number of values. Sums are kept as exact Python
+    integers, so the mean and variance are exact too. Quantiles come from an HDR style
+    histogram: values below 2**sub_bits each get their own bucket, and larger values share
+    a bucket with the values that agree with them on their top sub_bits - 1 bits, so a
+    quantile is off by at most a fraction 2**-(sub_bits - 1) of its value (hop counts,
+    which stay far below 2**sub_bits, are exact). It contains the following:
+        count:    Number of values seen.
+        total:    Their sum.
+        squares:  The sum of their squares.
+        min, max: Smallest and largest value, or None before the first one.
+        sub_bits: Precision of the histogram, see above.
+        buckets:  Number of values in each bucket of the histogram. It grows to fit the
+            largest value seen, which for 64-bit values is a few thousand buckets at most.
+    '''
+    __slots__ = ('count', 'total', 'squares', 'min', 'max', 'sub_bits', 'buckets')
+
+    def __init__(self, sub_bits=7):
+        self.count    = 0
+        self.total    = 0
+        self.squares  = 0
+        self.min      = None
+        self.max      = None
+        self.sub_bits = sub_bits
+        self.buckets  = []
+
+    '''
+    Adds one value.
+    '''
+    def add(self, value):
+        self.count   += 1
+        self.total   += value
+        self.squares += value * value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        ind = self.bucket_of(value)
+        if ind >= len(self.buckets):
+            self.buckets.extend([0] * (ind + 1 - len(self.buckets)))
+        self.buckets[ind] += 1
+
+    '''
+    Adds a whole array of values at once, e.g. the hop counts of a RouteResult.
+    '''
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.int64)
+        if len(values) == 0:
+            return
+        low, high = int(values.min()), int(values.max())
+        self.count   += len(values)
+        # int64 sums, in slices short enough not to overflow
+        step = max(1, ((1 << 63) - 1) // max(1, high))
+        self.total   += sum(int(values[i:i + step].sum()) for i in range(0, len(values), step))
+        if high < 1 << 31:
+            step = max(1, ((1 << 63) - 1) // max(1, high * high))
+            self.squares += sum(int(np.dot(values[i:i + step], values[i:i + step])) for i in range(0, len(values), step))
+        else:
+            self.squares += sum(v * v for v in values.tolist())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        counts = np.bincount(self.buckets_of(values)).tolist()
+        if len(counts) > len(self.buckets):
+            self.buckets.extend([0] * (len(counts) - len(self.buckets)))
+        for ind, num in enumerate(counts):
+            self.buckets[ind] += num
+
+    '''
+    Adds everything another StreamingStats (with the same sub_bits) has seen.
+    '''
+    def merge(self, other):
+        if other.sub_bits != self.sub_bits:
+            raise ValueError('Cannot merge histograms with {} and {} sub_bits'.format(self.sub_bits, other.sub_bits))
+        if other.count == 0:
+            return
+        self.count   += other.count
+        self.total   += other.total
+        self.squares += other.squares
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        if len(other.buckets) > len(self.buckets):
+            self.buckets.extend([0] * (len(other.buckets) - len(self.buckets)))
+        for ind, num in enumerate(other.buckets):
+            self.buckets[ind] += num
+
+    '''
+    Index of the histogram bucket value goes in.
+    '''
+    def bucket_of(self, value):
+        exact = 1 << self.sub_bits
+        if value < exact:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return exact + (shift - 1) * (exact >> 1) + (value >> shift) - (exact >> 1)
+
+    '''
+    bucket_of for an int64 array.
+    '''
+    def buckets_of(self, values):
+        exact = 1 << self.sub_bits
+        # frexp gives the bit length, except where rounding to a float carried into the
+        # next power of two
+        bits  = np.frexp(values.astype(np.float64))[1].astype(np.int64)
+        bits -= (values >> np.maximum(bits - 1, 0)) == 0
+        shift = np.maximum(bits - self.sub_bits, 1)
+        inds  = exact + (shift - 1) * (exact >> 1) + (values >> shift) - (exact >> 1)
+        return np.where(values < exact, values, inds)
+
+    '''
+    Smallest value that falls in bucket ind.
+    '''
+    def bucket_start(self, ind):
+        exact = 1 << self.sub_bits
+        if ind < exact:
+            return ind
+        shift, top = divmod(ind - exact, exact >> 1)
+        return (top + (exact >> 1)) << (shift + 1)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else math.nan
+
+    @property
+    def variance(self):
+        if not self.count:
+            return math.nan
+        return (self.count * self.squares - self.total * self.total) / (self.count * self.count)
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    '''
+    The value below which a fraction q of the values lie, e.g. q=0.99 for p99 (see the
+    class docstring for how exact it is).
+    '''
+    def quantile(self, q):
+        if not self.count:
+            return math.nan
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for ind, num in enumerate(self.buckets):
+            seen += num
+            if seen >= rank:
+                return min(max(self.bucket_start(ind), self.min), self.max)
+        return self.max
+
+    '''
+    count, mean, std, min, max and the QUANTILES (as p50, p90, p99) in a dictionary.
+    '''
+    def summary(self):
+        summary = {'count': self.count, 'mean': self.mean, 'std': self.std, 'min': self.min, 'max': self.max}
+        for q in QUANTILES:
+            summary['p{:g}'.format(100 * q)] = self.quantile(q)
+        return summary
+
+    def __len__(self):
+        return self.count
+
+    def __str__(self):
+        if not self.count:
+            return 'No values'
+        return '{} values, mean {:.3f}, std {:.3f}, min {}, '.format(self.count, self.mean, self.std, self.min) + \
+            ', '.join('p{:g} {}'.format(100 * q, self.quantile(q)) for q in QUANTILES) + ', max {}'.format(self.max)
@@ -0,0 +1,103 @@
+class TimerWheel:
+    '''
+    Hierarchical timer wheel. Holds (time, item) timers and hands back the items that
+    come due as time moves forward, without looking at timers that are not due yet.
+    It contains the following:
+        now:       The current time. Timers must always be scheduled after it.
+        slot_bits: log2 of the number of slots per level.
+        levels:    levels[k] is a list of slots, each a list of (time, item) pairs. A timer sits
+            on the lowest level k whose slots cover the same block of 2**(slot_bits*(k+1)) ticks
+            as now, in slot (time >> slot_bits*k) % num_slots. Level 0 therefore holds timers
+            for the next few ticks, one slot per tick, and each level above it covers a span
+            num_slots times longer. When now enters a new block, the slot for that block is
+            cascaded down to the lower levels.
+        size:      Number of timers currently scheduled.
+        expiry:    Cached result of next_expiry, or None if it needs to be worked out again.
+    '''
+    def __init__(self, now=0, slot_bits=6):
+        self.now       = now
+        self.slot_bits = slot_bits
+        self.num_slots = 1 << slot_bits
+        self.mask      = self.num_slots - 1
+        self.levels    = []
+        self.size      = 0
+        self.expiry    = None
+
+    def __len__(self):
+        return self.size
+
+    '''
+    Schedule item to come due at the given time, which has to be later than now.
+    '''
+    def schedule(self, time, item):
+        self.insert(time, item)
+        self.size += 1
+        if self.size == 1 or (self.expiry is not None and time < self.expiry):
+            self.expiry = time
+
+    def insert(self, time, item):
+        bits  = self.slot_bits
+        level = 0
+        while (time >> (bits * (level + 1))) != (self.now >> (bits * (level + 1))):
+            level += 1
+        while len(self.levels) <= level:
+            self.levels.append([[] for i in range(self.num_slots)])
+        self.levels[level][(time >> (bits * level)) & self.mask].append((time, item))
+
+    '''
+    Moves now forward to the given time and returns the items that are due at it.
+    There must not be any timers due strictly between the old now and the new one,
+    which holds as long as time is never past next_expiry().
+    '''
+    def advance_to(self, time):
+        old_time = self.now
+        if time == old_time:
+            return []
+        self.now = time
+        if self.expiry is not None and time >= self.expiry:
+            self.expiry = None
+        bits = self.slot_bits
+        # Cascade the slots of every block we just entered, from the top level down, so that
+        # their timers end up on the level that matches the new now.
+        for level in range(len(self.levels) - 1, 0, -1):
+            if (time >> (bits * level)) == (old_time >> (bits * level)):
+                continue
+            slot = self.levels[level][(time >> (bits * level)) & self.mask]
+            if slot:
+                timers = slot[:]
+                del slot[:]
+                for timer_time, item in timers:
+                    self.insert(timer_time, item)
+        if not self.levels:
+            return []
+        slot = self.levels[0][time & self.mask]
+        if not slot:
+            return []
+        due = [item for timer_time, item in slot]
+        del slot[:]
+        self.size -= len(due)
+        return due
+
+    '''
+    Returns the earliest time any timer is due, or None if there are none. Only the
+    slots ahead of now are looked at, level by level, and the first non-empty one found
+    holds the earliest timers, since every level only covers times past the levels below.
+    '''
+    def next_expiry(self):
+        if self.size == 0:
+            return None
+        if self.expiry is None:
+            self.expiry = self.find_expiry()
+        return self.expiry
+
+    def find_expiry(self):
+        bits = self.slot_bits
+        for level, slots in enumerate(self.levels):
+            curr = (self.now >> (bits * level)) & self.mask
+            for ind in range(curr + 1, self.num_slots):
+                slot = slots[ind]
+                if slot:
+                    if level == 0:
+                        return ((self.now >> bits) << bits) | ind
+                    return min(timer_time for timer_time, item in slot)
+        return None
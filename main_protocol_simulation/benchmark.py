@@ -0,0 +1,235 @@
+'''
+Benchmarks of the simulator's hot paths, over a grid of ring sizes (-n) and item counts
+(-k), with fixed seeds:
+    tick:               advance_all_one_step on a converged ring, per Node-tick.
+    add_item:           add_item, one item at a time, per item.
+    add_items:          Bulk loading all K items with add_items, per item.
+    find_successor:     The find_successor handler, per hop, over a batch of lookups.
+    send_items:         The send_items and store_items handlers of joins into a loaded ring,
+                        per join.
+    check_correctness:  A full check of a converged, loaded ring.
+    return_query_steps: The whole count_query_steps scenario: joins through the protocol,
+                        stabilization and 1000 lookups. Only run up to --max_scenario_nodes.
+Every case runs in a fresh process, so its peak memory (ru_maxrss) is its own and earlier
+cases cannot warm it up. Results are written as JSON, and --baseline compares them with
+an earlier run, e.g.
+    python benchmark.py --quick -o new.json --baseline baseline.json
+'''
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import constants as c
+import numpy as np
+
+from ChordRing import ChordRing
+from Messages import FIND_SUCCESSOR, SEND_ITEMS, STORE_ITEMS
+from Profiler import Profiler
+from Workload import Workload
+
+# Wide enough for 65536 Nodes and a million keys, whatever constants.ring_size is.
+RING_SIZE = 32
+NODES     = (16, 256, 4096, 65536)
+KEYS      = (1000, 32000, 1000000)
+
+# Ticks timed by tick, lookups routed by find_successor and return_query_steps, and Nodes
+# joined by send_items.
+NUM_TICKS   = c.max_offset
+NUM_QUERIES = 1000
+NUM_JOINS   = 32
+
+def converged_ring(num_nodes, num_keys, seed, engine):
+    random.seed(seed)
+    workload = Workload(ChordRing(ring_size=RING_SIZE).space, seed)
+    IDs  = workload.unique_keys(num_nodes).tolist()
+    keys = workload.unique_keys(num_keys).tolist()
+    return ChordRing.from_converged(IDs, keys, engine=engine, ring_size=RING_SIZE), workload, keys
+
+def bench_tick(num_nodes, num_keys, seed, engine):
+    chord, workload, keys = converged_ring(num_nodes, num_keys, seed, engine)
+    start = time.perf_counter()
+    for i in range(NUM_TICKS):
+        chord.advance_all_one_step()
+    return time.perf_counter() - start, NUM_TICKS * num_nodes
+
+def bench_add_item(num_nodes, num_keys, seed, engine):
+    chord, workload, keys = converged_ring(num_nodes, 0, seed, engine)
+    keys  = workload.unique_keys(num_keys).tolist()
+    start = time.perf_counter()
+    for key in keys:
+        chord.add_item((key, key))
+    return time.perf_counter() - start, num_keys
+
+def bench_add_items(num_nodes, num_keys, seed, engine):
+    chord, workload, keys = converged_ring(num_nodes, 0, seed, engine)
+    keys  = workload.unique_keys(num_keys).tolist()
+    start = time.perf_counter()
+    chord.add_items(zip(keys, keys))
+    return time.perf_counter() - start, num_keys
+
+def bench_find_successor(num_nodes, num_keys, seed, engine):
+    chord, workload, keys = converged_ring(num_nodes, num_keys, seed, engine)
+    profiler = Profiler()
+    profiler.time_handlers()
+    try:
+        for key in workload.queries(keys, NUM_QUERIES).tolist():
+            chord.query_item(key)
+        chord.run_until_idle(NUM_QUERIES * RING_SIZE)
+    finally:
+        profiler.restore_handlers()
+    return profiler.handler_time[FIND_SUCCESSOR], profiler.handler_calls[FIND_SUCCESSOR]
+
+def bench_send_items(num_nodes, num_keys, seed, engine):
+    chord, workload, keys = converged_ring(num_nodes, num_keys, seed, engine)
+    profiler = Profiler()
+    profiler.time_handlers()
+    try:
+        # one at a time, since Nodes joining side by side can trip each other up
+        for i in range(NUM_JOINS):
+            chord.add_node(chord.unused_ID())
+            chord.run_until_idle(c.max_offset * 10)
+    finally:
+        profiler.restore_handlers()
+    return profiler.handler_time[SEND_ITEMS] + profiler.handler_time[STORE_ITEMS], profiler.handler_calls[SEND_ITEMS]
+
+def bench_check_correctness(num_nodes, num_keys, seed, engine):
+    chord, workload, keys = converged_ring(num_nodes, num_keys, seed, engine)
+    start = time.perf_counter()
+    chord.check_correctness(verbose=False)
+    return time.perf_counter() - start, 1
+
+def bench_return_query_steps(num_nodes, num_keys, seed, engine):
+    random.seed(seed)
+    start = time.perf_counter()
+    chord = ChordRing(engine=engine, ring_size=RING_SIZE)
+    workload = Workload(chord.space, seed)
+    chord.add_node(chord.unused_ID())
+    keys = workload.unique_keys(num_keys)
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
+    for i in range(num_nodes):
+        chord.add_node(chord.unused_ID())
+        chord.advance(20 * c.max_offset)
+    chord.run_until(ChordRing.is_converged, c.max_offset*100, check_every=c.max_offset*10)
+    chord.check_correctness(verbose=False)
+    for key in workload.queries(keys, NUM_QUERIES).tolist():
+        chord.query_item(key)
+        chord.advance(1)
+    chord.run_until_idle(NUM_QUERIES * RING_SIZE)
+    return time.perf_counter() - start, 1
+
+BENCHMARKS = {'tick':               bench_tick,
+              'add_item':           bench_add_item,
+              'add_items':          bench_add_items,
+              'find_successor':     bench_find_successor,
+              'send_items':         bench_send_items,
+              'check_correctness':  bench_check_correctness,
+              'return_query_steps': bench_return_query_steps}
+
+'''
+Runs one case in this process and returns its result. The simulator prints as it goes,
+which is thrown away rather than timed along.
+'''
+def run_case(name, num_nodes, num_keys, seed, engine, repeat):
+    times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(repeat):
+            seconds, ops = BENCHMARKS[name](num_nodes, num_keys, seed, engine)
+            times.append(seconds)
+    seconds = min(times)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+    return {'benchmark': name, 'nodes': num_nodes, 'keys': num_keys, 'engine': engine,
+            'seconds': seconds, 'ops': ops, 'us_per_op': 1e6 * seconds / ops if ops else None,
+            'repeat': repeat, 'peak_rss_mb': peak_mb}
+
+'''
+Runs a case in a child process (see run_case) and returns its result.
+'''
+def run_in_child(name, num_nodes, num_keys, seed, engine, repeat):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', name,
+                             '-n', str(num_nodes), '-k', str(num_keys), '--seed', str(seed),
+                             '--engine', engine, '--repeat', str(repeat)],
+                            stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+'''
+Compares results with those of a baseline run, case by case, and prints how much slower
+or faster each one got. Returns the cases that got slower by more than tolerance.
+'''
+def compare(results, baseline, tolerance):
+    before = {(r['benchmark'], r['nodes'], r['keys'], r['engine']): r for r in baseline['results']}
+    slower = []
+    print('{:<20}{:>8}{:>10}{:>14}{:>14}{:>8}{:>12}'.format('benchmark', 'nodes', 'keys', 'baseline s', 'now s', 'ratio', 'peak MB'))
+    for result in results:
+        key = (result['benchmark'], result['nodes'], result['keys'], result['engine'])
+        if key not in before:
+            continue
+        ratio = result['seconds'] / before[key]['seconds'] if before[key]['seconds'] > 0 else float('inf')
+        flag  = ''
+        if ratio > 1 + tolerance:
+            flag = ' SLOWER'
+            slower.append(result)
+        elif ratio < 1 - tolerance:
+            flag = ' faster'
+        print('{:<20}{:>8}{:>10}{:>14.4f}{:>14.4f}{:>8.2f}{:>12.1f}{}'.format(key[0], key[1], key[2],
+            before[key]['seconds'], result['seconds'], ratio, result['peak_rss_mb'], flag))
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type = int, nargs = "+", default = NODES, help = "ring sizes")
+    parser.add_argument("-k", type = int, nargs = "+", default = KEYS, help = "item counts")
+    parser.add_argument("--benchmarks", nargs = "+", default = list(BENCHMARKS), choices = list(BENCHMARKS))
+    parser.add_argument("--engine", default = "event", choices = ["event", "worklist", "round_robin"])
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--repeat", type = int, default = 1, help = "runs per case; the fastest counts")
+    parser.add_argument("--max_scenario_nodes", type = int, default = 256,
+                        help = "largest ring return_query_steps builds through the join protocol")
+    parser.add_argument("--quick", action = "store_true", help = "only 16 and 256 nodes with 1000 items")
+    parser.add_argument("-o", "--output", default = "benchmark.json")
+    parser.add_argument("--baseline", default = None, help = "earlier output to compare with")
+    parser.add_argument("--tolerance", type = float, default = 0.1,
+                        help = "slowdown over the baseline, as a fraction, that counts as a regression")
+    parser.add_argument("--case", default = None, help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case, args.n[0], args.k[0], args.seed, args.engine, args.repeat)))
+        return
+    if args.quick:
+        args.n, args.k = [16, 256], [1000]
+
+    results = []
+    for name in args.benchmarks:
+        for num_nodes in args.n:
+            if name == 'return_query_steps' and num_nodes > args.max_scenario_nodes:
+                continue
+            for num_keys in args.k:
+                result = run_in_child(name, num_nodes, num_keys, args.seed, args.engine, args.repeat)
+                print('{:<20} nodes {:>6} keys {:>8}: {:.4f}s, {} ops, {} us/op, peak {:.1f} MB'.format(
+                    name, num_nodes, num_keys, result['seconds'], result['ops'],
+                    'n/a' if result['us_per_op'] is None else '{:.2f}'.format(result['us_per_op']), result['peak_rss_mb']))
+                results.append(result)
+
+    with open(args.output, 'w') as output:
+        json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                   'seed': args.seed, 'ring_size': RING_SIZE, 'results': results}, output, indent=1)
+    print('Wrote {}'.format(args.output))
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline:
+            slower = compare(results, json.load(baseline), args.tolerance)
+        if slower:
+            print('{} cases got slower than the baseline'.format(len(slower)))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -5,3 +5,5 @@ successor_list_size = 5 #This is r in the paper
 stabilize_period = max_offset * 2 
 fix_finger_period = max_offset
 check_pred_period = max_offset * 3
+
+service_rate = 1 # RPCs each Node processes per tick. 0 means drain the whole queue.
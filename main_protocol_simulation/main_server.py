@@ -1,7 +1,11 @@
 from ChordRing import ChordRing
+from Log import LOG
+from Profiler import Profiler
+from Stats import QUANTILES
+from Workload import Workload
 import constants as c
+import numpy as np
 import random
-from statistics import mean 
 import argparse
 import os
 import csv
@@ -11,20 +15,28 @@ parser = argparse.ArgumentParser()
 parser.add_argument("-k", type = int)
 parser.add_argument("-n", type = int)
 parser.add_argument("-i", type = int)
+parser.add_argument("--watch_load", action = "store_true",
+                    help = "sample mailbox depths and report the busiest nodes of every phase")
+parser.add_argument("--profile", action = "store_true",
+                    help = "also time every RPC handler and print the timings of every phase")
+parser.add_argument("--profile_dump", default = None, choices = ["cprofile", "sample"],
+                    help = "write a cProfile or sampling profile of every phase to --profile_dir")
+parser.add_argument("--profile_dir", default = "profiles")
+parser.add_argument("--log_level", default = "info", choices = ["debug", "info", "warning", "error", "off"],
+                    help = "debug also prints every lookup and the whole ring; warning keeps large sweeps quiet")
+parser.add_argument("--events", default = None,
+                    help = "write structured events (joins, departures, lookups) here as JSON lines, gzipped if it ends in .gz")
+parser.add_argument("--event_sample", type = float, default = 1.0, help = "fraction of the events to keep")
 args = parser.parse_args()
 print(args)
+LOG.configure(args.log_level, args.events, args.event_sample)
 num_keys = args.k
 num_nodes = args.n
 iter = args.i
 output_path = "result_dump"
-
-def rand_key():
-    return random.randint(0, 2 ** c.ring_size)
-
-# RMB: added below to avoid many collisions when number of nodes approaches ring size
-def rand_address(nodeList):
-    allChoices = set([x for x in range(2 ** c.ring_size)])
-    return random.choice(list(allChoices - set(nodeList)))
+profiler = Profiler(args.profile_dump, args.profile_dir)
+if args.profile:
+    profiler.time_handlers()
 
 def check_lookups():
     num_keys = 2000
@@ -35,34 +47,30 @@ def check_lookups():
     steps_between_query = 1
 
     chord = ChordRing()
+    workload = Workload(chord.space)
 
     # Initialize Chord ring and add items.
-    chord.add_node(rand_key())
-    for i in range(num_keys):
-        key = rand_key()
-        chord.add_item((key, key))
+    chord.add_node(chord.unused_ID())
+    keys = np.unique(workload.keys(num_keys))
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
 
     # Slowly build up the Chord ring with nodes.
-    for i in range(num_nodes * num_steps_between_new_nodes):
-        if i % (num_steps_between_new_nodes) == 0:
-            chord.add_node(rand_key())
-        chord.advance_all_one_step(verbose=verbose)
+    for i in range(num_nodes):
+        chord.add_node(chord.unused_ID())
+        chord.advance(num_steps_between_new_nodes, verbose=verbose)
 
     # Give the Ring more time to properly get values.
-    for i in range(c.max_offset*50):
-        chord.advance_all_one_step(verbose=verbose)
+    chord.advance(c.max_offset*50, verbose=verbose)
 
-    print(chord)
+    LOG.debug('{}', chord)
     chord.check_correctness()
 
     # Query the Ring for items
-    for i in range(num_queries * steps_between_query):
-        if i % (steps_between_query) == 0:
-            item_key = random.sample(chord.item_keys, 1)[0]
-            chord.query_item(item_key)
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(num_queries * c.ring_size):
-        chord.advance_all_one_step(verbose=verbose)
+    for item_key in workload.queries(keys, num_queries).tolist():
+        chord.query_item(item_key)
+        chord.advance(steps_between_query, verbose=verbose)
+    steps = chord.run_until_idle(num_queries * c.ring_size, verbose=verbose)
+    print('All queries resolved after {} steps'.format(steps))
    
 
 def check_dropouts():
@@ -73,19 +81,17 @@ def check_dropouts():
     add_prob = 0.5
 
     chord = ChordRing()
+    workload = Workload(chord.space)
 
     # Initialize and add some Nodes
-    chord.add_node(rand_key())
-    for i in range(num_keys):
-        key = rand_key()
-        chord.add_item((key, key))
-
-    for i in range(num_initial_nodes * num_steps_between_add_drop):
-        if i % (num_steps_between_add_drop) == 0:
-            chord.add_node(rand_key())
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(c.max_offset * 50):
-        chord.advance_all_one_step(verbose=verbose)
+    chord.add_node(chord.unused_ID())
+    keys = np.unique(workload.keys(num_keys))
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
+
+    for i in range(num_initial_nodes):
+        chord.add_node(chord.unused_ID())
+        chord.advance(num_steps_between_add_drop, verbose=verbose)
+    chord.advance(c.max_offset * 50, verbose=verbose)
 
     print('\n' + '-'*40) 
     print('Checking correctness after initial adding of nodes.')
@@ -93,17 +99,15 @@ def check_dropouts():
     print('-'*40 + '\n') 
     
     # Randomly add and fail nodes. 
-    for i in range(num_add_drops * num_steps_between_add_drop):
-        if i % (num_steps_between_add_drop) == 0:
-            coinflip = random.random()
-            if coinflip < add_prob:
-                chord.add_node(rand_key())
-            else:
-                remove_ID = random.choice(list(chord.nodeDict.keys()))
-                chord.remove_node_failure(remove_ID)
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(c.max_offset * 50):
-        chord.advance_all_one_step(verbose=verbose)
+    for i in range(num_add_drops):
+        coinflip = random.random()
+        if coinflip < add_prob:
+            chord.add_node(chord.unused_ID())
+        else:
+            remove_ID = random.choice(list(chord.nodeDict.keys()))
+            chord.remove_node_failure(remove_ID)
+        chord.advance(num_steps_between_add_drop, verbose=verbose)
+    chord.advance(c.max_offset * 50, verbose=verbose)
 
     print('\n' + '-'*40) 
     print('Checking correctness after adding and removing of nodes.')
@@ -122,19 +126,17 @@ def check_dropout_graceful():
     steps_between_query = 1
 
     chord = ChordRing()
+    workload = Workload(chord.space)
 
     # Initialize and add some Nodes 
-    chord.add_node(rand_key())
-    for i in range(num_keys):
-        key = rand_key()
-        chord.add_item((key, key))
-
-    for i in range(num_initial_nodes * num_steps_between_add_drop):
-        if i % (num_steps_between_add_drop) == 0:
-            chord.add_node(rand_key())
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(c.max_offset * 50):
-        chord.advance_all_one_step(verbose=verbose)
+    chord.add_node(chord.unused_ID())
+    keys = np.unique(workload.keys(num_keys))
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
+
+    for i in range(num_initial_nodes):
+        chord.add_node(chord.unused_ID())
+        chord.advance(num_steps_between_add_drop, verbose=verbose)
+    chord.advance(c.max_offset * 50, verbose=verbose)
 
     print('\n' + '-'*40) 
     print('Checking correctness after initial adding of nodes.')
@@ -142,32 +144,28 @@ def check_dropout_graceful():
     print('-'*40 + '\n') 
     
     # Randomly add and GRACEFULLY fail some Nodes.
-    for i in range(num_add_drops * num_steps_between_add_drop):
-        if i % (num_steps_between_add_drop) == 0:
-            coinflip = random.random()
-            if coinflip < add_prob:
-                chord.add_node(rand_key())
-            else:
-                remove_ID = random.choice(list(chord.nodeDict.keys()))
-                chord.remove_node_graceful(remove_ID)
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(c.max_offset * 50):
-        chord.advance_all_one_step(verbose=verbose)
+    for i in range(num_add_drops):
+        coinflip = random.random()
+        if coinflip < add_prob:
+            chord.add_node(chord.unused_ID())
+        else:
+            remove_ID = random.choice(list(chord.nodeDict.keys()))
+            chord.remove_node_graceful(remove_ID)
+        chord.advance(num_steps_between_add_drop, verbose=verbose)
+    chord.advance(c.max_offset * 50, verbose=verbose)
 
     print('\n' + '-'*40) 
     print('Checking correctness after adding and removing of nodes.')
     chord.check_correctness()
     print('-'*40 + '\n') 
-    print(chord)
+    LOG.debug('{}', chord)
     
     # Query the Ring for items
-    for i in range(num_queries * steps_between_query):
-        if i % (steps_between_query) == 0:
-            item_key = random.sample(chord.item_keys, 1)[0]
-            chord.query_item(item_key)
-        chord.advance_all_one_step(verbose=verbose)
-    for i in range(num_queries * c.ring_size):
-        chord.advance_all_one_step(verbose=verbose)
+    for item_key in workload.queries(keys, num_queries).tolist():
+        chord.query_item(item_key)
+        chord.advance(steps_between_query, verbose=verbose)
+    steps = chord.run_until_idle(num_queries * c.ring_size, verbose=verbose)
+    print('All queries resolved after {} steps'.format(steps))
     
 
 def small_test():
@@ -176,22 +174,21 @@ def small_test():
     num_steps_between_new_nodes = 20 * c.max_offset
     
     chord = ChordRing()
-    chord.add_node(rand_key())
-    for i in range(num_keys):
-        key = rand_key()
-        chord.add_item((key, key))
-
-    for i in range(num_nodes * num_steps_between_new_nodes):
-        if i % (num_steps_between_new_nodes) == 0:
-            chord.add_node(rand_key())
-        chord.advance_all_one_step()
-    for i in range(c.max_offset*100):
-        chord.advance_all_one_step()
+    workload = Workload(chord.space)
+    chord.add_node(chord.unused_ID())
+    keys = np.unique(workload.keys(num_keys))
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
+
+    for i in range(num_nodes):
+        chord.add_node(chord.unused_ID())
+        chord.advance(num_steps_between_new_nodes)
+    steps = chord.run_until(ChordRing.is_converged, c.max_offset*100, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
     chord.stop_periodic=True
     print('No longer adding')
-    for i in range(c.max_offset*200):
-        chord.advance_all_one_step()
-    print(chord)
+    steps = chord.run_until(ChordRing.is_converged, c.max_offset*200, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
+    LOG.debug('{}', chord)
     chord.check_correctness()
 
 # RMB: added this function to test average number of steps following query
@@ -205,48 +202,63 @@ def return_query_steps(num_keys, num_nodes):
     steps_between_query = 1
     # initialize ring
     chord = ChordRing()
-    chord.add_node(rand_key())
-    for i in range(num_keys):
-        key = rand_key()
-        chord.add_item((key, key))
+    workload = Workload(chord.space)
+    if args.watch_load:
+        chord.watch_load()
+    chord.add_node(chord.unused_ID())
+    keys = np.unique(workload.keys(num_keys))
+    chord.add_items(zip(keys.tolist(), keys.tolist()))
   
     # add nodes
-    for i in range(num_nodes * num_steps_between_new_nodes):
-        if i % (num_steps_between_new_nodes) == 0:
+    with profiler.phase('join', chord):
+        for i in range(num_nodes):
             try:
-                chord.add_node(rand_address(chord.nodeList))
+                chord.add_node(chord.unused_ID())
             except Exception as e: 
                 print('no more names to allocate (more nodes than chord size?): {}'.format(e))
-        chord.advance_all_one_step()
-    for i in range(c.max_offset*100):
-        chord.advance_all_one_step()
+            chord.advance(num_steps_between_new_nodes)
+        steps = chord.run_until(ChordRing.is_converged, c.max_offset*100, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
     chord.stop_periodic=True
     print('No longer adding')
+    if args.watch_load:
+        print(chord.load_monitor.end_phase('join'))
 
     # stabliize and check correctness
-    for i in range(c.max_offset*200):
-        chord.advance_all_one_step()
-    print(chord)
-    chord.check_correctness()
+    with profiler.phase('stabilize', chord):
+        steps = chord.run_until(ChordRing.is_converged, c.max_offset*200, check_every=c.max_offset*10)
+    print('Stabilized after {} steps'.format(steps))
+    if args.watch_load:
+        print(chord.load_monitor.end_phase('stabilize'))
+    LOG.debug('{}', chord)
+    with profiler.phase('check', chord):
+        chord.check_correctness()
+    # only count the traffic of the lookups
+    chord.metrics.reset()
 
     # query
-    for i in range(num_queries * steps_between_query):
-        if i % (steps_between_query) == 0:
-            item_key = random.sample(chord.item_keys, 1)[0]
+    with profiler.phase('query', chord):
+        for item_key in workload.queries(keys, num_queries).tolist():
             chord.query_item(item_key)
-        chord.advance_all_one_step(verbose=verbose)
-
-    # to make sure all have cleared (max transit should be one time round)
-    for i in range(num_queries * c.ring_size):
-        chord.advance_all_one_step(verbose=verbose)
-    average_steps = mean(chord.step_tracker)
-    print('\n Average number of steps was {} for {} nodes with {} keys total!'.format(average_steps, 
+            chord.advance(steps_between_query, verbose=verbose)
+
+        # to make sure all have cleared (max transit should be one time round)
+        steps = chord.run_until_idle(num_queries * c.ring_size, verbose=verbose)
+    print('All queries resolved after {} steps'.format(steps))
+    if args.watch_load:
+        print(chord.load_monitor.end_phase('query'))
+    print('\n Average number of steps was {} for {} nodes with {} keys total!'.format(chord.step_tracker.mean, 
         num_nodes, num_keys))
-    return average_steps
+    print(chord.step_tracker)
+    print(chord.metrics)
+    print(profiler)
+    return chord.step_tracker, chord.metrics
 
 # helper function to write to csv file
 def output_steps(num_keys, num_nodes, output_path):
-    trial_steps = [num_keys, num_nodes, return_query_steps(num_keys, num_nodes)]
+    hop_stats, metrics = return_query_steps(num_keys, num_nodes)
+    trial_steps = [num_keys, num_nodes, hop_stats.mean] + [hop_stats.quantile(q) for q in QUANTILES] + [hop_stats.max,
+        profiler.node_ticks_per_sec('query')]
 
     # we are saving here
     path_string ='{}/count_steps_keys_{}_nodes_{}_iter_{}'.format(output_path, num_keys, num_nodes, iter) 
@@ -258,9 +270,14 @@ def output_steps(num_keys, num_nodes, output_path):
     # dump to csv
     with open(path_string, 'w') as myfile:
        wr = csv.writer(myfile)
-       wr.writerow(['num_keys', 'num_nodes', 'num_steps'])
+       wr.writerow(['num_keys', 'num_nodes', 'num_steps', 'p50_steps', 'p90_steps', 'p99_steps', 'max_steps', 'node_ticks_per_sec'])
        wr.writerow(trial_steps)
 
+    # message counts, bytes and mailbox depths of the lookups, next to the steps
+    metrics.write_csv('{}/metrics_keys_{}_nodes_{}_iter_{}'.format(output_path, num_keys, num_nodes, iter))
+    profiler.write_csv('{}/profile_keys_{}_nodes_{}_iter_{}'.format(output_path, num_keys, num_nodes, iter))
+
 if __name__ == "__main__":
     # input variables fed in through parser	
     output_steps(num_keys, num_nodes, output_path)
+    LOG.close()
@@ -0,0 +1,39 @@
+import constants as c
+import random
+
+from ChordRing import ChordRing
+
+'''
+Builds a ring through the join protocol, with some failures and graceful departures,
+and the same draws from the global random generator whatever the engine or storage.
+'''
+def churned_ring(seed=5, num_nodes=12, num_keys=200, **params):
+    random.seed(seed)
+    chord = ChordRing(**params)
+    chord.add_node(random.randint(0, 2**c.ring_size - 1))
+    for i in range(num_keys):
+        key = random.randint(0, 2**c.ring_size - 1)
+        chord.add_item((key, key))
+    for i in range(num_nodes):
+        chord.add_node(chord.unused_ID())
+        chord.advance(20 * c.max_offset)
+    chord.advance(30 * c.max_offset)
+    for i in range(2):
+        chord.remove_node_failure(random.choice(sorted(chord.nodeDict)))
+        chord.advance(5 * c.max_offset)
+        chord.remove_node_graceful(random.choice(sorted(chord.nodeDict)))
+        chord.advance(5 * c.max_offset)
+    chord.advance(30 * c.max_offset)
+    for i in range(50):
+        chord.query_item(random.choice(sorted(chord.item_keys)))
+        chord.advance(1)
+    chord.run_until_idle(10 * c.max_offset)
+    return chord
+
+'''
+Everything a Node knows, by ID, for comparing rings.
+'''
+def ring_state(chord):
+    return {ID: (node.pred_ID, list(node.finger_table), list(node.succ_list), node.next,
+                 node.joined, sorted(node.stored_items().items()))
+            for ID, node in chord.nodeDict.items()}
@@ -0,0 +1,60 @@
+import constants as c
+import numpy as np
+import pytest
+import random
+
+from ArrayRing import ArrayRing
+from ChordRing import ChordRing
+from Workload import Workload
+
+@pytest.fixture
+def converged(tmp_path):
+    random.seed(4)
+    workload = Workload(ChordRing().space, 4)
+    IDs  = workload.unique_keys(60).tolist()
+    keys = workload.unique_keys(400).tolist()
+    chord = ChordRing.from_converged(IDs, keys)
+    path  = str(tmp_path / 'ring.npz')
+    chord.save(path)
+    return chord, ArrayRing.load(path), keys
+
+def test_array_ring_matches_chord_ring(converged):
+    chord, ring, keys = converged
+    assert ring.check_correctness(verbose=False)
+    assert ring.check_correctness(verbose=False, incremental=True)
+    assert ring.return_key_distribution() == chord.return_key_distribution()
+    sources = [random.choice(ring.nodeList) for key in keys]
+    expected = chord.route_lookups(keys, sources)
+    actual   = ring.route_lookups(keys, sources)
+    assert (actual.terminal == expected.terminal).all()
+    assert (actual.hops == expected.hops).all()
+
+def test_array_ring_stays_converged(converged):
+    chord, ring, keys = converged
+    ring.advance(5 * c.max_offset)
+    for key in keys[:100]:
+        ring.query_item(key)
+    ring.run_until_idle(10 * c.max_offset)
+    assert ring.check_correctness(verbose=False)
+    assert ring.step_tracker.count == 100
+
+def test_array_ring_converges_after_joins():
+    random.seed(3)
+    ring = ArrayRing()
+    ring.add_node(ring.unused_ID())
+    ring.add_items((key, key) for key in random.sample(range(2**c.ring_size), 300))
+    for i in range(20):
+        ring.add_node(ring.unused_ID())
+        ring.advance(20 * c.max_offset)
+    ring.run_until(ArrayRing.is_converged, 100 * c.max_offset, check_every=c.max_offset)
+    assert ring.check_correctness(verbose=False)
+    assert sorted(ring.item_key.tolist()) == sorted(ring.item_keys)
+
+def test_array_ring_add_items_needs_nodes():
+    ring = ArrayRing()
+    with pytest.raises(ValueError):
+        ring.add_item((1, 1))
+    with pytest.raises(ValueError):
+        ring.add_items([(1, 1)])
+    ring.add_items([])
+    assert len(ring.item_key) == 0
@@ -0,0 +1,41 @@
+import constants as c
+import random
+
+from ChordRing import ChordRing
+from Checker import RingChecker
+
+def test_incremental_matches_full_check():
+    random.seed(11)
+    chord = ChordRing()
+    chord.add_node(chord.unused_ID())
+    chord.add_items((key, key) for key in random.sample(range(2**c.ring_size), 200))
+    for step in range(40):
+        if step < 20 or step % 4 == 0:
+            chord.add_node(chord.unused_ID())
+        elif step % 4 == 1:
+            chord.remove_node_failure(random.choice(sorted(chord.nodeDict)))
+        elif step % 4 == 2:
+            chord.remove_node_graceful(random.choice(sorted(chord.nodeDict)))
+        chord.advance(random.randint(1, 3 * c.max_offset))
+        assert_same_check(chord)
+    chord.advance(50 * c.max_offset)
+    assert_same_check(chord)
+
+def assert_same_check(chord):
+    incremental = chord.check(incremental=True)
+    full = RingChecker(chord).check()
+    assert incremental.mismatches == full.mismatches
+    assert incremental.samples == full.samples
+    assert incremental.failing == full.failing
+    assert incremental.num_checked <= full.num_checked
+
+def test_converged_ring_passes_both_checks():
+    random.seed(3)
+    IDs  = random.sample(range(2**c.ring_size), 30)
+    keys = random.sample(range(2**c.ring_size), 200)
+    chord = ChordRing.from_converged(IDs, keys)
+    assert chord.check().ok
+    chord.advance(10 * c.max_offset)
+    assert chord.check(incremental=True).ok
+    chord.remove_node_failure(IDs[0])
+    assert not chord.check(incremental=True).ok
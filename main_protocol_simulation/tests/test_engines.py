@@ -0,0 +1,16 @@
+import pytest
+
+from ring_helpers import churned_ring, ring_state
+
+@pytest.fixture(scope='module')
+def round_robin():
+    return churned_ring(engine='round_robin')
+
+@pytest.mark.parametrize('engine', ['event', 'worklist'])
+def test_engine_matches_round_robin(engine, round_robin):
+    chord = churned_ring(engine=engine)
+    assert chord.time == round_robin.time
+    assert ring_state(chord) == ring_state(round_robin)
+    assert chord.step_tracker.total == round_robin.step_tracker.total
+    assert chord.step_tracker.count == round_robin.step_tracker.count
+    assert chord.check_correctness(verbose=False)
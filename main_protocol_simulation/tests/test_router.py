@@ -0,0 +1,53 @@
+import random
+
+from ChordRing import ChordRing
+from IDSpace import NO_ID
+from Node import between, between_exclusive
+from Workload import Workload
+from ring_helpers import churned_ring
+
+'''
+The lookup walk of Node.find_successor, one hop at a time, over the ring as it is.
+'''
+def walk(chord, source, key):
+    nodeDict = chord.nodeDict
+    at, hops = source, 0
+    while hops < len(nodeDict):
+        node = nodeDict[at]
+        hops += 1
+        succ = next((ID for ID in [node.finger_table[0]] + list(node.succ_list)
+                     if ID in nodeDict), None)
+        if succ is None:
+            return hops, NO_ID
+        if between(at, succ, key):
+            return hops, succ
+        at = next((ID for ID in reversed(node.finger_table)
+                   if ID != NO_ID and ID in nodeDict and between_exclusive(at, key, ID)), None)
+        if at is None:
+            return hops, NO_ID
+    return hops, NO_ID
+
+def check_against_walk(chord, keys, sources):
+    result = chord.route_lookups(keys, sources)
+    for i, (source, key) in enumerate(zip(sources, keys)):
+        hops, terminal = walk(chord, source, key)
+        assert terminal == result.terminal[i]
+        if terminal != NO_ID:
+            assert hops == result.hops[i]
+    return result
+
+def test_router_matches_walk_on_converged_ring():
+    random.seed(2)
+    workload = Workload(ChordRing().space, 2)
+    IDs  = workload.unique_keys(40).tolist()
+    keys = workload.unique_keys(300).tolist()
+    chord  = ChordRing.from_converged(IDs, keys)
+    result = check_against_walk(chord, keys, [random.choice(IDs) for key in keys])
+    assert result.correct.all()
+
+def test_router_matches_walk_after_churn():
+    chord = churned_ring()
+    for ID in random.sample(sorted(chord.nodeDict), 3):
+        chord.remove_node_failure(ID)
+    keys = sorted(chord.item_keys)
+    check_against_walk(chord, keys, [random.choice(sorted(chord.nodeDict)) for key in keys])
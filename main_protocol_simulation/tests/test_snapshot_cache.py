@@ -0,0 +1,35 @@
+import constants as c
+import pytest
+import random
+
+from ChordRing import ChordRing
+from SnapshotCache import SnapshotCache
+from ring_helpers import ring_state
+
+def build(num_nodes):
+    chord = ChordRing()
+    chord.add_node(chord.unused_ID())
+    for i in range(num_nodes - 1):
+        chord.add_node(chord.unused_ID())
+        chord.advance(20 * c.max_offset)
+    chord.run_until(ChordRing.is_converged, 100 * c.max_offset, check_every=c.max_offset)
+    return chord
+
+@pytest.mark.parametrize('engine', ['event', 'array'])
+def test_built_and_loaded_rings_match(engine, tmp_path):
+    cache = SnapshotCache(str(tmp_path))
+    built = cache.load_or_build(8, 3, build, engine)
+    draws_after_build = [random.random() for i in range(5)]
+    loaded = cache.load_or_build(8, 3, build, engine)
+    draws_after_load = [random.random() for i in range(5)]
+    assert draws_after_build == draws_after_load
+    assert built.check_correctness(verbose=False)
+    if engine == 'array':
+        assert built.IDs[:built.num_slots].tolist() == loaded.IDs[:loaded.num_slots].tolist()
+        assert (built.fingers[:built.num_slots] == loaded.fingers[:loaded.num_slots]).all()
+    else:
+        assert ring_state(built) == ring_state(loaded)
+
+def test_engines_have_their_own_snapshots(tmp_path):
+    cache = SnapshotCache(str(tmp_path))
+    assert cache.path(8, 3, 'event') != cache.path(8, 3, 'array')
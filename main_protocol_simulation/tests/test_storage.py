@@ -0,0 +1,29 @@
+import gc
+import os
+import pytest
+
+from ChordRing import ChordRing
+from ring_helpers import churned_ring, ring_state
+
+@pytest.fixture(scope='module')
+def dict_ring():
+    return churned_ring(storage='dict')
+
+@pytest.mark.parametrize('storage', ['sorted', 'array', 'memmap'])
+def test_storage_matches_dict(storage, dict_ring):
+    chord = churned_ring(storage=storage)
+    assert ring_state(chord) == ring_state(dict_ring)
+    assert chord.return_key_distribution() == dict_ring.return_key_distribution()
+
+def test_memmap_directory_per_ring(tmp_path):
+    rings = [ChordRing(storage='memmap', storage_dir=str(tmp_path)) for i in range(2)]
+    for chord in rings:
+        chord.add_node(5)
+        chord.add_items((key, key) for key in range(100))
+    assert rings[0].storage_dir != rings[1].storage_dir
+    assert all(os.path.dirname(chord.storage_dir) == str(tmp_path) for chord in rings)
+    assert all(len(chord.nodeDict[5].stored_items()) == 100 for chord in rings)
+    directory = rings[0].storage_dir
+    del rings[0], chord
+    gc.collect()
+    assert not os.path.exists(directory)
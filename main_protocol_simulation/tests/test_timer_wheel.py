@@ -0,0 +1,31 @@
+import heapq
+import pytest
+import random
+
+from TimerWheel import TimerWheel
+
+@pytest.mark.parametrize('slot_bits', [2, 6])
+def test_timer_wheel_matches_heap(slot_bits):
+    rng   = random.Random(slot_bits)
+    wheel = TimerWheel(slot_bits=slot_bits)
+    heap  = []
+    for i in range(300):
+        time = rng.randint(1, 5000)
+        wheel.schedule(time, i)
+        heapq.heappush(heap, (time, i))
+    reschedules = 200
+    while heap:
+        assert wheel.next_expiry() == heap[0][0]
+        time = heap[0][0]
+        due  = []
+        while heap and heap[0][0] == time:
+            due.append(heapq.heappop(heap)[1])
+        assert sorted(wheel.advance_to(time)) == due
+        # reschedule some, the way periodic timers are
+        for item in due[:min(2, reschedules)]:
+            reschedules -= 1
+            later = time + rng.randint(1, 700)
+            wheel.schedule(later, item)
+            heapq.heappush(heap, (later, item))
+        assert len(wheel) == len(heap)
+    assert wheel.next_expiry() is None
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from IDSpace import IDSpace
+from Workload import Workload
+
+@pytest.mark.parametrize('count', [0, 10, 600, 1024])
+def test_unique_keys(count):
+    space = IDSpace(10)
+    keys  = Workload(space, 1).unique_keys(count)
+    assert len(keys) == count
+    assert len(np.unique(keys)) == count
+    assert ((keys >= 0) & (keys < space.size)).all()
+
+def test_unique_keys_too_many():
+    with pytest.raises(ValueError):
+        Workload(IDSpace(10), 1).unique_keys(1025)
+
+def test_same_seed_same_workload():
+    first, second = Workload(IDSpace(16), 7), Workload(IDSpace(16), 7)
+    keys = first.unique_keys(500)
+    assert (keys == second.unique_keys(500)).all()
+    for popularity in ('uniform', 'zipf', 'hotspot'):
+        queries = first.queries(keys, 200, popularity)
+        assert (queries == second.queries(keys, 200, popularity)).all()
+        assert np.isin(queries, keys).all()